@@ -0,0 +1,225 @@
+"""
+Generate a model described by a YAML or JSON config without writing any Python:
+
+    lab-grown-sheets model.yml --output sample-data --format parquet --scale-factor 10 --workers 8
+
+The config is either a list of entities or a dict of model options (seed, scale_factor, memory_budget,
+spill_path, output, format, compression, workers) plus an entities list - flags win over the config. Entities are
+[profiler type, args] pairs as StarSchemaModel.from_list takes, or args dicts with a type key:
+
+    seed: 1
+    entities:
+      - type: naive
+        name: customer
+        num_iterations: 100
+        entity_generator: examples.normalised_example.generate_customer
+
+Callables (entity_generator, num_entities_per_iteration, a custom distribution's func) are given by dotted path.
+"""
+
+import os
+import sys
+import json
+import gzip
+import time
+import shutil
+import argparse
+import importlib
+import multiprocessing
+import tempfile
+
+import yaml
+
+from labgrownsheets.model import StarSchemaModel
+from labgrownsheets.model.cdc import CDC_FILE_NAME
+from labgrownsheets.model.distributed import Coordinator, Worker, DEFAULT_SHARD_SIZE
+
+CALLABLE_KEYS = ('entity_generator', 'num_entities_per_iteration', 'func')
+FORMATS = ('csv', 'json', 'parquet', 'cdc')
+MODEL_OPTIONS = ('seed', 'scale_factor', 'memory_budget', 'spill_path')
+TEXT_CODECS = ('gzip', 'none')
+PARQUET_CODECS = ('snappy', 'gzip', 'brotli', 'zstd', 'lz4', 'none')
+
+
+def import_callable(path):
+    module_name, _, attr = path.rpartition('.')
+    if not module_name:
+        raise ValueError("'{}' isn't a dotted path to a callable".format(path))
+    try:
+        obj = getattr(importlib.import_module(module_name), attr)
+    except (ImportError, AttributeError) as e:
+        raise ValueError("Unable to import '{}': {}".format(path, e))
+    if not callable(obj):
+        raise ValueError("'{}' isn't callable".format(path))
+    return obj
+
+
+def resolve_callables(val):
+    if isinstance(val, dict):
+        return {k: import_callable(v) if k in CALLABLE_KEYS and isinstance(v, str) else resolve_callables(v)
+                for k, v in val.items()}
+    if isinstance(val, list):
+        return [resolve_callables(v) for v in val]
+    return val
+
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f) if path.endswith('.json') else yaml.safe_load(f)
+    if isinstance(config, list):
+        config = {'entities': config}
+    if not isinstance(config, dict) or not config.get('entities'):
+        raise ValueError("Config {} has no entities".format(path))
+    return config
+
+
+def entity_list(config):
+    entities = []
+    for entity in resolve_callables(config['entities']):
+        if isinstance(entity, dict):
+            entity = dict(entity)
+            entities.append((entity.pop('type', 'naive'), entity))
+        else:
+            entities.append(tuple(entity))
+    return entities
+
+
+def build_model(config, **options):
+    """ The model of a loaded config, with options not None taking precedence over the config's """
+    kwargs = {k: config[k] for k in MODEL_OPTIONS if config.get(k) is not None}
+    kwargs.update({k: v for k, v in options.items() if v is not None})
+    return StarSchemaModel.from_list(entity_list(config), **kwargs)
+
+
+##################################################################
+# Generation and output
+##################################################################
+
+def run_worker(model, shared_dir):
+    Worker(model, shared_dir).run()
+
+
+def generate(model, workers=1, shard_size=DEFAULT_SHARD_SIZE, print_progress=False):
+    """ In process, or sharded over forked worker processes coordinated through a temporary directory
+
+    Shards are collected within the model's memory budget, spilling to its spill_path like in process runs.
+    """
+    if workers <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        return model.generate_all_datasets(print_progress)
+
+    StarSchemaModel.create_path(model.spill_path)
+    shared_dir = tempfile.mkdtemp(prefix="labgrownsheets-", dir=model.spill_path)
+    try:
+        coordinator = Coordinator(model, shared_dir, shard_size, model.seed)
+        coordinator.create_manifest()
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=run_worker, args=(model, shared_dir)) for _ in range(workers)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        failed = [p.exitcode for p in processes if p.exitcode]
+        if failed or not coordinator.is_complete():
+            raise RuntimeError("Worker processes failed with exit codes {}".format(failed))
+        return coordinator.collect()
+    finally:
+        shutil.rmtree(shared_dir, ignore_errors=True)
+
+
+def gzip_files(paths):
+    """ Compress the files given in place, as name.gz """
+    for src in paths:
+        with open(src, 'rb') as f_in, gzip.open(src + '.gz', 'wb') as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.remove(src)
+
+
+def check_output(file_type, compression):
+    # Checked before generating, so a typo doesn't cost a whole run
+    if file_type not in FORMATS:
+        raise ValueError("Unknown format " + file_type)
+    codecs = PARQUET_CODECS if file_type == 'parquet' else TEXT_CODECS
+    if compression is not None and compression not in codecs:
+        raise ValueError("{} output can't be compressed with {} - use one of {}".format(
+            file_type, compression, ", ".join(codecs)))
+
+
+def export(model, path, file_type, compression=None):
+    check_output(file_type, compression)
+    if file_type == 'parquet':
+        model.to_parquet(path, compression=compression or 'snappy')
+        return
+    if file_type == 'csv':
+        paths = model.to_csv(path)
+    elif file_type == 'json':
+        paths = model.to_json(path)
+    else:
+        model.to_cdc(path)
+        paths = [os.path.join(path, CDC_FILE_NAME + '.jsonl')]
+    if compression == 'gzip':
+        gzip_files(paths)  # Only what this export wrote - the output directory may hold anything else
+
+
+def summary(model, timings):
+    lines = []
+    for name, dataset in model.datasets.items():
+        lines.append("{:<30}{:>12,} ids{:>14,} rows".format(name, len(dataset),
+                                                            sum(len(rows) for rows in dataset.values())))
+    total = sum(sum(len(rows) for rows in dataset.values()) for dataset in model.datasets.values())
+    for step, seconds in timings:
+        rate = " ({:,.0f} rows/s)".format(total / seconds) if seconds and step == 'generate' else ""
+        lines.append("{:<30}{:>10.2f}s{}".format(step, seconds, rate))
+    lines.append("{:<30}{:>10.2f}s".format('total', sum(seconds for _, seconds in timings)))
+    return "\n".join(lines)
+
+
+##################################################################
+# Entry point
+##################################################################
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='lab-grown-sheets', description="Generate a model from a config file")
+    parser.add_argument('config', help="YAML or JSON model config")
+    parser.add_argument('-o', '--output', help="Directory to write to (default: config's output, else .)")
+    parser.add_argument('-f', '--format', choices=FORMATS, help="Output format (default csv)")
+    parser.add_argument('-c', '--compression', help="gzip for csv/json/cdc, a parquet codec for parquet")
+    parser.add_argument('-s', '--seed', type=int)
+    parser.add_argument('--scale-factor', type=float)
+    parser.add_argument('-w', '--workers', type=int, help="Worker processes to generate shards with")
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE, help="Iterations per worker shard")
+    parser.add_argument('--memory-budget', help="e.g. 2GB - larger tables spill to disk")
+    parser.add_argument('--spill-path', help="Directory for spilled tables and worker shards")
+    parser.add_argument('-q', '--quiet', action='store_true', help="No progress or timing summary")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config)
+    file_type = args.format or config.get('format') or 'csv'
+    compression = args.compression or config.get('compression')
+    check_output(file_type, compression)
+    timings = []
+
+    start = time.time()
+    model = build_model(config, seed=args.seed, scale_factor=args.scale_factor, memory_budget=args.memory_budget,
+                        spill_path=args.spill_path)
+    timings.append(('load', time.time() - start))
+
+    start = time.time()
+    workers = args.workers or config.get('workers') or 1
+    generate(model, workers, args.shard_size, print_progress=not args.quiet)
+    timings.append(('generate', time.time() - start))
+
+    start = time.time()
+    output = args.output or config.get('output') or '.'
+    export(model, output, file_type, compression)
+    timings.append(('export', time.time() - start))
+
+    if not args.quiet:
+        print(summary(model, timings))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,8 @@
 from labgrownsheets.model.model import StarSchemaModel
 from labgrownsheets.model.schema_adapter import BigquerySchemaAdapter, PostgresSchemaAdapter
+from labgrownsheets.model.partition import DatePartition, HashPartition
+from labgrownsheets.model.pipeline import Pipeline, CsvSink, JsonLinesSink, SocketSink
+from labgrownsheets.model.server import ModelServer, ModelClient
 
-__all__ = ['StarSchemaModel', 'BigquerySchemaAdapter', 'PostgresSchemaAdapter']
+__all__ = ['StarSchemaModel', 'BigquerySchemaAdapter', 'PostgresSchemaAdapter', 'Pipeline', 'CsvSink',
+           'JsonLinesSink', 'SocketSink', 'DatePartition', 'HashPartition', 'ModelServer', 'ModelClient']
@@ -0,0 +1,112 @@
+"""
+SCD Type 2 history as a time ordered stream of change events, e.g. to test streaming ingestion:
+
+    {"op": "insert", "ts": ..., "entity": "customer", "id": "1f3a...", "before": null, "after": {...}}
+    {"op": "update", "ts": ..., "entity": "customer", "id": "1f3a...", "before": {...}, "after": {...}}
+
+The first version of an id is its insert and every later version an update of the one before, timed by
+valid_from_timestamp. The versions of an id are already in time order, so each id is a sorted run and the
+stream is a k-way heap merge of the runs - nothing is sorted as a whole. With more than max_ids ids the merge
+becomes an external sort: groups of max_ids ids are merged into sorted run files, which are merged in turn.
+"""
+
+import os
+import json
+import heapq
+import pickle
+import shutil
+import tempfile
+from itertools import islice
+from operator import itemgetter
+
+from labgrownsheets.model.columnar import import_pyarrow
+
+VALID_FROM = 'valid_from_timestamp'
+DEFAULT_MAX_IDS = 100000
+PARQUET_BATCH = 10000
+CDC_FILE_NAME = 'changes'
+event_time = itemgetter('ts')
+
+
+def id_events(entity_name, uid, rows):
+    before = None
+    for row in rows:
+        yield {'op': 'insert' if before is None else 'update', 'ts': row[VALID_FROM], 'entity': entity_name, 'id': uid,
+               'before': before, 'after': row}
+        before = row
+
+
+def merge_runs(runs):
+    return heapq.merge(*runs, key=event_time)
+
+
+def write_run(events, path):
+    with open(path, 'wb') as f:
+        for event in events:  # A pickle each, as a shared memo would keep every row alive
+            pickle.dump(event, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_run(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def change_events(datasets, max_ids=DEFAULT_MAX_IDS, tmp_dir=None):
+    """ Events of every {entity_name: {id: [version, ...]}} dataset in datasets, in time order """
+    runs = ((name, uid, rows) for name, dataset in datasets.items() for uid, rows in dataset.items())
+    if sum(len(dataset) for dataset in datasets.values()) <= max_ids:
+        yield from merge_runs(id_events(*run) for run in runs)
+        return
+
+    path = tempfile.mkdtemp(prefix="labgrownsheets-cdc-", dir=tmp_dir)
+    try:
+        files = []
+        while True:
+            group = list(islice(runs, max_ids))
+            if not group:
+                break
+            files.append(os.path.join(path, "run-{:05d}.pkl".format(len(files))))
+            write_run(merge_runs(id_events(*run) for run in group), files[-1])
+        yield from merge_runs(read_run(f) for f in files)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def write_json_lines(events, path, default=None):
+    count = 0
+    with open(path, 'w', buffering=1024 * 1024) as f:
+        for event in events:
+            f.write(json.dumps(event, default=default))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def write_parquet(events, path, default=None, compression='snappy'):
+    """ Row groups of PARQUET_BATCH events - before and after images are JSON, as entities differ in columns """
+    pa = import_pyarrow()
+    import pyarrow.parquet
+
+    schema = pa.schema([('op', pa.dictionary(pa.int8(), pa.string())), ('ts', pa.timestamp('us')),
+                        ('entity', pa.dictionary(pa.int32(), pa.string())), ('id', pa.string()),
+                        ('before', pa.string()), ('after', pa.string())])
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema, compression=compression) as writer:
+        while True:
+            batch = list(islice(events, PARQUET_BATCH))
+            if not batch:
+                return count
+            columns = {
+                'op': [e['op'] for e in batch],
+                'ts': [e['ts'] for e in batch],
+                'entity': [e['entity'] for e in batch],
+                'id': [e['id'] for e in batch],
+                'before': [None if e['before'] is None else json.dumps(e['before'], default=default) for e in batch],
+                'after': [json.dumps(e['after'], default=default) for e in batch]
+            }
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            count += len(batch)
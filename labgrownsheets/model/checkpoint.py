@@ -0,0 +1,137 @@
+"""
+Checkpoints of a generate_all_datasets run, so a crashed or pre-empted run can resume where it stopped:
+
+    path/state.pkl                       where every entity got to, random states and profiler context states
+    path/<entity>/chunk-NNNNN.pkl        the {id: [row, ...]} rows and iteration offsets added since the previous
+                                         checkpoint, and the entity's statistics as they were at this one
+
+A checkpoint is taken when an entity finishes, and every `every` iterations of entities whose profiler state
+is plain data (supports_random_access). Checkpoints fall on iteration boundaries - the random states (the
+model's own and the random and numpy modules) and the profiler context state are saved there, so a resumed run
+produces exactly the rows an uninterrupted run would have. Generator backed entities restart from their first
+iteration instead, as what a generator yields can depend on random state from when it was last resumed.
+
+Row chunks are written before the state that refers to them, and every file is replaced atomically, so a crash
+at any point leaves the last complete checkpoint readable. Only new rows and offsets are written, and statistics
+are of bounded size, so each checkpoint costs the same however far the run has got.
+"""
+
+import os
+import pickle
+import random
+import shutil
+from array import array
+from itertools import islice
+
+import numpy
+
+from labgrownsheets.model.distributed import write_atomic
+
+STATE_NAME = "state.pkl"
+DEFAULT_CHECKPOINT_EVERY = 100000
+
+
+class EntityProgress:
+    """ Everything needed to carry on generating an entity from a checkpoint """
+
+    def __init__(self, iteration, rows, chunks, context, rng, one_to_ones=None, block_offsets=None, offsets=0,
+                 done=False):
+        self.iteration = iteration  # Iterations generated so far
+        self.rows = rows  # Ids written to chunks
+        self.chunks = chunks
+        self.context = context  # profiler context state()
+        self.rng = rng  # State of the model's random.Random, None when it was the random module
+        self.one_to_ones = one_to_ones  # Unique parent ids left in the current block, None between blocks
+        self.block_offsets = block_offsets or []
+        self.offsets = offsets  # Iteration offsets written to chunks
+        self.done = done
+
+    def restore_random(self, rng):
+        if self.rng is not None:
+            rng.setstate(self.rng)
+        return rng
+
+
+class Checkpoint:
+
+    def __init__(self, path, fingerprint, every=DEFAULT_CHECKPOINT_EVERY):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.every = max(int(every), 1)
+        self.entities = {}
+        self.random_state = None
+
+    @property
+    def state_path(self):
+        return os.path.join(self.path, STATE_NAME)
+
+    def chunk_path(self, entity_name, chunk):
+        return os.path.join(self.path, entity_name, "chunk-{:05d}.pkl".format(chunk))
+
+    def start(self):
+        """ Begin a new run, dropping any earlier checkpoint """
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        os.makedirs(self.path)
+        self.entities = {}
+        self.write_state()  # Unseeded runs resume from the random state they started with
+
+    def load(self):
+        """ Pick up the last checkpoint - False if there isn't one """
+        if not os.path.exists(self.state_path):
+            return False
+        with open(self.state_path, "rb") as f:
+            state = pickle.load(f)
+        if state['fingerprint'] != self.fingerprint:
+            raise ValueError("Checkpoint in {} was taken from a different model or settings".format(self.path))
+        self.entities = state['entities']
+        self.random_state = state['random']
+        return True
+
+    def progress(self, entity_name):
+        return self.entities.get(entity_name)
+
+    def restore(self, entity_name, iteration_offsets=None, statistics=None):
+        """ The rows, iteration offsets and statistics of an entity saved so far
+
+        iteration_offsets and statistics are the empty ones to start from, None if the model doesn't keep them.
+        """
+        ents = {}
+        progress = self.entities.get(entity_name)
+        for chunk in range(progress.chunks if progress else 0):
+            with open(self.chunk_path(entity_name, chunk), "rb") as f:
+                saved = pickle.load(f)
+            ents.update(saved['rows'])
+            if iteration_offsets is not None:
+                iteration_offsets.extend(saved['iteration_offsets'])
+            if saved['statistics'] is not None:
+                statistics = saved['statistics']
+        return ents, iteration_offsets, statistics
+
+    def save(self, entity_name, ents, iteration, context, rng, one_to_ones=None, statistics=None,
+             block_offsets=None, iteration_offsets=None, done=False):
+        previous = self.entities.get(entity_name)
+        rows, offsets, chunks = (previous.rows, previous.offsets, previous.chunks) if previous else (0, 0, 0)
+        num_offsets = offsets if iteration_offsets is None else len(iteration_offsets)
+        if len(ents) > rows or num_offsets > offsets:  # Ids and offsets are only appended, so only new ones are written
+            os.makedirs(os.path.join(self.path, entity_name), exist_ok=True)
+            chunk = {'rows': dict(islice(ents.items(), rows, None)),
+                     'iteration_offsets': array('q', iteration_offsets[offsets:]) if num_offsets > offsets else None,
+                     'statistics': statistics}
+            write_atomic(self.chunk_path(entity_name, chunks), pickle.dumps(chunk, protocol=pickle.HIGHEST_PROTOCOL))
+            rows, offsets, chunks = len(ents), num_offsets, chunks + 1
+
+        self.entities[entity_name] = EntityProgress(iteration, rows, chunks, context.state(),
+                                                    None if rng is random else rng.getstate(), one_to_ones,
+                                                    list(block_offsets or []), offsets, done)
+        self.write_state()
+
+    def write_state(self):
+        self.random_state = (random.getstate(), numpy.random.get_state())
+        state = {'fingerprint': self.fingerprint, 'entities': self.entities, 'random': self.random_state}
+        write_atomic(self.state_path, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def restore_globals(self):
+        if self.random_state is not None:
+            random.setstate(self.random_state[0])
+            numpy.random.set_state(self.random_state[1])
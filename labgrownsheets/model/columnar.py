@@ -0,0 +1,290 @@
+"""
+Column oriented copies of generated entities.
+
+Each column is one numpy buffer allocated at its final size and type: declared schema dtypes are used as given,
+other columns get the type the column statistics saw. Nullable columns carry a boolean mask alongside the
+buffer, and categorical columns are stored as int32 codes into a dictionary of their distinct values.
+
+Declared categorical columns, denormalised parent columns and low cardinality string columns (judged from the
+statistics' distinct count) are dictionary encoded. Columns of other values (lists, dicts, mixed types) are kept
+as python objects. The encoding is kept in memory by ColumnarDataset and in
+Arrow/Parquet output - only row based output (csv, json) decodes it.
+
+Values are cast to a column's declared dtype, with a ValueError naming the column if one can't be. Undeclared
+integer columns too wide for int64 are kept as python objects (strings in Arrow). Timezone aware timestamps are
+stored as UTC and come back aware - a column can't mix aware and naive ones.
+"""
+
+import datetime
+from collections.abc import Mapping
+
+import numpy
+
+from labgrownsheets.model.statistics import TableStatistics
+from labgrownsheets.relations.schema import DType
+
+NULL_CODE = -1
+NULL_FILLS = {
+    DType.INT64: 0,
+    DType.FLOAT64: numpy.nan,
+    DType.TIMESTAMP: numpy.datetime64('NaT'),
+    DType.BOOL: False
+}
+CATEGORICAL_RATIO = 0.2  # String columns with at most this many distinct values per row are encoded
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def import_optional(module, purpose):
+    try:
+        return __import__(module)
+    except ImportError:
+        raise ImportError("{} is needed for {} - pip install {}".format(module, purpose, module))
+
+
+def import_pyarrow():
+    return import_optional('pyarrow', "Arrow and Parquet output")
+
+
+def inferred_dtype(stats):
+    """ The dtype of an undeclared column from its statistics """
+    dtype = DType.from_python_type(stats.python_type)
+    if dtype is DType.STRING and not stats.types <= {str}:  # Not strings, or a mix of types
+        return DType.OBJECT
+    if dtype is DType.INT64 and stats.min is not None and (stats.min < INT64_MIN or stats.max > INT64_MAX):
+        return DType.OBJECT
+    return dtype
+
+
+def as_strings(values):
+    return (v if v is None or isinstance(v, str) else str(v) for v in values)
+
+
+def utc_timestamps(column, values):
+    """ values with timezone aware datetimes moved to naive UTC, and whether there were any """
+    values = list(values)
+    aware = {isinstance(v, datetime.datetime) and v.utcoffset() is not None for v in values if v is not None}
+    if aware == {True, False}:
+        raise ValueError("Column {} mixes timezone aware and naive timestamps".format(column))
+    if aware != {True}:
+        return values, False
+    return [v if v is None else v.astimezone(datetime.timezone.utc).replace(tzinfo=None) for v in values], True
+
+
+def object_array(values):
+    """ A pyarrow array of python objects - as strings if pyarrow can't find one type for them """
+    pa = import_pyarrow()
+    values = values.tolist()
+    try:
+        return pa.array(values, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def encode_categorical(values, num_rows):
+    """ int32 codes in order of first appearance plus the dictionary they index, with None as NULL_CODE """
+    index = {}
+    codes = numpy.fromiter((NULL_CODE if v is None else index.setdefault(v, len(index)) for v in values),
+                           'int32', count=num_rows)
+    categories = numpy.empty(len(index), dtype=object)
+    categories[:] = list(index)
+    return codes, categories
+
+
+class ColumnarTable:
+
+    def __init__(self, name, columns, dtypes, masks=None, categories=None, ids=None, offsets=None, timezones=None):
+        self.name = name
+        self.columns = columns
+        self.dtypes = dtypes
+        self.masks = masks or {}
+        self.categories = categories or {}
+        self.timezones = timezones or {}  # Timestamp columns stored as naive UTC from aware values
+        self.ids = ids  # Rows offsets[i]:offsets[i + 1] belong to ids[i]
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, item):
+        return self.column(item)
+
+    @property
+    def column_names(self):
+        return list(self.columns)
+
+    @property
+    def nbytes(self):
+        return (sum(buf.nbytes for buf in self.columns.values()) + sum(m.nbytes for m in self.masks.values()) +
+                sum(c.nbytes for c in self.categories.values()))
+
+    def project(self, columns):
+        """ A table of just columns, in that order - buffers are shared, not copied """
+        keep = [name for name in columns if name in self.columns]
+        return ColumnarTable(self.name, {k: self.columns[k] for k in keep}, {k: self.dtypes[k] for k in keep},
+                             {k: self.masks[k] for k in keep if k in self.masks},
+                             {k: self.categories[k] for k in keep if k in self.categories}, self.ids, self.offsets,
+                             {k: self.timezones[k] for k in keep if k in self.timezones})
+
+    def column(self, name, start=0, stop=None):
+        """ The values of a column - categorical codes are decoded, nulls are None only in object columns """
+        buf = self.columns[name][start:stop]
+        if name in self.categories:
+            values = numpy.empty(len(buf), dtype=object)
+            valid = buf != NULL_CODE
+            values[valid] = self.categories[name][buf[valid]]
+            return values
+        return buf
+
+    def to_rows(self, start=0, stop=None):
+        """ Decoded rows as dicts of python values """
+        names = self.column_names
+        columns = []
+        for name in names:
+            values = self.column(name, start, stop).tolist()
+            if name in self.masks:
+                values = [None if null else v for v, null in zip(values, self.masks[name][start:stop].tolist())]
+            if name in self.timezones:
+                values = [v if v is None else v.replace(tzinfo=datetime.timezone.utc) for v in values]
+            columns.append(values)
+        for values in zip(*columns):
+            yield dict(zip(names, values))
+
+    def to_arrow(self):
+        """ A pyarrow Table - categorical columns become dictionary arrays sharing one dictionary """
+        pa = import_pyarrow()
+        arrays = []
+        for name in self.column_names:
+            buf, mask = self.columns[name], self.masks.get(name)
+            if name in self.categories:
+                indices = pa.array(buf, mask=buf == NULL_CODE)
+                arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(self.categories[name],
+                                                                                 type=pa.string())))
+            elif self.dtypes[name] in (DType.STRING, DType.CATEGORICAL):
+                arrays.append(pa.array(buf, type=pa.string(), from_pandas=True))
+            elif self.dtypes[name] is DType.OBJECT:
+                arrays.append(object_array(buf))
+            elif name in self.timezones:
+                arrays.append(pa.array(buf, mask=mask, type=pa.timestamp('us', tz=self.timezones[name])))
+            else:
+                arrays.append(pa.array(buf, mask=mask))
+        return pa.Table.from_arrays(arrays, names=self.column_names)
+
+    def to_pandas(self):
+        """ A DataFrame over the column buffers - numeric buffers are shared rather than copied """
+        pd = import_optional('pandas', "DataFrame output")
+        data = {}
+        for name in self.column_names:
+            buf, mask = self.columns[name], self.masks.get(name)
+            if name in self.categories:
+                data[name] = pd.Categorical.from_codes(buf, self.categories[name])
+            elif mask is not None and self.dtypes[name] is DType.INT64:
+                data[name] = pd.arrays.IntegerArray(buf, mask)
+            elif mask is not None and self.dtypes[name] is DType.BOOL:
+                data[name] = pd.arrays.BooleanArray(buf, mask)
+            elif name in self.timezones:
+                data[name] = pd.DatetimeIndex(buf).tz_localize(self.timezones[name])
+            else:  # Float and timestamp nulls are already NaN/NaT
+                data[name] = buf
+        return pd.DataFrame(data, copy=False)
+
+    def to_polars(self):
+        """ A polars DataFrame, handed over through Arrow """
+        pl = import_optional('polars', "polars output")
+        return pl.from_arrow(self.to_arrow())
+
+    @classmethod
+    def from_dataset(cls, name, dataset, schema=None, statistics=None, only=None):
+        """ Build a table from an {id: [row, ...]} dataset in one pass per column
+
+        statistics gives the row count, column types and cardinalities up front - built with an extra scan if
+        not given. only limits the table to those columns. Raises ValueError if a column's values can't be
+        stored as its dtype.
+        """
+        statistics = statistics or TableStatistics.from_dataset(dataset)
+        declared = schema.dtypes if schema else {}
+        denormalised = {f.name for f in schema.fields if f.parent_entity} if schema else set()
+        num_rows = statistics.rows
+
+        columns, dtypes, masks, categories, timezones = {}, {}, {}, {}, {}
+        for col, stats in statistics.columns.items():
+            if only is not None and col not in only:
+                continue
+            dtype = declared.get(col) or inferred_dtype(stats)
+            if dtype is DType.STRING and col not in declared and (
+                    col in denormalised or stats.approx_distinct <= CATEGORICAL_RATIO * num_rows):
+                dtype = DType.CATEGORICAL
+            values = (row.get(col) for rows in dataset.values() for row in rows)
+            if dtype in (DType.STRING, DType.CATEGORICAL) and not stats.types <= {str}:
+                values = as_strings(values)
+            elif dtype is DType.TIMESTAMP and datetime.datetime in stats.types:
+                values, aware = utc_timestamps(col, values)
+                if aware:
+                    timezones[col] = 'UTC'
+            if dtype is DType.CATEGORICAL:
+                columns[col], categories[col] = encode_categorical(values, num_rows)
+            else:
+                if stats.nulls and dtype in NULL_FILLS:
+                    values = list(values)
+                    masks[col] = numpy.fromiter((v is None for v in values), 'bool', count=num_rows)
+                    fill = NULL_FILLS[dtype]
+                    values = (fill if v is None else v for v in values)
+                try:
+                    columns[col] = numpy.fromiter(values, dtype.numpy_dtype, count=num_rows)
+                except OverflowError:
+                    raise ValueError("Column {} of {} has integers too wide for {}".format(col, name, dtype.value))
+                except (TypeError, ValueError) as e:
+                    raise ValueError("Column {} of {} can't be stored as {}: {}".format(col, name, dtype.value, e))
+            dtypes[col] = dtype
+
+        ids = numpy.empty(len(dataset), dtype=object)
+        ids[:] = list(dataset.keys())
+        offsets = numpy.zeros(len(dataset) + 1, dtype='int64')
+        numpy.cumsum(numpy.fromiter((len(rows) for rows in dataset.values()), 'int64', count=len(dataset)),
+                     out=offsets[1:])
+        return cls(name, columns, dtypes, masks, categories, ids, offsets, timezones)
+
+
+class ColumnarDataset(Mapping):
+    """ A read only {id: [row, ...]} view of a ColumnarTable, so compacted entities can still be used as parents
+
+    Rows are decoded when looked up, so only the encoded columns are held in memory.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self._positions = None
+
+    @property
+    def positions(self):
+        if self._positions is None:
+            self._positions = {uid: i for i, uid in enumerate(self.table.ids.tolist())}
+        return self._positions
+
+    def __getitem__(self, uid):
+        i = self.positions[uid]
+        return list(self.table.to_rows(self.table.offsets[i], self.table.offsets[i + 1]))
+
+    def __iter__(self):
+        return iter(self.table.ids.tolist())
+
+    def __len__(self):
+        return len(self.table.ids)
+
+    def __contains__(self, uid):
+        return uid in self.positions
+
+    @property
+    def nbytes(self):
+        return self.table.nbytes + self.table.ids.nbytes + self.table.offsets.nbytes
+
+    def project(self, columns):
+        columns = set(columns)
+        return ColumnarDataset(self.table.project([name for name in self.table.column_names if name in columns]))
+
+    def values(self):  # Decode in one pass rather than per id
+        rows = self.table.to_rows()
+        for count in numpy.diff(self.table.offsets).tolist():
+            yield [next(rows) for i in range(count)]
+
+    def items(self):
+        return zip(self, self.values())
@@ -0,0 +1,317 @@
+"""
+Multi-node generation coordinated purely through files in a shared directory:
+
+    shared_dir/manifest.json                  shards with seeds and parent entity dependencies
+    shared_dir/claims/<shard>.<attempt>.claim created atomically (O_EXCL) by the worker generating a shard
+    shared_dir/parts/<entity>/part-NNNNN.pkl  the {id: [row, ...]} output of a shard
+    shared_dir/done/<shard>.done              written once the part file is in place
+
+Every node builds the same StarSchemaModel in code (profilers hold callables, so they aren't shipped around),
+the coordinator writes the manifest once, and any number of workers claim shards whose parents are complete.
+Each shard is generated with a fresh profiler context, so generator backed profilers restart per shard. Ids are
+counter based (see StarSchemaModel.counter_uid) from the shard's iterations, so no two shards share one - up to
+2^16 entities per iteration. collect still refuses to merge shards that repeat an id.
+
+A claim is a lease, kept alive by its worker touching the claim file while generating. Once it goes a lease
+without a touch (the worker died) the next attempt can be claimed by another worker - only one worker can create
+it. Workers keep polling until every shard is done, so the survivors pick up after a dead one. Leases go by file
+modification times, so the nodes' clocks should roughly agree. A slow worker that outlives its lease writes the
+same part as its successor, so the late write is harmless.
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import pickle
+import threading
+
+import networkx
+
+from labgrownsheets.model.seeding import derive_seed
+from labgrownsheets.model.store import DatasetStore
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_SHARD_SIZE = 10000
+DEFAULT_POLL_INTERVAL = 0.1
+DEFAULT_LEASE = 60.0  # Seconds a claim lasts without a heartbeat
+
+
+class Shard:
+    def __init__(self, entity, index, start, num_iterations, seed, depends_on):
+        self.entity = entity
+        self.index = index
+        self.start = start
+        self.num_iterations = num_iterations
+        self.seed = seed
+        self.depends_on = depends_on
+
+    @property
+    def name(self):
+        return "{}-{:05d}".format(self.entity, self.index)
+
+    def to_dict(self):
+        return {'entity': self.entity,
+                'index': self.index,
+                'start': self.start,
+                'num_iterations': self.num_iterations,
+                'seed': self.seed,
+                'depends_on': self.depends_on}
+
+    @staticmethod
+    def from_dict(d):
+        return Shard(d['entity'], d['index'], d['start'], d['num_iterations'], d['seed'], d['depends_on'])
+
+
+class ShardManifest:
+    def __init__(self, shards, seed):
+        self.shards = shards
+        self.seed = seed
+
+    @classmethod
+    def from_model(cls, model, shard_size=DEFAULT_SHARD_SIZE, seed=None):
+        if seed is None:
+            seed = random.getrandbits(63)
+        if not model.dag:
+            model.dag = model.generate_dag()
+
+        shards = []
+        for entity in networkx.topological_sort(model.dag):
+            depends_on = [rel.name for rel in entity.relations]
+            num_iterations = model.num_iterations_for(entity)
+            for index, start in enumerate(range(0, num_iterations, shard_size)):
+                num_its = min(shard_size, num_iterations - start)
+                shards.append(Shard(entity.name, index, start, num_its, derive_seed(seed, entity.name, index),
+                                    depends_on))
+        return cls(shards, seed)
+
+    def shards_for(self, entity_name):
+        return [s for s in self.shards if s.entity == entity_name]
+
+    def to_dict(self):
+        return {'seed': self.seed, 'shards': [s.to_dict() for s in self.shards]}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls([Shard.from_dict(s) for s in d['shards']], d['seed'])
+
+    def write(self, shared_dir):
+        write_atomic(os.path.join(shared_dir, MANIFEST_NAME), json.dumps(self.to_dict(), indent=2).encode())
+
+    @classmethod
+    def load(cls, shared_dir):
+        with open(os.path.join(shared_dir, MANIFEST_NAME), "r") as f:
+            return cls.from_dict(json.load(f))
+
+
+def write_atomic(path, data):
+    tmp = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class SharedDirectory:
+    """ Paths and markers shared by the coordinator and workers """
+
+    def __init__(self, path, lease=DEFAULT_LEASE):
+        self.path = path
+        self.lease = lease
+        for sub in ['claims', 'parts', 'done']:
+            os.makedirs(os.path.join(path, sub), exist_ok=True)
+
+    def claim_path(self, shard, attempt=0):
+        return os.path.join(self.path, 'claims', "{}.{}.claim".format(shard.name, attempt))
+
+    def done_path(self, shard):
+        return os.path.join(self.path, 'done', shard.name + ".done")
+
+    def part_path(self, shard):
+        return os.path.join(self.path, 'parts', shard.entity, "part-{:05d}.pkl".format(shard.index))
+
+    def claims(self):
+        """ {shard name: latest claim attempt} """
+        latest = {}
+        for file_name in os.listdir(os.path.join(self.path, 'claims')):
+            name, attempt, _ = file_name.rsplit('.', 2)
+            latest[name] = max(latest.get(name, 0), int(attempt))
+        return latest
+
+    def is_stale(self, shard, attempt):
+        try:
+            return time.time() - os.stat(self.claim_path(shard, attempt)).st_mtime > self.lease
+        except FileNotFoundError:
+            return True
+
+    def is_claimed(self, shard):
+        attempt = self.claims().get(shard.name)
+        return attempt is not None and not self.is_stale(shard, attempt)
+
+    def is_done(self, shard):
+        return os.path.exists(self.done_path(shard))
+
+    def claim(self, shard, worker_id, attempt=0):
+        try:
+            fd = os.open(self.claim_path(shard, attempt), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(worker_id)
+        return True
+
+    def renew(self, shard, attempt):
+        os.utime(self.claim_path(shard, attempt))
+
+    def write_part(self, shard, dataset):
+        os.makedirs(os.path.dirname(self.part_path(shard)), exist_ok=True)
+        write_atomic(self.part_path(shard), pickle.dumps(dataset, protocol=pickle.HIGHEST_PROTOCOL))
+        write_atomic(self.done_path(shard), b"")
+
+    def read_entity(self, manifest, entity_name):
+        dataset = {}
+        for shard in manifest.shards_for(entity_name):
+            with open(self.part_path(shard), "rb") as f:
+                part = pickle.load(f)
+            if not dataset.keys().isdisjoint(part):  # Would silently replace the rows of another shard
+                duplicate = next(uid for uid in part if uid in dataset)
+                raise ValueError("Shard {} repeats id {} of an earlier {} shard".format(shard.name, duplicate,
+                                                                                      entity_name))
+            dataset.update(part)
+        return dataset
+
+
+class Coordinator:
+
+    def __init__(self, model, shared_dir, shard_size=DEFAULT_SHARD_SIZE, seed=None, lease=DEFAULT_LEASE):
+        self.model = model
+        self.shared = SharedDirectory(shared_dir, lease)
+        self.shard_size = shard_size
+        self.seed = seed
+        self.manifest = None
+
+    def create_manifest(self):
+        self.manifest = ShardManifest.from_model(self.model, self.shard_size, self.seed)
+        self.manifest.write(self.shared.path)
+        return self.manifest
+
+    def is_complete(self):
+        return all(self.shared.is_done(s) for s in self.manifest.shards)
+
+    def wait(self, timeout=None, poll_interval=DEFAULT_POLL_INTERVAL):
+        # Shards of dead workers are taken over by the live ones, but with no worker left this waits for timeout
+        start = time.time()
+        while not self.is_complete():
+            if timeout is not None and time.time() - start > timeout:
+                raise TimeoutError("Shards still outstanding after {}s".format(timeout))
+            time.sleep(poll_interval)
+
+    def collect(self):
+        """ Load every part file into the model's datasets so the usual exporters can be used
+
+        With a memory budget tables spill to disk as they're loaded, as they would generating in process.
+        """
+        manifest = self.manifest or ShardManifest.load(self.shared.path)
+        model = self.model
+        model.dag = model.dag or model.generate_dag()
+        datasets = DatasetStore(model.spill_path) if model.memory_budget else {}
+        done = set()
+        for entity in networkx.topological_sort(model.dag):
+            datasets[entity.name] = self.shared.read_entity(manifest, entity.name)
+            done.add(entity)
+            if model.memory_budget:
+                model.enforce_memory_budget(datasets, done)
+        model.datasets = datasets
+        model.statistics = {}  # Built from the collected data on first use
+        model.iteration_offsets = {}  # Shards don't keep them, so validate tells iterations apart by parents
+        return datasets
+
+
+class Worker:
+
+    def __init__(self, model, shared_dir, worker_id=None, poll_interval=DEFAULT_POLL_INTERVAL, timeout=None,
+                 lease=DEFAULT_LEASE):
+        self.model = model
+        self.shared = SharedDirectory(shared_dir, lease)
+        self.worker_id = worker_id or "{}-{}".format(os.getpid(), uuid.uuid4().hex[:8])
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.manifest = None
+        self._parents = {}
+
+    def is_ready(self, shard):
+        return all(self.shared.is_done(s) for dep in shard.depends_on for s in self.manifest.shards_for(dep))
+
+    def claim_next(self, pending):
+        """ (shard, attempt) of a ready shard this worker claimed - unclaimed or with a stale claim - else None """
+        claims = self.shared.claims()
+        for shard in pending:
+            attempt = claims.get(shard.name)
+            if attempt is not None and not self.shared.is_stale(shard, attempt):
+                continue
+            attempt = 0 if attempt is None else attempt + 1
+            if self.is_ready(shard) and self.shared.claim(shard, self.worker_id, attempt):
+                return shard, attempt
+        return None
+
+    def run(self):
+        """ Claim and generate shards until every shard is done - returns the number generated """
+        self.manifest = ShardManifest.load(self.shared.path)
+        if not self.model.dag:
+            self.model.dag = self.model.generate_dag()
+
+        generated = 0
+        waiting_since = time.time()
+        while True:
+            pending = [s for s in self.manifest.shards if not self.shared.is_done(s)]
+            if not pending:
+                return generated
+
+            claimed = self.claim_next(pending)
+            if claimed:
+                self.generate_shard(*claimed)
+                generated += 1
+                waiting_since = time.time()
+            elif self.timeout is not None and time.time() - waiting_since > self.timeout:
+                raise TimeoutError("Worker {} waited {}s for shards to claim".format(self.worker_id, self.timeout))
+            else:
+                time.sleep(self.poll_interval)
+
+    def parent_datasets(self, shard):
+        for dep in shard.depends_on:
+            if dep not in self._parents:
+                self._parents[dep] = self.shared.read_entity(self.manifest, dep)
+        return {dep: self._parents[dep] for dep in shard.depends_on}
+
+    def unique_ids(self, shard, entity, datasets):
+        # Each shard takes its own slice of one shared permutation, so unique relations hold across shards
+        unique_ids = {}
+        for rel in entity.one_to_many_relations:
+            if rel.unique:
+                rng = random.Random(derive_seed(self.manifest.seed, entity.name, rel.name))
+                ids = rng.sample(list(datasets[rel.name].keys()), self.model.num_iterations_for(entity))
+                unique_ids[rel.name] = ids[shard.start:shard.start + shard.num_iterations]
+        return unique_ids
+
+    def heartbeat(self, shard, attempt, stop):
+        while not stop.wait(self.shared.lease / 4):
+            self.shared.renew(shard, attempt)
+
+    def generate_shard(self, shard, attempt=0):
+        # The claim is renewed in the background for as long as the shard takes
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=self.heartbeat, args=(shard, attempt, stop), daemon=True)
+        heartbeat.start()
+        try:
+            entity = self.model.entity_dict[shard.entity]
+            datasets = self.parent_datasets(shard)
+
+            # Ids come from (iteration, fact) under one key per entity, so they're unique across shards
+            shard_ids = (derive_seed(self.manifest.seed, entity.name, 'ids'), shard.start)
+            dataset = self.model.generate_entity_data(entity, datasets, shard.num_iterations, False,
+                                                      self.unique_ids(shard, entity, datasets), seed=shard.seed,
+                                                      shard_ids=shard_ids)
+            self.shared.write_part(shard, dataset)
+        finally:
+            stop.set()
+            heartbeat.join()
@@ -3,16 +3,31 @@ import csv
 import json
 import pickle
 import random
-import uuid
+import itertools
+import functools
+from array import array
 from typing import Dict
 from datetime import datetime, date
 
+import numpy
 import networkx
 
+from labgrownsheets.model.cdc import change_events, write_json_lines, write_parquet, DEFAULT_MAX_IDS, CDC_FILE_NAME
+from labgrownsheets.model.checkpoint import Checkpoint, DEFAULT_CHECKPOINT_EVERY
+from labgrownsheets.model.columnar import ColumnarTable, ColumnarDataset, import_pyarrow, inferred_dtype
+from labgrownsheets.model.partition import PartitionedWriter, resolve_partitions, DEFAULT_MAX_OPEN_FILES
+from labgrownsheets.model.planner import plan_model, parse_bytes, DEFAULT_SAMPLE_SIZE
+from labgrownsheets.model.seeding import derive_seed, seed_globals
+from labgrownsheets.model.statistics import TableStatistics
+from labgrownsheets.model.store import DatasetStore
+from labgrownsheets.model.subset import subset_datasets
+from labgrownsheets.model.validation import Validator
+from labgrownsheets.model.variants import generate_variants
 from labgrownsheets.profilers import resolve_profiler
 from labgrownsheets.profilers.base_profiler import BaseProfiler
 
 NUM_DOTS = 20
+UID_MASK = 2 ** 48 - 1
 
 
 def json_serial(obj):
@@ -29,12 +44,39 @@ class StarSchemaModel:
     # Init and props
     ##################################################################
 
-    def __init__(self, entity_list):
+    def __init__(self, entity_list, memory_budget=None, spill_path=None, seed=None, scale_factor=1,
+                 counter_based=False, collect_statistics=True, dictionary_encode=False, checkpoint_path=None,
+                 checkpoint_every=DEFAULT_CHECKPOINT_EVERY, columns=None):
         self.entity_dict: Dict[BaseProfiler] = {
             entity.name: entity for entity in entity_list
         }
         self.dag = None
         self.datasets = None
+        self.memory_budget = parse_bytes(memory_budget)
+        self.spill_path = spill_path
+        self.seed = seed
+        self.scale_factor = scale_factor
+        self.block_offsets = {}
+        self.iteration_offsets = {}  # Id offset of every iteration, for entities validate checks unique relations of
+        self.contexts = {}  # Profiler state of the last full generation, so grow can carry on from it
+        self.counter_based = counter_based
+        self.collect_statistics = collect_statistics  # Else statistics_for scans for them when first asked for
+        self.dictionary_encode = dictionary_encode  # Keep finished entities as encoded columns, see compact
+        self.statistics: Dict[str, TableStatistics] = {}
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every  # Iterations of an entity between checkpoints
+        self.columns = columns  # {entity_name: columns} to generate and export, other entities are left whole
+        self.generated_columns = None  # required_columns of the last generate_all_datasets, so grow matches it
+
+        if counter_based and seed is None:
+            raise ValueError("Counter based generation needs a seed")
+
+    def num_iterations_for(self, entity, scale_factor=None):
+        # num_iterations is the size of the entity at scale factor 1 - fixed size entities never scale
+        scale_factor = self.scale_factor if scale_factor is None else scale_factor
+        if entity.fixed_size:
+            return entity.num_iterations
+        return int(round(entity.num_iterations * scale_factor))
 
     def add_entity(self, entity):
         # FIXME(): Add in smarts to only regenerate related entities
@@ -42,9 +84,9 @@ class StarSchemaModel:
         self.dag = None
 
     @classmethod
-    def from_list(cls, l):
+    def from_list(cls, l, **kwargs):
         # This is a list of tuples = (profiler type, values)
-        return StarSchemaModel([resolve_profiler(val[0], val[1]) for val in l])
+        return StarSchemaModel([resolve_profiler(val[0], val[1]) for val in l], **kwargs)
 
     ##################################################################
     # DAG Handling
@@ -68,105 +110,566 @@ class StarSchemaModel:
 
         return dag
 
-    def generate_all_datasets(self, print_progress=False):
+    def required_columns(self, columns=None):
+        """ {entity_name: columns to generate} for a selection, else the model's - entities not in it are left out
+
+        Selected entities also keep their ids, foreign keys, SCD validity columns and whatever their profiler reads
+        (e.g. an event rate_column), plus whatever children left in the selection still copy (denormalised fields)
+        or sample by (distribution weights) from them.
+        """
+        columns = self.columns if columns is None else columns
+        if not columns:
+            return {}
+        if not self.dag:
+            self.dag = self.generate_dag()
+        required = {}
+        for entity in reversed(list(networkx.topological_sort(self.dag))):
+            if entity.name not in columns:
+                continue
+            cols = set(columns[entity.name]) | {self.entity_dict[rel.name].id for rel in entity.relations}
+            if entity.preserve_id_across_its:
+                cols |= {'valid_from_timestamp', 'valid_to_timestamp'}
+            cols |= entity.required_columns()
+            required[entity.name] = cols | self.columns_needed_by_children(entity, self.dag.successors(entity),
+                                                                           required)
+        return required
+
+    def checkpoint_fingerprint(self, columns=None):
+        # A checkpoint only resumes a run of the same model with the same settings
+        return {'seed': self.seed, 'scale_factor': self.scale_factor, 'counter_based': self.counter_based,
+                'entities': sorted((e.name, e.num_iterations) for e in self.entity_dict.values()),
+                'columns': self.required_columns(columns)}
+
+    def generate_all_datasets(self, print_progress=False, on_row=None, resume=False, columns=None, retain=True):
+        """ Generate every entity in dependency order - on_row(entity_name, row) is called for each new row
+
+        columns ({entity_name: columns}, else the model's columns) limits what is generated for the entities in
+        it, see required_columns. Profilers are told through their context, and anything else they return is
+        dropped. Selected values are the same as in a full run, except where a profiler acts on the hint. The
+        argument only applies to this run (and grow extending it) - the model's columns, which exports default
+        to, are left as they are.
+
+        With a checkpoint_path, progress is checkpointed after every checkpoint_every iterations and every
+        finished entity (see model.checkpoint). resume=True carries on from the last checkpoint instead of
+        starting over - rows from before it are loaded rather than passed to on_row again.
+
+        retain=False is for callers only after on_row - every table is dropped once its children are generated, so
+        at most a parent and its children are held at a time and datasets ends up empty.
+        """
         if not self.dag:
             self.dag = self.generate_dag()
+        required = self.generated_columns = self.required_columns(columns)
 
-        datasets = {}
+        datasets = DatasetStore(self.spill_path) if self.memory_budget else {}
         max_name_length = len(max(self.entity_dict.keys(), key=len))
 
+        checkpoint = None
+        if self.checkpoint_path:
+            checkpoint = Checkpoint(self.checkpoint_path, self.checkpoint_fingerprint(columns), self.checkpoint_every)
+            if not (resume and checkpoint.load()):
+                checkpoint.start()
+
+        self.block_offsets = {}
+        self.iteration_offsets = {}
+        self.contexts = {}
+        self.statistics = {}
+        done = set()
         for entity in networkx.topological_sort(self.dag):
             if print_progress:
                 print("Generating entity {}{}  ".format(entity.name, ' ' * (max_name_length - len(entity.name))),
                       end="", flush=True)
-            datasets[entity.name] = self.generate_entity_data(entity, datasets, entity.num_iterations, print_progress)
+            progress = checkpoint and checkpoint.progress(entity.name)
+            num_iterations = self.num_iterations_for(entity)
+            if progress:  # Carry on from the checkpoint
+                self.block_offsets[entity.name] = list(progress.block_offsets)
+                self.contexts[entity.name] = entity.restore_context(progress.context)
+                statistics = TableStatistics() if self.collect_statistics else None
+                ents, self.iteration_offsets[entity.name], statistics = checkpoint.restore(
+                    entity.name, self.new_iteration_offsets(entity), statistics)
+                if statistics is not None:
+                    self.statistics[entity.name] = statistics
+                start = progress.iteration
+            else:
+                self.block_offsets[entity.name] = []
+                self.iteration_offsets[entity.name] = self.new_iteration_offsets(entity)
+                self.contexts[entity.name] = entity.new_context()
+                if self.collect_statistics:
+                    self.statistics[entity.name] = TableStatistics()
+                ents, start = None, 0
+                if checkpoint:  # Random state as the last finished entity left it
+                    checkpoint.restore_globals()
+
+            if progress and progress.done:
+                datasets[entity.name] = ents
+            else:
+                datasets[entity.name] = self.generate_entity_data(entity, datasets, num_iterations - start,
+                                                                  print_progress, seed=self.seed, start=start,
+                                                                  block_size=entity.num_iterations, ents=ents,
+                                                                  block_offsets=self.block_offsets[entity.name],
+                                                                  iteration_offsets=self.iteration_offsets[entity.name],
+                                                                  context=self.contexts[entity.name],
+                                                                  statistics=self.statistics.get(entity.name),
+                                                                  on_row=on_row and functools.partial(on_row,
+                                                                                                      entity.name),
+                                                                  checkpoint=checkpoint, resume=progress,
+                                                                  columns=required.get(entity.name))
+                if checkpoint:
+                    checkpoint.save(entity.name, datasets[entity.name], num_iterations, self.contexts[entity.name],
+                                    random, statistics=self.statistics.get(entity.name),
+                                    block_offsets=self.block_offsets[entity.name],
+                                    iteration_offsets=self.iteration_offsets[entity.name], done=True)
+            if self.dictionary_encode:
+                datasets[entity.name] = self.compacted(entity.name, datasets[entity.name])
+            done.add(entity)
+            if not retain:
+                for finished in [e for e in done if e.name in datasets and set(self.dag.successors(e)) <= done]:
+                    del datasets[finished.name]
+            if self.memory_budget:
+                self.enforce_memory_budget(datasets, done)
 
         self.datasets = datasets
 
+    def generate_entities(self, names, datasets, print_progress=False):
+        """ Generate just the named entities into datasets, in dependency order, as generate_all_datasets would
+
+        Their parents must already be in datasets, with block_offsets for any that are split into blocks.
+        """
+        if not self.dag:
+            self.dag = self.generate_dag()
+        required = self.required_columns()
+        for entity in networkx.topological_sort(self.dag):
+            if entity.name not in names:
+                continue
+            self.block_offsets[entity.name] = []
+            self.iteration_offsets[entity.name] = self.new_iteration_offsets(entity)
+            self.contexts[entity.name] = entity.new_context()
+            if self.collect_statistics:
+                self.statistics[entity.name] = TableStatistics()
+            datasets[entity.name] = self.generate_entity_data(entity, datasets, self.num_iterations_for(entity),
+                                                              print_progress, seed=self.seed,
+                                                              block_size=entity.num_iterations,
+                                                              block_offsets=self.block_offsets[entity.name],
+                                                              iteration_offsets=self.iteration_offsets[entity.name],
+                                                              context=self.contexts[entity.name],
+                                                              statistics=self.statistics.get(entity.name),
+                                                              columns=required.get(entity.name))
+            if self.dictionary_encode:
+                datasets[entity.name] = self.compacted(entity.name, datasets[entity.name])
+        return datasets
+
+    def variants(self, overrides, workers=None):
+        """ {variant name: generated model} for variants of this model - see model.variants """
+        return generate_variants(self, overrides, workers)
+
+    def resume(self, print_progress=False, on_row=None, columns=None):
+        """ Carry on generate_all_datasets from the last checkpoint in checkpoint_path, or start if there is none """
+        if not self.checkpoint_path:
+            raise ValueError("Resuming needs a checkpoint_path")
+        self.generate_all_datasets(print_progress, on_row, resume=True, columns=columns)
+
+    def grow(self, scale_factor, print_progress=False):
+        """ Extend generated datasets to a larger scale factor, generating only the extra blocks
+
+        With a seed the result matches generating at scale_factor from scratch, except that generator backed
+        profilers continue from wherever they stopped. A partially generated last block is regenerated in full.
+        """
+        if scale_factor < self.scale_factor:
+            raise ValueError("Cannot grow from scale factor {} to {}".format(self.scale_factor, scale_factor))
+        required = self.required_columns() if self.generated_columns is None else self.generated_columns
+
+        for entity in networkx.topological_sort(self.dag):
+            block_size = entity.num_iterations
+            start = self.num_iterations_for(entity) // block_size * block_size  # Start of first incomplete block
+            num_iterations = self.num_iterations_for(entity, scale_factor) - start
+            if num_iterations <= 0:
+                continue
+
+            offsets = self.block_offsets.get(entity.name, [0])
+            keep = offsets[start // block_size] if start // block_size < len(offsets) else None
+            dataset = self.datasets[entity.name]
+            if not isinstance(dataset, dict):  # Compacted or spilled - rows are added below
+                dataset = dict(dataset.items())
+            if keep is not None and keep < len(dataset):
+                dataset = dict(itertools.islice(dataset.items(), keep))
+                if entity.name in self.statistics:  # Can't take rows back out of the statistics
+                    self.statistics[entity.name] = TableStatistics.from_dataset(dataset)
+            self.block_offsets[entity.name] = offsets[:start // block_size]
+            iteration_offsets = self.iteration_offsets.get(entity.name)
+            if iteration_offsets is not None:
+                iteration_offsets = self.iteration_offsets[entity.name] = iteration_offsets[:start]
+            self.datasets[entity.name] = self.generate_entity_data(entity, self.datasets, num_iterations,
+                                                                   print_progress, seed=self.seed, start=start,
+                                                                   block_size=block_size, ents=dataset,
+                                                                   block_offsets=self.block_offsets[entity.name],
+                                                                   iteration_offsets=iteration_offsets,
+                                                                   context=self.contexts.get(entity.name),
+                                                                   statistics=self.statistics.get(entity.name),
+                                                                   columns=required.get(entity.name))
+            if self.dictionary_encode:
+                self.datasets[entity.name] = self.compacted(entity.name, self.datasets[entity.name])
+        self.scale_factor = scale_factor
+
+    def subset(self, root_entity, fraction=None, keys=None, seed=None):
+        """ A new model holding a referentially closed slice of the generated data - see model.subset
+
+        Either a fraction of the root entity's ids is sampled (seeded by seed, else the model's seed) or the
+        given keys are used. The slice keeps every descendant row of those ids and the parent rows they need.
+        """
+        datasets = subset_datasets(self, root_entity, fraction, keys, self.seed if seed is None else seed)
+        model = StarSchemaModel(list(self.entity_dict.values()), seed=self.seed)
+        model.dag = self.dag or self.generate_dag()
+        model.datasets = datasets
+        return model
+
+    def validate(self):
+        """ Check foreign keys, unique relations, primary keys and SCD validity ranges - see model.validation """
+        return Validator(self).run()
+
+    def plan(self, sample_size=DEFAULT_SAMPLE_SIZE, memory_budget=None):
+        """ Estimate rows, memory and runtime per entity from a short calibration run - see planner.plan_model """
+        return plan_model(self, sample_size, memory_budget or self.memory_budget)
+
+    def explain(self, sample_size=DEFAULT_SAMPLE_SIZE, memory_budget=None):
+        plan = self.plan(sample_size, memory_budget)
+        print(plan)
+        return plan
+
     def yield_entities(self, print_progress=False, **kwargs):
         if not self.dag:
-            self.generate_dag()
+            self.dag = self.generate_dag()
 
         new_entities = {}
         for entity_name, number_iterations in kwargs.items():
             new_entities[entity_name] = self.generate_entity_data(self.entity_dict[entity_name], self.datasets,
-                                                                  number_iterations, print_progress)
+                                                                  number_iterations, print_progress,
+                                                                  columns=self.required_columns().get(entity_name))
+        return new_entities
+
+    def statistics_for(self, entity_name):
+        """ Column statistics of a generated entity - collected during generation, or built by one scan """
+        if entity_name not in self.statistics:
+            self.statistics[entity_name] = TableStatistics.from_dataset(self.datasets[entity_name])
+        return self.statistics[entity_name]
+
+    def column_dtypes(self, entity_name):
+        """ Declared schema dtypes, falling back to the type the column statistics saw """
+        declared = self.entity_dict[entity_name].schema.dtypes if entity_name in self.entity_dict else {}
+        return {col: declared.get(col) or inferred_dtype(stats)
+                for col, stats in self.statistics_for(entity_name).columns.items()}
+
+    def to_columnar(self, entity_name=None, columns=None):
+        """ A ColumnarTable of one entity, or {name: table} for every generated entity - columns limits it """
+        if entity_name is None:
+            return {name: self.to_columnar(name, columns) for name in self.datasets}
+        dataset = self.datasets[entity_name]
+        if isinstance(dataset, ColumnarDataset):
+            return dataset.table if columns is None else dataset.table.project(columns)
+        schema = self.entity_dict[entity_name].schema if entity_name in self.entity_dict else None
+        return ColumnarTable.from_dataset(entity_name, dataset, schema, self.statistics_for(entity_name), columns)
+
+    def to_arrow(self, entity_name=None):
+        """ A pyarrow Table of one entity, or {name: table} for every entity - types come from the schema """
+        if entity_name is None:
+            return {name: self.to_arrow(name) for name in self.datasets}
+        return self.to_columnar(entity_name).to_arrow()
+
+    def to_pandas(self, entity_name=None):
+        """ A pandas DataFrame of one entity, or {name: frame} - sharing the columnar buffers where possible """
+        if entity_name is None:
+            return {name: self.to_pandas(name) for name in self.datasets}
+        return self.to_columnar(entity_name).to_pandas()
+
+    def to_polars(self, entity_name=None):
+        """ A polars DataFrame of one entity, or {name: frame} """
+        if entity_name is None:
+            return {name: self.to_polars(name) for name in self.datasets}
+        return self.to_columnar(entity_name).to_polars()
+
+    def compacted(self, entity_name, dataset):
+        schema = self.entity_dict[entity_name].schema
+        statistics = self.statistics.get(entity_name) or TableStatistics.from_dataset(dataset)
+        return ColumnarDataset(ColumnarTable.from_dataset(entity_name, dataset, schema, statistics))
+
+    def compact(self, entity_names=None):
+        """ Swap generated rows for dictionary encoded columns, decoded again only when rows are read
+
+        Low cardinality and denormalised string columns shrink to int32 codes - much smaller than a python
+        dict per row. Compacted entities can still be exported, grown and used as parents.
+        """
+        for name in entity_names or list(self.datasets):
+            if not isinstance(self.datasets[name], ColumnarDataset):
+                self.datasets[name] = self.compacted(name, self.datasets[name])
+
+    ##################################################################
+    # Memory budget
+    ##################################################################
+
+    def columns_needed_by_children(self, entity, pending, required=None):
+        # required optionally limits children to the columns they generate, see required_columns
+        cols = {entity.id}
+        for child in pending:
+            fields = {str(f) for f in child.schema.get_fields_for_parent(entity.name)}
+            cols |= fields & required[child.name] if required and child.name in required else fields
+            for rel in child.relations:
+                if rel.name == entity.name and rel.distribution and rel.distribution.column:
+                    cols.add(rel.distribution.column)
+        return cols
+
+    def enforce_memory_budget(self, datasets, done):
+        """ Spill finished tables once their children are done, then slim down parents still in use """
+        for entity in done:  # Projections are only for children - the full table is already on disk
+            if datasets.is_projected(entity.name) and set(self.dag.successors(entity)) <= done:
+                datasets.spill(entity.name)
+
+        if datasets.memory_usage <= self.memory_budget:
+            return
+
+        in_memory = sorted((e for e in done if datasets.in_memory(e.name)),
+                           key=lambda e: datasets.size(e.name), reverse=True)
+        consumed = [e for e in in_memory if set(self.dag.successors(e)) <= done]
+        for entity in consumed:
+            datasets.spill(entity.name)
+            if datasets.memory_usage <= self.memory_budget:
+                return
+
+        for entity in in_memory:
+            if entity in consumed:
+                continue
+            pending = [c for c in self.dag.successors(entity) if c not in done]
+            datasets.spill(entity.name, self.columns_needed_by_children(entity, pending))
+            if datasets.memory_usage <= self.memory_budget:
+                return
 
     ##################################################################
     # Create Entities
     ##################################################################
 
     def apply_schema_types_to_row(self, row_dict, schema):
-        for field in schema.fields:
+        # Fields with only a declared dtype aren't touched - they're cast a column at a time by ColumnarTable
+        for field in schema.converted_fields:
             if field.name in row_dict:
                 row_dict[field.name] = field.type(row_dict[field.name])
         return row_dict
 
-    def get_de_normalised_data_points(self, entity, parent, parent_dataset):
+    def get_de_normalised_data_points(self, entity, parent, parent_dataset, rng=random, columns=None):
         # Get denormalised points - note that for scd this will pick randomly
         parent_fields = entity.schema.get_fields_for_parent(parent)
-        parent_data = {str(f): random.choice(parent_dataset)[str(f)] for f in parent_fields}
+        if columns is None:
+            return {str(f): rng.choice(parent_dataset)[str(f)] for f in parent_fields}
+        parent_data = {}
+        for f in parent_fields:
+            i = rng.randrange(len(parent_dataset))  # The draw choice makes, so kept values match a full run
+            if str(f) in columns:
+                parent_data[str(f)] = parent_dataset[i][str(f)]
         return parent_data
 
-    def generate_entity_data(self, entity, datasets, num_iterations, print_progress):
-        milestones = [int(i * num_iterations / NUM_DOTS) for i in range(1, NUM_DOTS + 1)]
-
-        ents = {}
-        relation_id_lists = {rel.name: list(datasets[rel.name].keys()) for rel in entity.relations}
-
-        one_to_ones = {}
-        for relation in entity.one_to_many_relations:  # Same per fact per instance, but uniquely sampled
-            if relation.unique:
-                one_to_ones[relation.name] = random.sample(relation_id_lists[relation.name], num_iterations)
-
-        for i in range(num_iterations):
-            for mile in milestones:
-                if mile == i and print_progress:
-                    print(".".format(entity.name), end="", flush=True)
-
-            base = {}
-            for relation in entity.one_to_many_relations:  # These will be the same per fact per instance
-                if relation.unique:
-                    rel_id = one_to_ones[relation.name][i]
-                else:
-                    rel_id = random.sample(relation_id_lists[relation.name], 1)[0]  # Not unique
-                rel_id_name = self.entity_dict[relation.name].id
-                base[rel_id_name] = rel_id
-                base.update(self.get_de_normalised_data_points(entity, relation.name, datasets[relation.name][rel_id]))
-
-            num_facts = entity.num_entities_per_iteration
-            many_to_many_ids = {}
-            for rel in entity.many_to_many_relations:  # These will be the same per fact
-                if rel.unique:
-                    many_to_many_ids[rel.name] = random.sample(relation_id_lists[rel.name], num_facts)
-                else:
-                    many_to_many_ids[rel.name] = [random.sample(relation_id_lists[rel.name], 1)[0]
-                                                  for i in range(num_facts)]
-            uid = None
-            for j in range(num_facts):
-                if not (uid and entity.preserve_id_across_its):  # Only make once if SCD Type 2
-                    while True:  # Get a unique id for this instance
-                        uid = str(uuid.uuid4())[-12:]  # 36 ** 12 is max num entities...
-                        if uid not in ents:
-                            ents[uid] = []
-                            break
-                inst = {entity.id: uid}
-                inst.update(base)
-
-                for rel in entity.many_to_many_relations:
-                    rel_id = many_to_many_ids[rel.name].pop(0)
-                    rel_id_name = self.entity_dict[rel.name].id
-                    inst[rel_id_name] = rel_id
-                    inst.update(self.get_de_normalised_data_points(entity, rel.name, datasets[rel.name][rel_id]))
-
-                inst.update(entity.generate_entity(datasets, **inst))
-                inst = self.apply_schema_types_to_row(inst, entity.schema)
-                ents[uid].append(inst)
+    @staticmethod
+    def new_iteration_offsets(entity):
+        # Only unique relations need iterations told apart, so other entities don't pay for them
+        return array('q') if any(rel.unique for rel in entity.relations) else None
+
+    def block_random(self, entity, block, seed):
+        """ Random state for one block - the global modules unless seeded, so unseeded runs behave as before """
+        if seed is None:
+            return random
+        seed_globals(derive_seed(seed, entity.name, block, 'globals'))
+        return random.Random(derive_seed(seed, entity.name, block))
+
+    def parent_pool(self, parent_name, ids, block):
+        # Block b of a child links to block b of its parent, or the parent's last block for fixed size parents
+        offsets = self.block_offsets.get(parent_name)
+        if not offsets or len(offsets) == 1 or offsets[-1] >= len(ids):
+            return ids
+        block = min(block, len(offsets) - 1)
+        end = offsets[block + 1] if block + 1 < len(offsets) else len(ids)
+        return ids[offsets[block]:end]
+
+    def iteration_random(self, entity, iteration, seed):
+        """ Counter based random state for one iteration, computable without generating any other iteration
+
+        A Philox generator keyed by (seed, entity) with the iteration as its counter seeds the global modules and
+        the model's own draws, so profilers written against random and numpy need no changes.
+        """
+        bit_gen = numpy.random.Philox(key=derive_seed(seed, entity.name), counter=[0, iteration, 0, 0])
+        global_seed, model_seed = numpy.random.Generator(bit_gen).integers(0, 2 ** 63, 2).tolist()
+        seed_globals(global_seed)
+        return random.Random(model_seed)
+
+    @staticmethod
+    def counter_uid(key, iteration, fact):
+        # A keyed bijection on 48 bits, so ids are unique without checking them against earlier rows
+        if fact >= 2 ** 16 or iteration >= 2 ** 32:
+            raise ValueError("Counter based ids support up to 2^32 iterations of 2^16 entities")
+        x = ((iteration << 16) | fact) ^ (key & UID_MASK)
+        x = (x * 0x9E3779B97F4B) & UID_MASK
+        x ^= x >> 23
+        x = (x * 0xC2B2AE3D27D5) & UID_MASK
+        x ^= x >> 29
+        return "%012x" % x
+
+    def generate_entity_data(self, entity, datasets, num_iterations, print_progress, unique_ids=None, seed=None,
+                             start=0, block_size=None, ents=None, block_offsets=None, iteration_offsets=None,
+                             context=None, statistics=None, on_row=None, checkpoint=None, resume=None, columns=None,
+                             shard_ids=None):
+        """ Generate num_iterations iterations of an entity, starting at iteration start
+
+        Iterations are grouped into blocks of block_size (a single block if not given), and the id offset of each
+        block generated from its start is appended to block_offsets, and that of every iteration to
+        iteration_offsets if given. With a seed every block draws from its own
+        seeded random state, and block b only links to block b of its parents, so a block is identical however
+        many blocks are generated. In counter based mode every iteration draws from its own random state instead.
+
+        unique_ids optionally maps unique one_to_many relations to the parent ids to use, e.g. when sharding.
+        Rows are added to ents if given, otherwise to a new dict. Profiler state lives in context, a fresh one
+        from entity.new_context() unless given, so concurrent calls on the same entity don't interfere. Every
+        row is also added to statistics and passed to on_row if given.
+
+        With a checkpoint, progress is saved every checkpoint.every iterations of entities that support random
+        access. resume is the EntityProgress of the checkpoint being resumed, whose random states are restored
+        where it left off. columns limits the columns generated, see required_columns.
+
+        shard_ids is an optional (id key, first iteration) pair giving counter based ids, as counter_uid makes
+        them, so shards generated apart with the same key and disjoint iterations never share an id.
+        """
+        end = start + num_iterations
+        milestones = [start + int(i * num_iterations / NUM_DOTS) for i in range(1, NUM_DOTS + 1)]
+        block_size = block_size or max(end, 1)
+        counter_based = self.counter_based and seed is not None
+        if counter_based:
+            if not entity.supports_random_access:
+                raise ValueError("Entity '{}' keeps state between iterations so cannot be generated in counter "
+                                 "based mode".format(entity.name))
+            uid_key = derive_seed(seed, entity.name, 'ids')
+        id_offset = 0
+        if shard_ids is not None:
+            uid_key, id_offset = shard_ids
+
+        ents = {} if ents is None else ents
+        context = context or entity.new_context()
+        context.project(columns)
+        parents = {rel.name: datasets[rel.name] for rel in entity.relations}  # Looked up once in case of spills
+        relation_id_lists = {rel.name: list(parents[rel.name].keys()) for rel in entity.relations}
+
+        if resume is not None:  # Left as they were at the checkpoint, seeded blocks reseed them anyway
+            checkpoint.restore_globals()
+
+        block_start = start
+        while block_start < end:
+            block = block_start // block_size
+            block_end = min((block + 1) * block_size, end)
+            if block_offsets is not None and block_start == block * block_size:
+                block_offsets.append(len(ents))
+
+            rng = self.block_random(entity, block, seed)
+            pools = {rel.name: self.parent_pool(rel.name, relation_id_lists[rel.name], block)
+                     for rel in entity.relations}
+            samplers = {rel.name: rel.compile_sampler(pools[rel.name], parents[rel.name])
+                        for rel in entity.relations if not rel.unique}  # Compiled once per parent block
+
+            one_to_ones = {}
+            for relation in entity.one_to_many_relations:  # Same per fact per instance, but uniquely sampled
+                if relation.unique and unique_ids and relation.name in unique_ids:
+                    one_to_ones[relation.name] = unique_ids[relation.name][block_start - start:]
+                elif relation.unique and counter_based:  # Indexed by position in the block, not by draw order
+                    pool = pools[relation.name]
+                    perm = random.Random(derive_seed(seed, entity.name, relation.name, block)).sample(pool, len(pool))
+                    one_to_ones[relation.name] = perm[block_start - block * block_size:]
+                elif relation.unique:
+                    one_to_ones[relation.name] = rng.sample(pools[relation.name], block_end - block_start)
+
+            if resume is not None and resume.one_to_ones is not None:  # Resuming part way through this block
+                checkpoint.restore_globals()
+                rng = resume.restore_random(rng)
+                one_to_ones = resume.one_to_ones
+            resume = None
+
+            for i in range(block_end - block_start):
+                iteration = block_start + i
+                for mile in milestones:
+                    if mile == iteration and print_progress:
+                        print(".".format(entity.name), end="", flush=True)
+                if iteration_offsets is not None:
+                    iteration_offsets.append(len(ents))
+                if counter_based:
+                    rng = self.iteration_random(entity, iteration, seed)
+                    context = entity.new_context()  # Nothing may carry over between iterations
+                    context.project(columns)
+
+                base = {}
+                for relation in entity.one_to_many_relations:  # These will be the same per fact per instance
+                    if relation.unique:
+                        rel_id = one_to_ones[relation.name][i]
+                    else:
+                        rel_id = samplers[relation.name](rng)  # Not unique
+                    rel_id_name = self.entity_dict[relation.name].id
+                    base[rel_id_name] = rel_id
+                    base.update(self.get_de_normalised_data_points(entity, relation.name,
+                                                                   parents[relation.name][rel_id], rng, columns))
+
+                num_facts = context.num_entities_per_iteration(base)
+                many_to_many_ids = {}
+                for rel in entity.many_to_many_relations:  # These will be the same per fact
+                    if rel.unique:
+                        many_to_many_ids[rel.name] = rng.sample(pools[rel.name], num_facts)
+                    else:
+                        many_to_many_ids[rel.name] = [samplers[rel.name](rng) for i in range(num_facts)]
+                uid = None
+                for j in range(num_facts):
+                    if (counter_based or shard_ids) and not (uid and entity.preserve_id_across_its):
+                        uid = self.counter_uid(uid_key, id_offset + iteration, j)
+                        ents[uid] = []
+                    elif not (uid and entity.preserve_id_across_its):  # Only make once if SCD Type 2
+                        while True:  # Get a unique id for this instance
+                            uid = "%012x" % rng.getrandbits(48)  # 16 ** 12 is max num entities...
+                            if uid not in ents:
+                                ents[uid] = []
+                                break
+                    inst = {entity.id: uid}
+                    inst.update(base)
+
+                    for rel in entity.many_to_many_relations:
+                        rel_id = many_to_many_ids[rel.name].pop(0)
+                        rel_id_name = self.entity_dict[rel.name].id
+                        inst[rel_id_name] = rel_id
+                        inst.update(self.get_de_normalised_data_points(entity, rel.name, parents[rel.name][rel_id],
+                                                                       rng, columns))
+
+                    generated = entity.generate(context, datasets, **inst)
+                    if columns is not None:
+                        generated = {k: v for k, v in generated.items() if k in columns}
+                    inst.update(generated)
+                    inst = self.apply_schema_types_to_row(inst, entity.schema)
+                    if statistics is not None:
+                        statistics.update(inst)
+                    if on_row is not None:
+                        on_row(inst)
+                    ents[uid].append(inst)
+
+                if (checkpoint is not None and entity.supports_random_access and
+                        (iteration + 1) % checkpoint.every == 0 and iteration + 1 < end):
+                    mid_block = i + 1 < block_end - block_start
+                    checkpoint.save(entity.name, ents, iteration + 1, context, rng,
+                                    {k: v[i + 1:] for k, v in one_to_ones.items()} if mid_block else None,
+                                    statistics, block_offsets, iteration_offsets)
+
+            block_start = block_end
 
         if print_progress:
             print(" DONE")
         return ents
 
+    def generate_range(self, entity_name, start, stop):
+        """ Generate iterations [start, stop) of an entity on their own - needs counter_based mode and a seed
+
+        Parents are taken from datasets, so generate them first. The result matches the same iterations of a full
+        generate_all_datasets run.
+        """
+        if not (self.counter_based and self.seed is not None):
+            raise ValueError("Random access generation needs a seeded, counter based model")
+        entity = self.entity_dict[entity_name]
+        return self.generate_entity_data(entity, self.datasets, stop - start, False, seed=self.seed, start=start,
+                                         block_size=entity.num_iterations)
+
     ##################################################################
     # Save File
     ##################################################################
@@ -175,36 +678,129 @@ class StarSchemaModel:
         if path and not os.path.exists(path):
             os.makedirs(path)
 
-    def to_csv(self, path=''):
+    def export_columns(self, entity_name, columns=None):
+        """ The columns to export for an entity, None for all - columns defaults to the model's selection """
+        columns = self.columns if columns is None else columns
+        if not columns or entity_name not in columns:
+            return None
+        return list(columns[entity_name])
+
+    def partition_specs(self, partition_by, entity_name):
+        # Columns are checked against the declared fields and the first row, so unpartitioned exports never scan
+        if not partition_by:
+            return []
+        dataset = self.datasets[entity_name]
+        if isinstance(dataset, ColumnarDataset):
+            return resolve_partitions(partition_by, entity_name, set(dataset.table.column_names))
+        entity = self.entity_dict.get(entity_name)
+        columns = {f.name for f in entity.schema.fields} if entity is not None else set()
+        first = next(iter(dataset.values()), None)
+        if first:
+            columns |= set(first[0])
+        return resolve_partitions(partition_by, entity_name, columns)
+
+    def to_csv(self, path='', partition_by=None, max_open_files=DEFAULT_MAX_OPEN_FILES, columns=None):
+        """ One csv per table, or table/<key>=<value>/part-N.csv files for tables matching partition_by
+
+        partition_by is a DatePartition/HashPartition (or dict), a list of them, or {entity_name: specs}.
+        columns ({entity_name: columns}) limits the columns written, see export_columns. Returns the files written.
+        """
         self.create_path(path)
 
+        paths = []
         for name, uids in self.datasets.items():
-            with open(os.path.join(path, name + ".csv"), "w+") as f:
+            cols = self.export_columns(name, columns)
+            specs = self.partition_specs(partition_by, name)
+            if specs:
+                paths += self.to_partitions(path, name, specs, 'csv', max_open_files, cols)
+                continue
+            paths.append(os.path.join(path, name + ".csv"))
+            with open(paths[-1], "w+") as f:
                 wr = csv.writer(f)
                 headers = True
                 for rows in uids.values():
                     for row in rows:
                         if headers:
                             headers = False
-                            wr.writerow(list(row.keys()))
+                            wr.writerow(cols or list(row.keys()))
+
+                        wr.writerow([row.get(col) for col in cols] if cols else list(row.values()))
+        return paths
 
-                        wr.writerow(list(row.values()))
+    def to_json(self, path='', partition_by=None, max_open_files=DEFAULT_MAX_OPEN_FILES, columns=None):
+        """ One json array per table - partitioned tables are written as JSON Lines part files instead
 
-    def to_json(self, path=''):
+        Returns the files written.
+        """
         self.create_path(path)
 
+        paths = []
         for name, uids in self.datasets.items():
-            with open(os.path.join(path, name + ".json"), "w+") as f:
+            cols = self.export_columns(name, columns)
+            specs = self.partition_specs(partition_by, name)
+            if specs:
+                paths += self.to_partitions(path, name, specs, 'json', max_open_files, cols)
+                continue
+            if cols:
+                uids = {uid: [{col: row.get(col) for col in cols} for row in rows] for uid, rows in uids.items()}
+            paths.append(os.path.join(path, name + ".json"))
+            with open(paths[-1], "w+") as f:
                 json.dump([val for val in uids.values()], f, default=json_serial)
+        return paths
+
+    def to_partitions(self, path, entity_name, specs, file_type, max_open_files=DEFAULT_MAX_OPEN_FILES,
+                      columns=None):
+        with PartitionedWriter(os.path.join(path, entity_name), specs, file_type, max_open_files,
+                               json_default=json_serial, columns=columns) as writer:
+            for rows in self.datasets[entity_name].values():
+                for row in rows:
+                    writer.write(row)
+        return writer.paths
+
+    def to_parquet(self, path='', compression='snappy', columns=None):
+        """ One parquet file per table, keeping dictionary encoded columns encoded - needs pyarrow """
+        import_pyarrow()
+        import pyarrow.parquet
+
+        self.create_path(path)
+        for name in self.datasets:
+            table = self.to_columnar(name)
+            cols = self.export_columns(name, columns)
+            if cols:
+                table = table.project(cols)
+            pyarrow.parquet.write_table(table.to_arrow(), os.path.join(path, name + ".parquet"),
+                                        compression=compression)
+
+    def scd_entities(self, entity_names=None):
+        names = [e.name for e in self.entity_dict.values() if e.preserve_id_across_its]
+        if entity_names is None:
+            return [name for name in self.datasets if name in names]
+        missing = [name for name in entity_names if name not in names]
+        if missing:
+            raise ValueError("Not SCD Type 2 entities: " + ", ".join(missing))
+        return list(entity_names)
+
+    def cdc_events(self, entity_names=None, max_ids=DEFAULT_MAX_IDS, tmp_dir=None):
+        """ Insert and update events of SCD Type 2 entities (all by default) in valid_from order, see cdc """
+        names = self.scd_entities(entity_names)
+        return change_events({name: self.datasets[name] for name in names}, max_ids, tmp_dir or self.spill_path)
+
+    def to_cdc(self, path='', entity_names=None, file_type='jsonl', max_ids=DEFAULT_MAX_IDS, compression='snappy'):
+        """ One time ordered change stream, changes.jsonl or changes.parquet - returns the number of events """
+        self.create_path(path)
+        events = self.cdc_events(entity_names, max_ids)
+        if file_type in ('jsonl', 'json'):
+            return write_json_lines(events, os.path.join(path, CDC_FILE_NAME + ".jsonl"), default=json_serial)
+        if file_type == 'parquet':
+            return write_parquet(events, os.path.join(path, CDC_FILE_NAME + ".parquet"), json_serial, compression)
+        raise ValueError("Unknown CDC file type " + file_type)
 
     def to_pickled_pyschema(self, path=''):
         self.create_path(path)
 
-        # Get first row
-        for name, uids in self.datasets.items():
+        for name in self.datasets:
             with open(os.path.join(path, name + ".schema"), "wb") as f:
-                first_row = next(iter(uids.values()))[0]
-                schema = {}
-                for name, val in first_row.items():
-                    schema[name] = type(val)
-                pickle.dump(schema, f)
+                types = self.statistics_for(name).types
+                declared = self.entity_dict[name].schema.dtypes if name in self.entity_dict else {}
+                types.update({col: dtype.python_type for col, dtype in declared.items() if col in types})
+                pickle.dump(types, f)
@@ -0,0 +1,177 @@
+"""
+Hive style partitioned output - rows are routed to table/<key>=<value>/part-NNNNN files, e.g.
+
+    order/dt=2018-11-03/part-00000.csv
+
+Writers for every partition are pooled: at most max_open_files are open at once, the least recently used one is
+closed when another is needed, and a partition that is opened again continues in a new part file.
+"""
+
+import os
+import csv
+import json
+import datetime
+from collections import OrderedDict
+
+from labgrownsheets.model.statistics import hash_value
+
+DEFAULT_MAX_OPEN_FILES = 64
+WRITE_BUFFER = 1024 * 1024
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+DATE_FORMATS = {
+    'year': '%Y',
+    'month': '%Y-%m',
+    'day': '%Y-%m-%d',
+    'hour': '%Y-%m-%d-%H'
+}
+
+
+class DatePartition:
+    """ Truncate a date, datetime or ISO string column to year, month, day or hour """
+
+    def __init__(self, column, granularity='day', key='dt'):
+        if granularity not in DATE_FORMATS:
+            raise ValueError("Granularity must be one of {}".format(list(DATE_FORMATS)))
+        self.column = column
+        self.granularity = granularity
+        self.key = key
+        self.format = DATE_FORMATS[granularity]
+
+    def value(self, row):
+        val = row.get(self.column)
+        if val is None:
+            return NULL_PARTITION
+        if isinstance(val, str):
+            val = datetime.datetime.fromisoformat(val)
+        return val.strftime(self.format)
+
+
+class HashPartition:
+    """ Spread rows over a fixed number of buckets by a hash of a key column - stable across processes """
+
+    def __init__(self, column, buckets, key='bucket'):
+        self.column = column
+        self.buckets = int(buckets)
+        self.key = key
+
+    def value(self, row):
+        val = row.get(self.column)
+        if val is None:
+            return NULL_PARTITION
+        return "{:0{}d}".format(hash_value(val) % self.buckets, len(str(self.buckets - 1)))
+
+
+def partition_from_dict(d):
+    d = dict(d)
+    kind = d.pop('type', 'date')
+    if kind == 'date':
+        return DatePartition(**d)
+    elif kind == 'hash':
+        return HashPartition(**d)
+    raise ValueError("Unknown partition type " + kind)
+
+
+def resolve_partitions(partition_by, entity_name, columns):
+    """ The partition specs for one entity - partition_by is a spec, a list of them or {entity_name: specs}
+
+    Specs given for every table are skipped on tables that don't have the column.
+    """
+    if isinstance(partition_by, dict) and 'column' not in partition_by:
+        specs = partition_by.get(entity_name) or []
+        for_every_table = False
+    else:
+        specs, for_every_table = partition_by or [], True
+    if not isinstance(specs, (list, tuple)):
+        specs = [specs]
+    specs = [partition_from_dict(s) if isinstance(s, dict) else s for s in specs]
+    if for_every_table:
+        specs = [s for s in specs if s.column in columns]
+    else:
+        missing = [s.column for s in specs if s.column not in columns]
+        if missing:
+            raise ValueError("Cannot partition {} by missing columns {}".format(entity_name, missing))
+    return specs
+
+
+class CsvPartFile:
+    extension = '.csv'
+
+    def __init__(self, f):
+        self.f = f
+        self.writer = csv.writer(f)
+        self.headers = False
+
+    def write(self, row):
+        if not self.headers:
+            self.headers = True
+            self.writer.writerow(list(row.keys()))
+        self.writer.writerow(list(row.values()))
+
+
+class JsonLinesPartFile:
+    extension = '.jsonl'
+
+    def __init__(self, f, default=None):
+        self.f = f
+        self.default = default
+
+    def write(self, row):
+        self.f.write(json.dumps(row, default=self.default))
+        self.f.write("\n")
+
+
+class PartitionedWriter:
+
+    def __init__(self, path, specs, file_type, max_open_files=DEFAULT_MAX_OPEN_FILES, json_default=None,
+                 columns=None):
+        self.path = path
+        self.specs = specs
+        self.file_type = file_type
+        self.max_open_files = max_open_files
+        self.json_default = json_default
+        self.columns = columns  # Written columns - partition columns needn't be among them
+        self.open_files = OrderedDict()  # partition dir -> part file, least recently used first
+        self.part_counts = {}
+        self.paths = []  # Every part file written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def partition_dir(self, row):
+        return os.path.join(self.path, *("{}={}".format(s.key, s.value(row)) for s in self.specs))
+
+    def part_file(self, directory):
+        part = self.open_files.get(directory)
+        if part is not None:
+            self.open_files.move_to_end(directory)
+            return part
+
+        if len(self.open_files) >= self.max_open_files:
+            _, oldest = self.open_files.popitem(last=False)
+            oldest.f.close()
+
+        num = self.part_counts.get(directory, 0)
+        self.part_counts[directory] = num + 1
+        if not num:
+            os.makedirs(directory, exist_ok=True)
+        file_path = os.path.join(directory, "part-{:05d}".format(num))
+        if self.file_type == 'csv':
+            self.paths.append(file_path + CsvPartFile.extension)
+            part = CsvPartFile(open(self.paths[-1], "w", newline='', buffering=WRITE_BUFFER))
+        else:
+            self.paths.append(file_path + JsonLinesPartFile.extension)
+            part = JsonLinesPartFile(open(self.paths[-1], "w", buffering=WRITE_BUFFER), self.json_default)
+        self.open_files[directory] = part
+        return part
+
+    def write(self, row):
+        part = self.part_file(self.partition_dir(row))
+        part.write(row if self.columns is None else {col: row.get(col) for col in self.columns})
+
+    def close(self):
+        for part in self.open_files.values():
+            part.f.close()
+        self.open_files = OrderedDict()
@@ -0,0 +1,191 @@
+"""
+Stream rows to sinks while the model is still generating.
+
+Generation is CPU bound and runs in an executor thread, handing blocks of rows to the event loop. Every sink gets
+its own bounded asyncio.Queue, so a slow sink makes the generating thread wait (backpressure) rather than
+buffering the whole model in memory twice. Entities are generated in dependency order, so a sink sees every row
+of a parent before the first row of its children.
+
+Streamed rows aren't kept: a table is dropped from the model as soon as its children are generated, so memory
+holds a parent and its children at most rather than the whole model. retain=True keeps every table in
+model.datasets as generate_all_datasets would, e.g. to validate or export what was streamed.
+
+    pipeline = Pipeline(model, [CsvSink('out'), SocketSink(port=9000)])
+    asyncio.run(pipeline.run())
+"""
+
+import os
+import csv
+import io
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from labgrownsheets.model.model import json_serial
+
+DEFAULT_BLOCK_ROWS = 1000
+DEFAULT_MAX_BLOCKS = 8
+END = None  # Queue sentinel
+
+
+class AsyncSink:
+    """ Receives blocks of rows - override write, and open/close if the sink holds resources """
+
+    async def open(self):
+        pass
+
+    async def write(self, entity_name, rows):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class AsyncFileSink(AsyncSink):
+    """ One file per entity, written from a single background thread so the event loop never blocks on disk """
+    extension = ''
+
+    def __init__(self, path=''):
+        self.path = path
+        self.files = {}
+        self._executor = None
+
+    async def open(self):
+        if self.path and not os.path.exists(self.path):
+            os.makedirs(self.path)
+        self._executor = ThreadPoolExecutor(1)  # One thread keeps writes to a file in order
+
+    def format(self, entity_name, rows, first):
+        raise NotImplementedError
+
+    def _write(self, entity_name, rows):
+        f = self.files.get(entity_name)
+        first = f is None
+        if first:
+            f = self.files[entity_name] = open(os.path.join(self.path, entity_name + self.extension), "w+")
+        f.write(self.format(entity_name, rows, first))
+
+    def _close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+    async def write(self, entity_name, rows):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._write, entity_name, rows)
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._close)
+        self._executor.shutdown()
+
+
+class CsvSink(AsyncFileSink):
+    extension = '.csv'
+
+    def format(self, entity_name, rows, first):
+        out = io.StringIO()
+        wr = csv.writer(out)
+        if first:
+            wr.writerow(list(rows[0].keys()))
+        for row in rows:
+            wr.writerow(list(row.values()))
+        return out.getvalue()
+
+
+class JsonLinesSink(AsyncFileSink):
+    extension = '.jsonl'
+
+    def format(self, entity_name, rows, first):
+        return "".join(json.dumps(row, default=json_serial) + "\n" for row in rows)
+
+
+class SocketSink(AsyncSink):
+    """ Sends {"entity": ..., "row": {...}} JSON lines to a listening TCP or unix socket
+
+    Waiting for the socket to drain after every block means a slow reader slows generation down too.
+    """
+
+    def __init__(self, host='127.0.0.1', port=None, unix_path=None):
+        if port is None and unix_path is None:
+            raise ValueError("SocketSink needs either a port or a unix socket path")
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.writer = None
+
+    async def open(self):
+        if self.unix_path:
+            _, self.writer = await asyncio.open_unix_connection(self.unix_path)
+        else:
+            _, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def write(self, entity_name, rows):
+        self.writer.write("".join(json.dumps({'entity': entity_name, 'row': row}, default=json_serial) + "\n"
+                                  for row in rows).encode())
+        await self.writer.drain()
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+class Pipeline:
+
+    def __init__(self, model, sinks, block_rows=DEFAULT_BLOCK_ROWS, max_blocks=DEFAULT_MAX_BLOCKS, retain=False):
+        self.model = model
+        self.sinks = sinks
+        self.block_rows = block_rows
+        self.max_blocks = max_blocks
+        self.retain = retain
+        self.error = None
+
+    async def consume(self, sink, queue):
+        while True:
+            block = await queue.get()
+            if block is END:
+                return
+            if self.error is None:  # After a failure keep draining so the producer never blocks on a full queue
+                try:
+                    await sink.write(*block)
+                except Exception as e:
+                    self.error = e
+
+    def produce(self, loop, queues):
+        block = {'entity': None, 'rows': []}
+
+        def publish():
+            if block['rows']:
+                for queue in queues:
+                    asyncio.run_coroutine_threadsafe(queue.put((block['entity'], block['rows'])), loop).result()
+                block['rows'] = []
+            if self.error is not None:
+                raise self.error
+
+        def on_row(entity_name, row):
+            if entity_name != block['entity']:  # Entities are generated one after the other
+                publish()
+                block['entity'] = entity_name
+            block['rows'].append(row)
+            if len(block['rows']) >= self.block_rows:
+                publish()
+
+        self.model.generate_all_datasets(on_row=on_row, retain=self.retain)
+        publish()
+
+    async def run(self):
+        """ Generate every entity of the model, streaming rows to all sinks - returns the datasets retained """
+        loop = asyncio.get_running_loop()
+        queues = [asyncio.Queue(self.max_blocks) for sink in self.sinks]
+        for sink in self.sinks:
+            await sink.open()
+        consumers = [asyncio.ensure_future(self.consume(sink, queue)) for sink, queue in zip(self.sinks, queues)]
+        try:
+            await loop.run_in_executor(None, self.produce, loop, queues)
+        finally:
+            for queue in queues:
+                await queue.put(END)
+            await asyncio.gather(*consumers)
+            for sink in self.sinks:
+                await sink.close()
+        if self.error is not None:
+            raise self.error
+        return self.model.datasets
@@ -0,0 +1,188 @@
+import sys
+import time
+import random
+import warnings
+
+import numpy
+import networkx
+
+from labgrownsheets.relations.relation import RelationType
+
+DEFAULT_SAMPLE_SIZE = 20
+BYTE_UNITS = ['B', 'KB', 'MB', 'GB', 'TB']
+
+
+def parse_bytes(val):
+    """ Accepts a number of bytes or a string such as '512MB' or '8GB' """
+    if val is None or isinstance(val, (int, float)):
+        return val
+    val = str(val).strip().upper()
+    for power, unit in reversed(list(enumerate(BYTE_UNITS))):
+        if val.endswith(unit):
+            return int(float(val[:-len(unit)]) * 1024 ** power)
+    return int(val)
+
+
+def format_bytes(val):
+    for unit in BYTE_UNITS:
+        if val < 1024 or unit == BYTE_UNITS[-1]:
+            return "{:.1f}{}".format(val, unit)
+        val /= 1024
+
+
+def estimate_row_bytes(row):
+    # Keys are shared between rows, so only the dict and its values are counted
+    return sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+
+
+def estimate_dataset_bytes(dataset, sample_size=100):
+    """ Extrapolate the size of a {id: [row, ...]} dataset from its first sample_size ids """
+    if not dataset:
+        return 0
+    if hasattr(dataset, 'nbytes'):  # Columnar datasets know their size
+        return dataset.nbytes
+    sample_rows = sample_ids = 0
+    sample_bytes = 0
+    for rows in dataset.values():
+        sample_ids += 1
+        sample_rows += len(rows)
+        sample_bytes += sys.getsizeof(rows) + sum(estimate_row_bytes(row) for row in rows)
+        if sample_ids >= sample_size:
+            break
+    return int(sample_bytes / sample_ids * len(dataset))
+
+
+class EntityPlan:
+    def __init__(self, name, iterations, entities_per_iteration, preserve_id, bytes_per_row, seconds_per_row):
+        self.name = name
+        self.iterations = iterations
+        self.entities_per_iteration = entities_per_iteration
+        self.preserve_id = preserve_id
+        self.bytes_per_row = bytes_per_row
+        self.seconds_per_row = seconds_per_row
+
+    @property
+    def rows(self):
+        return int(round(self.iterations * self.entities_per_iteration))
+
+    @property
+    def ids(self):
+        return self.iterations if self.preserve_id else self.rows
+
+    @property
+    def bytes(self):
+        return int(self.rows * self.bytes_per_row)
+
+    @property
+    def seconds(self):
+        return self.rows * self.seconds_per_row
+
+
+class ModelPlan:
+    def __init__(self, entities, memory_budget=None):
+        self.entities = entities
+        self.memory_budget = parse_bytes(memory_budget)
+
+    def __getitem__(self, name):
+        return next(e for e in self.entities if e.name == name)
+
+    @property
+    def rows(self):
+        return sum(e.rows for e in self.entities)
+
+    @property
+    def bytes(self):
+        return sum(e.bytes for e in self.entities)
+
+    @property
+    def seconds(self):
+        return sum(e.seconds for e in self.entities)
+
+    @property
+    def exceeds_budget(self):
+        return bool(self.memory_budget) and self.bytes > self.memory_budget
+
+    def __str__(self):
+        width = max([len(e.name) for e in self.entities] + [len("Entity")])
+        line = "{:<" + str(width) + "}  {:>12}  {:>14}  {:>10}  {:>10}"
+        lines = [line.format("Entity", "Iterations", "Rows", "Memory", "Time")]
+        for e in self.entities:
+            lines.append(line.format(e.name, e.iterations, e.rows, format_bytes(e.bytes),
+                                     "{:.2f}s".format(e.seconds)))
+        lines.append(line.format("Total", "", self.rows, format_bytes(self.bytes), "{:.2f}s".format(self.seconds)))
+        if self.memory_budget:
+            lines.append("Memory budget {} - {}".format(format_bytes(self.memory_budget),
+                                                        "EXCEEDED" if self.exceeds_budget else "OK"))
+        return "\n".join(lines)
+
+
+def calibration_ids_needed(model, entity, sample_its, sample_size):
+    """ The fewest ids of entity its children's calibration runs can draw from without running out
+
+    Unique one_to_many children take one id per iteration, unique many_to_many children as many ids as the
+    largest number of entities per iteration seen in sample_size draws.
+    """
+    needed = 0
+    for child in model.dag.successors(entity):
+        for rel in child.relations:
+            if rel.name != entity.name or not rel.unique:
+                continue
+            if rel.type == RelationType.ONE_TO_MANY:
+                needed = max(needed, sample_its[child.name])
+            else:
+                context = child.new_context()
+                needed = max([needed] + [context.num_entities_per_iteration() for i in range(sample_size)])
+    return needed
+
+
+def plan_model(model, sample_size=DEFAULT_SAMPLE_SIZE, memory_budget=None):
+    """ Estimate the size and runtime of a model without generating it
+
+    Each entity is calibrated by generating up to sample_size iterations against calibration samples of its
+    parents - more where a child's unique relation draws more ids than that, see calibration_ids_needed.
+    Calibration runs use profiler contexts of their own and random state is restored afterwards, so a
+    following generate_all_datasets is unaffected by planning.
+    """
+    if not model.dag:
+        model.dag = model.generate_dag()
+
+    random_state = random.getstate()
+    numpy_state = numpy.random.get_state()
+    calibration = {}
+    plans = []
+    try:
+        order = list(networkx.topological_sort(model.dag))
+        sample_its, ids_needed = {}, {}
+        for entity in reversed(order):  # Children first, as they decide how many ids their parents need
+            sample_its[entity.name] = max(1, min(sample_size, model.num_iterations_for(entity)))
+            ids_needed[entity.name] = calibration_ids_needed(model, entity, sample_its, sample_size)
+
+        for entity in order:
+            num_iterations = model.num_iterations_for(entity)
+            its, context = sample_its[entity.name], entity.new_context()
+
+            start = time.perf_counter()
+            ents = calibration[entity.name] = model.generate_entity_data(entity, calibration, its, False,
+                                                                         context=context)
+            while len(ents) < ids_needed[entity.name] and its < num_iterations:  # Until children can draw
+                more = min(max(its, 1), num_iterations - its)
+                model.generate_entity_data(entity, calibration, more, False, ents=ents, context=context)
+                its += more
+            elapsed = time.perf_counter() - start
+
+            rows = [row for rows in calibration[entity.name].values() for row in rows]
+            num_rows = max(len(rows), 1)
+            bytes_per_row = sum(estimate_row_bytes(row) for row in rows) / num_rows
+            bytes_per_row += sys.getsizeof([]) * len(calibration[entity.name]) / num_rows  # id -> rows overhead
+
+            plans.append(EntityPlan(entity.name, num_iterations, entity.expected_entities_per_iteration(),
+                                    entity.preserve_id_across_its, bytes_per_row, elapsed / num_rows))
+    finally:
+        random.setstate(random_state)
+        numpy.random.set_state(numpy_state)
+
+    plan = ModelPlan(plans, memory_budget)
+    if plan.exceeds_budget:
+        warnings.warn("Model is estimated to need {} which exceeds the memory budget of {}".format(
+            format_bytes(plan.bytes), format_bytes(plan.memory_budget)), ResourceWarning)
+    return plan
@@ -14,7 +14,9 @@ class BaseSchemaAdapter:
         (str, "text"),
         (float, "real"),
         (int, "int"),
-        (datetime.datetime, "timestamp")
+        (bool, "boolean"),
+        (datetime.datetime, "timestamp"),
+        (datetime.date, "date")
     )
 
     def __init__(self, model):
@@ -31,16 +33,22 @@ class BaseSchemaAdapter:
         if not name:
             name = self.name
         schemas = {}
-        for model_name, uids in self.model.datasets.items():
-            first_row = next(iter(uids.values()))[0]
+        for model_name in self.model.datasets:
+            declared = self.model.entity_dict[model_name].schema.dtypes
             schema = {}
-            for col_name, val in first_row.items():
-                schema[col_name] = self.convert_pytype(type(val))
+            for col_name, stats in self.model.statistics_for(model_name).columns.items():
+                if col_name in declared:  # No inference needed
+                    schema[col_name] = self.convert_dtype(declared[col_name])
+                else:
+                    schema[col_name] = self.convert_pytype(stats.python_type)
             schemas[model_name] = {'column_types': schema}
 
         with open(os.path.join(path, name + ".yml"), "w+") as f:
             yaml.dump(schemas, f, default_flow_style=False)
 
+    def convert_dtype(self, dtype):
+        return self.convert_pytype(dtype.python_type)
+
     def convert_pytype(self, dtype):
         overwritten = [t[1] for t in self.overwritten_conversions if dtype == t[0]]
         if overwritten:
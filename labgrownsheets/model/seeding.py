@@ -0,0 +1,16 @@
+import random
+import hashlib
+
+import numpy
+
+
+def derive_seed(*parts):
+    """ A stable 64 bit seed from any number of parts, e.g. (model seed, entity name, shard) """
+    key = ":".join(str(p) for p in parts).encode()
+    return int(hashlib.sha256(key).hexdigest()[:16], 16)
+
+
+def seed_globals(seed):
+    # Profilers written against the random and numpy modules are made deterministic by seeding both
+    random.seed(seed)
+    numpy.random.seed(seed % 2 ** 32)
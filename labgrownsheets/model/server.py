@@ -0,0 +1,349 @@
+"""
+A long lived server which generates models once and serves their tables over localhost HTTP or a unix socket, so
+test workers can fetch fixtures without generating anything themselves.
+
+    GET /models                                          models, entities and row counts (JSON)
+    GET /models/<model>/tables/<entity>                  rows start:stop of a generated table
+    GET /models/<model>/subsets/<root>/tables/<entity>   a table of a referentially closed subset (see subset)
+    GET /models/<model>/batches/<entity>                 iterations freshly generated rows of an entity
+
+Query parameters: start, stop and columns (comma separated) for tables, fraction, keys and seed for subsets,
+iterations for batches, and format - arrow (an Arrow IPC stream, the default when pyarrow is installed) or json.
+Tables are kept as Arrow tables once first asked for, so slices are zero copy; subsets are cached by their
+parameters. Fresh batches are generated one at a time across all models, as profilers share the global random
+state.
+
+    server = ModelServer({'shop': model}, unix_path='/tmp/shop.sock')
+    server.serve()
+
+    client = ModelClient(unix_path='/tmp/shop.sock')
+    orders = client.table('shop', 'order', stop=100)
+"""
+
+import os
+import json
+import stat
+import errno
+import socket
+import threading
+import http.client
+import socketserver
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, urlencode, quote
+
+from labgrownsheets.model.columnar import ColumnarTable
+from labgrownsheets.model.model import json_serial
+
+ARROW_STREAM = 'application/vnd.apache.arrow.stream'
+JSON = 'application/json'
+MAX_CACHED_SUBSETS = 16
+
+
+def has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ServerError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def is_socket(path):
+    try:
+        return stat.S_ISSOCK(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return False
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # A socket left behind by an earlier server is replaced, a live one or anything else at the path is left alone
+        if is_socket(self.server_address):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.server_address)
+            except ConnectionRefusedError:  # Nothing listening
+                os.remove(self.server_address)
+            else:
+                raise OSError(errno.EADDRINUSE, "A server is already listening on {}".format(self.server_address))
+            finally:
+                probe.close()
+        elif os.path.lexists(self.server_address):
+            raise FileExistsError("{} exists and isn't a unix socket".format(self.server_address))
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = 'localhost', 0
+
+
+class ModelHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep alive, so clients reuse a connection
+
+    def log_message(self, format, *args):
+        pass
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            status, content_type, body = 200, *self.server.app.handle(url.path.strip('/').split('/'), params)
+        except ServerError as e:
+            status, content_type, body = e.status, JSON, json.dumps({'error': str(e)}).encode()
+        except (KeyError, ValueError) as e:
+            status, content_type, body = 400, JSON, json.dumps({'error': str(e)}).encode()
+        except Exception as e:  # Still a JSON error the client can raise, rather than a dropped connection
+            status, content_type, body = 500, JSON, json.dumps({'error': "{}: {}".format(type(e).__name__, e)}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ModelServer:
+
+    def __init__(self, models, host='127.0.0.1', port=0, unix_path=None, max_cached_subsets=MAX_CACHED_SUBSETS):
+        self.models = models
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.max_cached_subsets = max_cached_subsets
+        self.tables = {}  # (model, subset key, entity) -> Arrow or Columnar table
+        self.subsets = OrderedDict()  # Least recently used first
+        self.lock = threading.Lock()
+        self.model_locks = {name: threading.Lock() for name in models}
+        self.generate_lock = threading.Lock()  # Profilers draw from the global random state, whichever the model
+        self.httpd = None
+        self.thread = None
+
+    def warm(self):
+        """ Generate every model that hasn't been generated yet """
+        for model in self.models.values():
+            if model.datasets is None:
+                model.generate_all_datasets()
+
+    ##################################################################
+    # Serving
+    ##################################################################
+
+    def bind(self):
+        self.warm()
+        if self.unix_path:
+            self.httpd = ThreadingUnixHTTPServer(self.unix_path, ModelHandler)
+        else:
+            self.httpd = ThreadingHTTPServer((self.host, self.port), ModelHandler)
+            self.port = self.httpd.server_address[1]
+        self.httpd.app = self
+        return self.httpd
+
+    def serve(self):
+        """ Serve until interrupted """
+        httpd = self.httpd or self.bind()
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
+
+    def start(self):
+        """ Serve from a background thread """
+        self.httpd or self.bind()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def shutdown(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        if self.unix_path and is_socket(self.unix_path):
+            os.remove(self.unix_path)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    ##################################################################
+    # Requests
+    ##################################################################
+
+    def handle(self, parts, params):
+        fmt = params.get('format') or ('arrow' if has_pyarrow() else 'json')
+        if fmt not in ('arrow', 'json'):
+            raise ValueError("Unknown format " + fmt)
+
+        if parts == ['models']:
+            return JSON, json.dumps(self.describe()).encode()
+        if len(parts) == 4 and parts[0] == 'models' and parts[2] == 'tables':
+            table = self.table(parts[1], parts[3])
+        elif len(parts) == 6 and parts[0] == 'models' and parts[2] == 'subsets' and parts[4] == 'tables':
+            table = self.subset_table(parts[1], parts[3], parts[5], params)
+        elif len(parts) == 4 and parts[0] == 'models' and parts[2] == 'batches':
+            table = self.batch(parts[1], parts[3], int(params.get('iterations', 1)))
+        else:
+            raise ServerError(404, "No such path /" + "/".join(parts))
+
+        start = int(params.get('start', 0))
+        stop = int(params['stop']) if 'stop' in params else None
+        columns = params['columns'].split(',') if params.get('columns') else None
+        return self.encode(table, start, stop, columns, fmt)
+
+    def describe(self):
+        return {name: {entity: len(dataset) for entity, dataset in model.datasets.items()}
+                for name, model in self.models.items()}
+
+    def model(self, name):
+        if name not in self.models:
+            raise ServerError(404, "Unknown model " + name)
+        return self.models[name]
+
+    def cached_table(self, key, model, entity):
+        if entity not in model.datasets:
+            raise ServerError(404, "Unknown entity " + entity)
+        with self.lock:
+            if key not in self.tables:
+                self.tables[key] = model.to_arrow(entity) if has_pyarrow() else model.to_columnar(entity)
+            return self.tables[key]
+
+    def table(self, model_name, entity):
+        return self.cached_table((model_name, None, entity), self.model(model_name), entity)
+
+    def subset_table(self, model_name, root, entity, params):
+        keys = params['keys'].split(',') if params.get('keys') else None
+        fraction = float(params['fraction']) if 'fraction' in params else None
+        seed = int(params['seed']) if 'seed' in params else None
+        key = (root, fraction, tuple(keys or ()), seed)
+
+        model = self.model(model_name)
+        with self.model_locks[model_name]:
+            if key in self.subsets:
+                self.subsets.move_to_end(key)
+                subset = self.subsets[key]
+            else:
+                subset = self.subsets[key] = model.subset(root, fraction, keys, seed)
+                if len(self.subsets) > self.max_cached_subsets:
+                    old, _ = self.subsets.popitem(last=False)
+                    with self.lock:
+                        self.tables = {k: v for k, v in self.tables.items() if k[1] != old}
+        return self.cached_table((model_name, key, entity), subset, entity)
+
+    def batch(self, model_name, entity, iterations):
+        model = self.model(model_name)
+        if entity not in model.entity_dict:
+            raise ServerError(404, "Unknown entity " + entity)
+        with self.generate_lock:
+            dataset = model.yield_entities(**{entity: iterations})[entity]
+        table = ColumnarTable.from_dataset(entity, dataset, model.entity_dict[entity].schema)
+        return table.to_arrow() if has_pyarrow() else table
+
+    @staticmethod
+    def encode(table, start, stop, columns, fmt):
+        if isinstance(table, ColumnarTable):  # Without pyarrow
+            if fmt == 'arrow':
+                raise ServerError(406, "pyarrow is needed for Arrow output")
+            rows = table.to_rows(start, stop)
+            if columns:
+                rows = ({k: row[k] for k in columns} for row in rows)
+            return JSON, json.dumps(list(rows), default=json_serial).encode()
+
+        stop = table.num_rows if stop is None else min(stop, table.num_rows)
+        table = table.slice(start, max(stop - start, 0))  # Zero copy
+        if columns:
+            table = table.select(columns)
+        if fmt == 'json':
+            return JSON, json.dumps(table.to_pylist(), default=json_serial).encode()
+
+        import pyarrow
+        sink = pyarrow.BufferOutputStream()
+        with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return ARROW_STREAM, sink.getvalue().to_pybytes()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, unix_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_path = unix_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class ModelClient:
+    """ Fetches tables from a ModelServer - pyarrow Tables for Arrow responses, lists of rows for JSON """
+
+    def __init__(self, host='127.0.0.1', port=None, unix_path=None, format=None, timeout=60):
+        if port is None and unix_path is None:
+            raise ValueError("ModelClient needs either a port or a unix socket path")
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.format = format or ('arrow' if has_pyarrow() else 'json')
+        self.timeout = timeout
+        self.local = threading.local()  # One keep alive connection per thread
+
+    @property
+    def connection(self):
+        conn = getattr(self.local, 'connection', None)
+        if conn is None:
+            if self.unix_path:
+                conn = UnixHTTPConnection(self.unix_path, self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.local.connection = conn
+        return conn
+
+    def get(self, path, **params):
+        params = {k: ",".join(v) if isinstance(v, (list, tuple)) else v for k, v in params.items() if v is not None}
+        url = "/" + "/".join(quote(p) for p in path) + ("?" + urlencode(params) if params else "")
+        try:
+            self.connection.request('GET', url)
+            response = self.connection.getresponse()
+        except (ConnectionError, http.client.HTTPException):  # Dropped keep alive connection - retry once
+            self.connection.close()
+            self.local.connection = None
+            self.connection.request('GET', url)
+            response = self.connection.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise ServerError(response.status, json.loads(body)['error'])
+        if response.getheader('Content-Type') == ARROW_STREAM:
+            import pyarrow
+            return pyarrow.ipc.open_stream(body).read_all()
+        return json.loads(body)
+
+    def models(self):
+        return self.get(['models'])
+
+    def table(self, model, entity, start=None, stop=None, columns=None):
+        return self.get(['models', model, 'tables', entity], start=start, stop=stop, columns=columns,
+                        format=self.format)
+
+    def subset(self, model, root, entity, fraction=None, keys=None, seed=None, columns=None):
+        return self.get(['models', model, 'subsets', root, 'tables', entity], fraction=fraction, keys=keys,
+                        seed=seed, columns=columns, format=self.format)
+
+    def batch(self, model, entity, iterations=1, columns=None):
+        return self.get(['models', model, 'batches', entity], iterations=iterations, columns=columns,
+                        format=self.format)
+
+    def close(self):
+        conn = getattr(self.local, 'connection', None)
+        if conn is not None:
+            conn.close()
+            self.local.connection = None
@@ -0,0 +1,126 @@
+import os
+import mmap
+import pickle
+import shutil
+import tempfile
+import weakref
+from collections.abc import MutableMapping
+
+from labgrownsheets.model.planner import estimate_dataset_bytes
+
+
+class DatasetStore(MutableMapping):
+    """ Drop in replacement for the datasets dict which can spill tables to disk
+
+    A spilled table is pickled to spill_path and either dropped from memory or replaced by a projection onto the
+    columns that children still need. Reading a spilled table loads the full table back through a memory map,
+    keeping only the most recently loaded table cached so exports stay within budget.
+    """
+
+    def __init__(self, spill_path=None):
+        self.spill_path = spill_path
+        self._tables = {}
+        self._order = []
+        self._spilled = {}
+        self._projected = set()
+        self._sizes = {}
+        self._cache = (None, None)
+
+    def _spill_dir(self):
+        if not self.spill_path:
+            self.spill_path = tempfile.mkdtemp(prefix="labgrownsheets-")
+            weakref.finalize(self, shutil.rmtree, self.spill_path, True)
+        elif not os.path.exists(self.spill_path):
+            os.makedirs(self.spill_path)
+        return self.spill_path
+
+    ##################################################################
+    # Mapping interface
+    ##################################################################
+
+    def __getitem__(self, name):
+        if name in self._tables:
+            return self._tables[name]
+        if name in self._spilled:
+            return self.load(name)
+        raise KeyError(name)
+
+    def __setitem__(self, name, dataset):
+        if name in self:
+            del self[name]
+        self._tables[name] = dataset
+        self._sizes[name] = estimate_dataset_bytes(dataset)
+        self._order.append(name)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self._tables.pop(name, None)
+        self._projected.discard(name)
+        self._sizes.pop(name, None)
+        path = self._spilled.pop(name, None)
+        if path and os.path.exists(path):
+            os.remove(path)
+        if self._cache[0] == name:
+            self._cache = (None, None)
+        self._order.remove(name)
+
+    def __iter__(self):
+        return iter(list(self._order))
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, name):
+        return name in self._tables or name in self._spilled
+
+    ##################################################################
+    # Spilling
+    ##################################################################
+
+    def is_spilled(self, name):
+        return name in self._spilled
+
+    def is_projected(self, name):
+        return name in self._projected
+
+    def in_memory(self, name):
+        return name in self._tables and name not in self._projected
+
+    def size(self, name):
+        return self._sizes.get(name, 0)
+
+    @property
+    def memory_usage(self):
+        return sum(self._sizes.get(name, 0) for name in self._tables)
+
+    def spill(self, name, keep_columns=None):
+        """ Write a table to disk, dropping it from memory or keeping only keep_columns if given """
+        if name not in self._spilled:
+            path = os.path.join(self._spill_dir(), name + ".pkl")
+            with open(path, "wb") as f:
+                pickle.dump(self._tables[name], f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._spilled[name] = path
+
+        if keep_columns is None:
+            self._tables.pop(name, None)
+            self._projected.discard(name)
+            self._sizes[name] = 0
+        elif name not in self._projected:
+            keep_columns = set(keep_columns)
+            if hasattr(self._tables[name], 'project'):  # Columnar - stays encoded
+                self._tables[name] = self._tables[name].project(keep_columns)
+            else:
+                self._tables[name] = {uid: [{k: v for k, v in row.items() if k in keep_columns} for row in rows]
+                                      for uid, rows in self._tables[name].items()}
+            self._projected.add(name)
+            self._sizes[name] = estimate_dataset_bytes(self._tables[name])
+
+    def load(self, name):
+        if self._cache[0] == name:
+            return self._cache[1]
+        with open(self._spilled[name], "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                dataset = pickle.loads(m)
+        self._cache = (name, dataset)
+        return dataset
@@ -0,0 +1,84 @@
+"""
+Referentially closed subsets of a generated model, e.g. 1% of customers with all of their orders and order items.
+
+Starting from the chosen ids of the root entity:
+
+    descendants      keep rows whose foreign keys into the root or other descendants are all kept
+    ancestors        keep the rows referenced by anything kept, closing upwards (reverse topological order)
+    other entities   in the root's component keep rows whose parents are all kept (e.g. conversion rates of
+                     the kept currencies), anything outside the component is copied whole
+
+Each table is filtered in one pass using sets of kept ids as foreign key indexes.
+"""
+
+import random
+
+import networkx
+
+from labgrownsheets.model.seeding import derive_seed
+
+
+def kept_rows(dataset, constraints):
+    """ {id: rows} for the rows whose foreign keys are all in the kept sets - constraints is [(column, ids)] """
+    out = {}
+    for uid, rows in dataset.items():
+        rows = [row for row in rows if all(row.get(col) in ids for col, ids in constraints)]
+        if rows:
+            out[uid] = rows
+    return out
+
+
+def subset_datasets(model, root, fraction=None, keys=None, seed=None):
+    if (fraction is None) == (keys is None):
+        raise ValueError("Subset by either a fraction or keys of the root entity")
+    if root not in model.entity_dict:
+        raise KeyError("Unable to find entity: '{}'".format(root))
+
+    dag = model.dag or model.generate_dag()
+    names = {entity: entity.name for entity in dag}
+    root_entity = model.entity_dict[root]
+    datasets = model.datasets
+
+    if keys is None:
+        ids = list(datasets[root].keys())
+        rng = random.Random(derive_seed(seed, 'subset', root))
+        keys = rng.sample(ids, int(round(fraction * len(ids))))
+    keys = set(keys)
+
+    kept = {root: {uid: rows for uid, rows in datasets[root].items() if uid in keys}}
+    descendants = networkx.descendants(dag, root_entity)
+    order = list(networkx.topological_sort(dag))
+
+    def constraints(entity, parents):
+        return [(model.entity_dict[rel.name].id, set(kept[rel.name])) for rel in entity.relations
+                if rel.name in parents]
+
+    # Descendants only depend on the root and other descendants
+    filtered = {root} | {names[e] for e in descendants}
+    for entity in order:
+        if entity in descendants:
+            kept[entity.name] = kept_rows(datasets[entity.name], constraints(entity, filtered))
+
+    # Ancestors of anything kept, children first so the ids they reference are known
+    component = networkx.node_connected_component(dag.to_undirected(as_view=True), root_entity)
+    ancestors = set().union(*(networkx.ancestors(dag, model.entity_dict[name]) for name in filtered)) - descendants
+    ancestors.discard(root_entity)
+    for entity in reversed(order):
+        if entity not in ancestors:
+            continue
+        referenced = set()
+        for child in dag.successors(entity):
+            if child.name in kept:
+                col = entity.id
+                referenced.update(row[col] for rows in kept[child.name].values() for row in rows if col in row)
+        kept[entity.name] = {uid: rows for uid, rows in datasets[entity.name].items() if uid in referenced}
+
+    # Everything else in the component hangs off kept rows, anything outside it is unrelated
+    for entity in order:
+        if entity.name in kept:
+            continue
+        if entity in component:
+            kept[entity.name] = kept_rows(datasets[entity.name], constraints(entity, kept))
+        else:
+            kept[entity.name] = {uid: list(rows) for uid, rows in datasets[entity.name].items()}
+    return {name: kept[name] for name in datasets}
@@ -0,0 +1,201 @@
+"""
+Integrity checks over generated data, run on the columnar form of each entity:
+
+    foreign_key        every foreign key value exists in the parent
+    unique_relation    unique one_to_many parents are used by one iteration only, unique many_to_many parents
+                       only once per iteration
+    primary_key        ids are unique (per version for SCD entities)
+    scd_range          valid_from < valid_to, and the versions of an id don't overlap
+
+Value checks only touch the distinct values of a column (the dictionary of encoded columns), everything else is
+done on integer codes with numpy.
+"""
+
+import numpy
+
+from labgrownsheets.model.columnar import encode_categorical, NULL_CODE
+from labgrownsheets.relations.relation import RelationType
+
+VALID_FROM = 'valid_from_timestamp'
+VALID_TO = 'valid_to_timestamp'
+MAX_EXAMPLES = 5
+
+
+class Violation:
+
+    def __init__(self, check, entity, column, count, examples=None):
+        self.check = check
+        self.entity = entity
+        self.column = column
+        self.count = int(count)
+        self.examples = list(examples or [])[:MAX_EXAMPLES]
+
+    def __repr__(self):
+        return "Violation({}, {}.{}, {})".format(self.check, self.entity, self.column, self.count)
+
+
+class ValidationReport:
+
+    def __init__(self, violations, checks):
+        self.violations = violations
+        self.checks = checks
+
+    def __bool__(self):
+        return self.ok
+
+    @property
+    def ok(self):
+        return not self.violations
+
+    @property
+    def counts(self):
+        return {(v.check, v.entity, v.column): v.count for v in self.violations}
+
+    def __str__(self):
+        lines = ["{} checks, {} failed".format(self.checks, len(self.violations))]
+        if self.violations:
+            width = max(len("{}.{}".format(v.entity, v.column)) for v in self.violations)
+            for v in self.violations:
+                lines.append("{:<16} {:<{}} {:>10}  e.g. {}".format(
+                    v.check, "{}.{}".format(v.entity, v.column), width, v.count, v.examples))
+        return "\n".join(lines)
+
+
+def codes(values):
+    """ Integer codes for the values of a column, plus the distinct values they index - None is NULL_CODE """
+    if values.dtype == object:  # Hash based, strings don't sort fast and None doesn't sort at all
+        return encode_categorical(values, len(values))
+    uniques, inverse = numpy.unique(values, return_inverse=True)
+    return inverse.reshape(-1), uniques
+
+
+def column_codes(table, name):
+    if name in table.categories:  # Already dictionary encoded
+        return table.columns[name], table.categories[name]
+    return codes(table.columns[name])
+
+
+def iteration_runs(table, columns):
+    """ Run number of each row, a run being consecutive rows with the same values in columns """
+    change = numpy.zeros(len(table), dtype=bool)
+    change[:1] = True
+    for col in columns:
+        col_codes, _ = column_codes(table, col)
+        change[1:] |= col_codes[1:] != col_codes[:-1]
+    return numpy.cumsum(change) - 1
+
+
+def row_iterations(table, id_column, iteration_offsets):
+    """ Iteration of each row, from the id offset each iteration started at
+
+    The rows of an id are consecutive and ids are unique, so a run of equal ids is exactly one id.
+    """
+    id_numbers = iteration_runs(table, [id_column])
+    offsets = numpy.asarray(iteration_offsets, dtype='int64')
+    return numpy.searchsorted(offsets, id_numbers, side='right') - 1
+
+
+class Validator:
+
+    def __init__(self, model):
+        self.model = model
+        self.tables = {}
+        self.violations = []
+        self.checks = 0
+
+    def table(self, name):
+        # Only the columns checked - ids, foreign keys and validity ranges
+        if name not in self.tables:
+            entity = self.model.entity_dict[name]
+            columns = {entity.id, VALID_FROM, VALID_TO} | {self.model.entity_dict[rel.name].id
+                                                             for rel in entity.relations}
+            self.tables[name] = self.model.to_columnar(name, columns)
+        return self.tables[name]
+
+    def record(self, check, entity, column, count, examples=()):
+        self.checks += 1
+        if count:
+            self.violations.append(Violation(check, entity, column, count, examples))
+
+    def check_foreign_keys(self, entity):
+        table = self.table(entity.name)
+        for rel in entity.relations:
+            col = self.model.entity_dict[rel.name].id
+            if col not in table.columns:
+                self.record('foreign_key', entity.name, col, len(table), ["missing column"])
+                continue
+            col_codes, values = column_codes(table, col)
+            parent_ids = self.model.datasets[rel.name]
+            missing = numpy.fromiter((v not in parent_ids for v in values.tolist()), bool, count=len(values))
+            bad_rows = numpy.isin(col_codes, numpy.flatnonzero(missing)) | (col_codes == NULL_CODE)
+            self.record('foreign_key', entity.name, col, bad_rows.sum(), values[missing].tolist())
+
+    def iterations(self, entity):
+        """ Iteration of each row - as recorded while generating, else told apart by the one_to_many parents """
+        table = self.table(entity.name)
+        offsets = self.model.iteration_offsets.get(entity.name)
+        if offsets is not None and entity.id in table.columns and (
+                not len(offsets) or offsets[-1] <= len(self.model.datasets[entity.name])):
+            return row_iterations(table, entity.id, offsets)
+        # Without offsets (e.g. collected shards or subsets) iterations are runs of rows sharing their parents, so
+        # adjacent iterations with the same parents can't be told apart
+        one_to_many = [self.model.entity_dict[rel.name].id for rel in entity.one_to_many_relations]
+        return iteration_runs(table, one_to_many) if one_to_many else None
+
+    def check_unique_relations(self, entity):
+        table = self.table(entity.name)
+        unique = [rel for rel in entity.relations
+                  if rel.unique and self.model.entity_dict[rel.name].id in table.columns]
+        iterations = self.iterations(entity) if unique else None
+        if iterations is None:
+            return
+        for rel in unique:
+            col = self.model.entity_dict[rel.name].id
+            col_codes, values = column_codes(table, col)
+            stride = len(values) + 1  # Codes shifted by one so NULL_CODE is a code too
+            pairs = numpy.unique(iterations * stride + col_codes + 1)
+            if rel.type == RelationType.ONE_TO_MANY:  # A parent is used by one iteration only
+                parents = pairs % stride - 1
+                used, counts = numpy.unique(parents[parents != NULL_CODE], return_counts=True)
+                self.record('unique_relation', entity.name, col, (counts - 1).sum(),
+                            values[used[counts > 1]].tolist())
+            else:  # Many_to_many parents only once per iteration
+                self.record('unique_relation', entity.name, col, len(col_codes) - len(pairs))
+
+    def check_primary_key(self, entity):
+        table = self.table(entity.name)
+        if entity.id not in table.columns:
+            return
+        col_codes, values = column_codes(table, entity.id)
+        if entity.preserve_id_across_its and VALID_FROM in table.columns:
+            keys = numpy.stack([col_codes, table.columns[VALID_FROM].astype('int64')], axis=1)
+            duplicates = len(keys) - len(numpy.unique(keys, axis=0))
+            self.record('primary_key', entity.name, entity.id, duplicates)
+        else:
+            counts = numpy.bincount(col_codes[col_codes != NULL_CODE], minlength=len(values))
+            self.record('primary_key', entity.name, entity.id, (counts[counts > 1] - 1).sum(),
+                        values[counts > 1].tolist())
+
+    def check_scd_ranges(self, entity):
+        table = self.table(entity.name)
+        if not (entity.preserve_id_across_its and VALID_FROM in table.columns and VALID_TO in table.columns):
+            return
+        col_codes, values = column_codes(table, entity.id)
+        valid_from, valid_to = table.columns[VALID_FROM], table.columns[VALID_TO]
+        self.record('scd_range', entity.name, VALID_FROM, (valid_from >= valid_to).sum())
+
+        order = numpy.lexsort((valid_from, col_codes))
+        ids, froms, tos = col_codes[order], valid_from[order], valid_to[order]
+        overlap = (ids[1:] == ids[:-1]) & (froms[1:] < tos[:-1])
+        self.record('scd_range', entity.name, VALID_TO, overlap.sum(), values[ids[1:][overlap]].tolist())
+
+    def run(self):
+        for name in self.model.datasets:
+            entity = self.model.entity_dict[name]
+            if not len(self.table(name)):
+                continue
+            self.check_foreign_keys(entity)
+            self.check_unique_relations(entity)
+            self.check_primary_key(entity)
+            self.check_scd_ranges(entity)
+        return ValidationReport(self.violations, self.checks)
@@ -0,0 +1,130 @@
+"""
+Many variants of one model, e.g. a test matrix over mutation rates or fact volumes, generated together:
+
+    variants = model.variants({'churny': {'customer': {'mutation_rate': 0.9}},
+                               'big': {'order': {'num_iterations': 10000}}})
+
+Each variant overrides some entities, given as a profiler, a (profiler type, args) pair like from_list takes,
+or a dict of args merged into the args the base entity was built from. An entity diverges when it is overridden
+or any of its ancestors diverge. Entities a variant doesn't diverge on are generated once and shared between
+variants as read only tables, so anything changing a shared table (grow, compact) replaces it in that variant's
+datasets only - copy on write.
+Divergent entities are generated per variant, in parallel in forked worker processes where fork is available.
+Variants keep the base model's settings, with spill and checkpoint paths of their own (<path>-<variant>).
+
+With a seed every variant matches generating it as a model of its own. Without one, variants generated in forked
+workers reseed the random modules from os.urandom, so they don't repeat each other's numpy draws.
+"""
+
+import os
+import copy
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from types import MappingProxyType
+
+import networkx
+
+from labgrownsheets.model.seeding import seed_globals
+from labgrownsheets.profilers import resolve_profiler, ScdProfiler
+from labgrownsheets.profilers.base_profiler import BaseProfiler
+
+_PENDING = {}  # Variants being generated, inherited by forked workers as profilers don't pickle
+
+
+def override_profiler(entity, override):
+    if isinstance(override, BaseProfiler):
+        return override
+    if isinstance(override, (tuple, list)):
+        return resolve_profiler(override[0], override[1])
+    if entity is None or entity.kwds is None:
+        raise ValueError("Entity {} wasn't built from a dict, so override it with a profiler".format(
+            entity.name if entity else override))
+    d = dict(entity.kwds, **override)
+    if isinstance(entity, ScdProfiler):
+        return ScdProfiler(type(entity.profiler).from_dict(d))
+    return type(entity).from_dict(d)
+
+
+def variant_path(path, variant):
+    return None if path is None else "{}-{}".format(path.rstrip(os.sep), variant)
+
+
+def variant_model(base, overrides, variant):
+    """ The variant's model plus the names of the entities it diverges on """
+    entities = dict(base.entity_dict)
+    for name, override in overrides.items():
+        profiler = override_profiler(entities.get(name), override)
+        if profiler.name != name:
+            raise ValueError("Override for {} is a profiler for {}".format(name, profiler.name))
+        entities[name] = profiler
+
+    model = type(base)(list(entities.values()), memory_budget=base.memory_budget,
+                       spill_path=variant_path(base.spill_path, variant), seed=base.seed,
+                       scale_factor=base.scale_factor, counter_based=base.counter_based,
+                       collect_statistics=base.collect_statistics, dictionary_encode=base.dictionary_encode,
+                       checkpoint_path=variant_path(base.checkpoint_path, variant),
+                       checkpoint_every=base.checkpoint_every, columns=base.columns)
+    model.dag = model.generate_dag()
+    changed = {model.entity_dict[name] for name in overrides}
+    divergent = changed.union(*(networkx.descendants(model.dag, entity) for entity in changed))
+    return model, {entity.name for entity in divergent}
+
+
+def generate_divergent(key, forked=False):
+    model, divergent = _PENDING[key]
+    if forked and model.seed is None:  # Else every worker carries on from the random state they were forked with
+        seed_globals(int.from_bytes(os.urandom(8), 'little'))
+    model.generate_entities(divergent, model.datasets)
+    return ({n: model.datasets[n] for n in divergent},
+            {n: (model.block_offsets[n], model.iteration_offsets[n]) for n in divergent},
+            {n: model.statistics.get(n) for n in divergent},
+            {n: model.contexts[n].state() for n in divergent})
+
+
+def generate_variants(base, overrides, workers=None):
+    if not base.dag:
+        base.dag = base.generate_dag()
+    variants = {name: variant_model(base, changes, name) for name, changes in overrides.items()}
+
+    # Everything some variant doesn't diverge on is generated once, from the base model
+    shared = set()
+    for model, divergent in variants.values():
+        shared |= set(model.entity_dict) - divergent
+    datasets = base.generate_entities(shared, {})
+    shared_tables = {name: MappingProxyType(dataset) if isinstance(dataset, dict) else dataset
+                     for name, dataset in datasets.items()}
+
+    for model, divergent in variants.values():
+        names = [name for name in shared_tables if name in model.entity_dict and name not in divergent]
+        model.datasets = {name: shared_tables[name] for name in names}
+        model.block_offsets = {name: list(base.block_offsets[name]) for name in names}
+        model.iteration_offsets = {name: base.iteration_offsets[name] for name in names}  # Never changed in place
+        model.statistics = {name: copy.deepcopy(base.statistics[name]) for name in names if name in base.statistics}
+        # Contexts carry on changing (grow), so each variant gets a copy of its own
+        model.contexts = {name: model.entity_dict[name].restore_context(base.contexts[name].state()) for name in names}
+
+    keys = [(id(variants), name) for name, (model, divergent) in variants.items() if divergent]
+    _PENDING.update({key: variants[key[1]] for key in keys})
+    try:
+        if 'fork' in multiprocessing.get_all_start_methods() and len(keys) > 1 and workers != 1:
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork')) as pool:
+                results = dict(zip(keys, pool.map(functools.partial(generate_divergent, forked=True), keys)))
+        else:
+            results = {}
+            for key in keys:  # Straight into the variant models
+                generate_divergent(key)
+    finally:
+        for key in keys:
+            _PENDING.pop(key, None)
+
+    for (token, name), (own, offsets, statistics, contexts) in results.items():
+        model = variants[name][0]
+        model.datasets.update(own)
+        model.block_offsets.update({n: block_offsets for n, (block_offsets, _) in offsets.items()})
+        model.iteration_offsets.update({n: iteration_offsets for n, (_, iteration_offsets) in offsets.items()})
+        model.statistics.update({n: stats for n, stats in statistics.items() if stats is not None})
+        model.contexts.update({n: model.entity_dict[n].restore_context(state) for n, state in contexts.items()})
+    for model, divergent in variants.values():  # Tables in the order a model of their own would have
+        model.datasets = {e.name: model.datasets[e.name] for e in networkx.topological_sort(model.dag)}
+    return {name: model for name, (model, divergent) in variants.items()}
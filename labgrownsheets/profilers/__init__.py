@@ -1,7 +1,9 @@
-__all__ = ['resolve_profiler', 'NaiveProfiler', 'SamplingProfiler', 'ScdProfiler']
+__all__ = ['resolve_profiler', 'NaiveProfiler', 'SamplingProfiler', 'FittedProfiler', 'EventProfiler', 'ScdProfiler']
 
 from labgrownsheets.profilers.naive_profiler import NaiveProfiler
 from labgrownsheets.profilers.sampling_profiler import SamplingProfiler
+from labgrownsheets.profilers.fitted_profiler import FittedProfiler
+from labgrownsheets.profilers.event_profiler import EventProfiler
 from labgrownsheets.profilers.base_scd_profiler import ScdProfiler
 
 
@@ -18,7 +20,9 @@ def rootword_plus_endings(word):
 
 class_to_str = {
     NaiveProfiler: rootword_plus_endings("naive"),
-    SamplingProfiler: rootword_plus_endings("sampling") + rootword_plus_endings("sample")
+    SamplingProfiler: rootword_plus_endings("sampling") + rootword_plus_endings("sample"),
+    FittedProfiler: rootword_plus_endings("fitted") + rootword_plus_endings("fit"),
+    EventProfiler: rootword_plus_endings("event") + rootword_plus_endings("events")
 }
 
 
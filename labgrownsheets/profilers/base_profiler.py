@@ -1,6 +1,7 @@
 import inspect
 from abc import ABC, abstractmethod
 
+from labgrownsheets.profilers.context import ProfilerContext
 from labgrownsheets.relations.relation import Relation, RelationType
 from labgrownsheets.relations.schema import Schema
 
@@ -8,9 +9,10 @@ from labgrownsheets.relations.schema import Schema
 class BaseProfiler(ABC):
 
     def __init__(self, name, num_iterations, num_entities_per_iteration=None, relations=None, schema=None,
-                 kwds=None):
+                 kwds=None, fixed_size=False):
         self.name = name
         self.num_iterations = num_iterations
+        self.fixed_size = bool(fixed_size)  # Fixed size entities are not scaled by the model's scale factor
         if not num_entities_per_iteration:
             num_entities_per_iteration = 1
         self.num_entities_per_iteration = num_entities_per_iteration
@@ -21,10 +23,11 @@ class BaseProfiler(ABC):
     def base_arg_list(self):
         return {'name': self.name,
                 'num_iterations': self.num_iterations,
-                'num_entities_per_iteration': self._num_facts_per_iter,
+                'num_entities_per_iteration': self._num_facts_source,
                 'relations': self.relations,
                 'schema': self.schema,
-                'kwds': self.kwds}
+                'kwds': self.kwds,
+                'fixed_size': self.fixed_size}
 
     @classmethod
     def init_handler(cls, init_vals):
@@ -65,8 +68,41 @@ class BaseProfiler(ABC):
     def preserve_id_across_its(self):
         return False
 
+    @property
+    def supports_random_access(self):
+        # Iterations can only be generated independently if nothing carries over from one to the next
+        return not self._num_facts_is_gen
+
+    def required_columns(self):
+        # Columns of its own rows the profiler reads while generating, kept whatever the model's column selection
+        return set()
+
+    ############################################################################
+    # Per run state
+    ############################################################################
+
+    def new_context(self):
+        return ProfilerContext(self)
+
+    @property
+    def default_context(self):
+        # Only used by the context free methods (generate_entity, num_entities_per_iteration) - not thread safe
+        if getattr(self, '_default_context', None) is None:
+            self._default_context = self.new_context()
+        return self._default_context
+
     def reset(self):
-        pass
+        self._default_context = None
+
+    def restore_context(self, state):
+        """ A new context in the state given by context.state(), e.g. from a checkpoint """
+        context = self.new_context()
+        context.restore(state)
+        return context
+
+    def generate(self, context, *args, **kwargs):
+        """ Generate one entity using the per run state in context - stateless profilers can ignore it """
+        return self.generate_entity(*args, **kwargs)
 
     @property
     def relations(self):
@@ -99,18 +135,40 @@ class BaseProfiler(ABC):
         else:
             return val
 
+    @classmethod
+    def _is_gen(cls, val):
+        # Generator functions (partials of them too), or argument free callables returning a generator - those are
+        # only told apart by calling them once. A failing call isn't a generator, the error comes up when generating
+        if inspect.isgeneratorfunction(val):
+            return True
+        try:
+            if inspect.signature(val).parameters:
+                return False
+        except (TypeError, ValueError):
+            pass
+        try:
+            return inspect.isgenerator(cls._check_if_gen(val))
+        except Exception:
+            return False
+
     @staticmethod
     def _return_executable(val):
         if inspect.isgenerator(val):
             return lambda: next(val)
         return val
 
+    @classmethod
+    def executable(cls, func, is_gen):
+        # Generator functions are called once per context, so every run gets a generator of its own
+        return cls._return_executable(func()) if is_gen else func
+
     @property
     def num_entities_per_iteration(self):
-        return self._return_executable(self._num_facts_per_iter)()
+        return self.default_context.num_entities_per_iteration()
 
     @num_entities_per_iteration.setter
     def num_entities_per_iteration(self, val):
+        self._num_facts_source = val
         if not callable(val):
             if str(val).isnumeric():
                 val = int(str(val))
@@ -118,12 +176,20 @@ class BaseProfiler(ABC):
             else:
                 raise ValueError("Num entities per iteration must be either numeric or a function")
         else:
-            func = self._check_if_gen(val)
+            func = val
+        self._num_facts_is_gen = self._is_gen(func)
 
         # FIXME(): Check that generator value returns int then preserve result for next call
-        if not inspect.isgenerator(func) and not isinstance(func(), int):  # Not checking gens
+        if not self._num_facts_is_gen and not isinstance(func(), int):  # Not checking gens
             raise ValueError("Num facts per iteration must return an integer")
         self._num_facts_per_iter = func
+        self.reset()
+
+    def expected_entities_per_iteration(self, sample_size=100):
+        """ Mean number of entities per iteration, sampled from a context of its own """
+        context = self.new_context()
+        samples = [context.num_entities_per_iteration() for i in range(sample_size)]
+        return sum(samples) / len(samples)
 
     ############################################################################
     # Abstract methods
@@ -146,7 +212,8 @@ class BaseProfiler(ABC):
                 'num_entities_per_iteration': num_entities_per_iteration,
                 'relations': relations,
                 'schema': schema,
-                'kwds': d}
+                'kwds': d,
+                'fixed_size': d.get('fixed_size', False)}
 
     @classmethod
     def from_dict(cls, d):  # Optional to implement
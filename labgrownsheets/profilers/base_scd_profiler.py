@@ -4,12 +4,44 @@ from copy import deepcopy
 from numpy.random import geometric, uniform
 
 from labgrownsheets.profilers.base_profiler import BaseProfiler
+from labgrownsheets.profilers.context import ProfilerContext
 
 DEFAULT_HIGH_DATE = datetime.datetime(9999, 12, 31, 23, 59, 59, 999999)
 DEFAULT_MIN_VALID_FROM = datetime.datetime.now() - datetime.timedelta(days=365)
 DEFAULT_MAX_VALID_FROM = datetime.datetime.now()
 
 
+class ScdContext(ProfilerContext):
+
+    def __init__(self, profiler):
+        super().__init__(profiler)
+        self.inner = profiler.profiler.new_context()
+        self.num_ents = 1
+        self.position = 0  # Version of the current entity being generated
+        self.last_res = None
+        self.valid_froms = None
+
+    def num_entities_per_iteration(self, row=None):
+        # One draw at a time so the random stream doesn't depend on the number of iterations
+        self.num_ents = int(geometric(1 - self.profiler.mutation_rate))
+        self.position = 0
+        return self.num_ents
+
+    def project(self, columns):
+        super().project(columns)
+        self.inner.project(columns)
+
+    def state(self):
+        # Versions never span iterations, so between iterations only the wrapped profiler has state
+        return {'inner': self.inner.state(), 'num_ents': self.num_ents, 'position': self.position,
+                'last_res': self.last_res, 'valid_froms': self.valid_froms}
+
+    def restore(self, state):
+        self.inner.restore(state['inner'])
+        self.num_ents, self.position = state['num_ents'], state['position']
+        self.last_res, self.valid_froms = state['last_res'], state['valid_froms']
+
+
 class ScdProfiler(BaseProfiler):
 
     #############################################
@@ -18,10 +50,9 @@ class ScdProfiler(BaseProfiler):
 
     def __init__(self, profiler):
         self.profiler = profiler
-        self._num_ents = 1
 
         base_arg_list = profiler.base_arg_list()
-        base_arg_list['num_entities_per_iteration'] = self.yield_num_ents
+        base_arg_list['num_entities_per_iteration'] = 1  # Drawn per iteration by the context
         super().__init__(**base_arg_list)
 
         self.mutation_rate = float(self.kwds['mutation_rate'])
@@ -30,13 +61,18 @@ class ScdProfiler(BaseProfiler):
         self.high_date = self.kwds.get('high_date', DEFAULT_HIGH_DATE)
         self.mutating_cols = self.get_mutating_cols()
 
-        self.next_valid_from_to = self.yield_valid_froms()
-        self.next_is_new_ent = self.yield_is_new_entity()
-
     @property
     def preserve_id_across_its(self):
         return True
 
+    @property
+    def supports_random_access(self):
+        # Versions are drawn one iteration at a time, so only the wrapped profiler can carry state over
+        return self.profiler.supports_random_access
+
+    def required_columns(self):
+        return self.profiler.required_columns()
+
     def get_mutating_cols(self):
         mutating_cols = self.kwds.get('mutating_cols', [])
         mutating_cols = set(mutating_cols) | {f.name for f in self.schema.mutating_cols}
@@ -46,36 +82,32 @@ class ScdProfiler(BaseProfiler):
     # CDC Handling
     #############################################
 
-    def yield_num_ents(self):
-        for i in geometric(1 - self.mutation_rate, self.num_iterations):
-            self._num_ents = int(i)
-            yield (int(i))
-
-    def yield_valid_froms(self):
-        while True:
-            rng = sorted(uniform(self.min_valid_from.timestamp(), self.max_valid_from.timestamp(), self._num_ents))
-            for x in range(len(rng) - 1):
-                yield datetime.datetime.fromtimestamp(rng[x]), datetime.datetime.fromtimestamp(rng[x + 1])
-            yield datetime.datetime.fromtimestamp(rng[-1]), self.high_date
+    def expected_entities_per_iteration(self, sample_size=100):
+        return 1 / (1 - self.mutation_rate)  # Mean of the geometric distribution
 
-    def yield_is_new_entity(self):
-        while True:
-            for i in range(self._num_ents):
-                yield i == 0
+    def new_context(self):
+        return ScdContext(self)
 
-    def is_new_entity(self):
-        return next(self.next_is_new_ent)
+    def valid_froms(self, num_ents):
+        rng = sorted(uniform(self.min_valid_from.timestamp(), self.max_valid_from.timestamp(), num_ents))
+        froms = [datetime.datetime.fromtimestamp(x) for x in rng]
+        return list(zip(froms, froms[1:] + [self.high_date]))
 
-    def generate_entity(self, *args, **kwargs):
-        if self.is_new_entity():
-            res = self.profiler.generate_entity(*args, **kwargs)
-            self._last_res = deepcopy(res)
+    def generate(self, context, *args, **kwargs):
+        if context.position == 0:
+            res = self.profiler.generate(context.inner, *args, **kwargs)
+            context.last_res = deepcopy(res)
+            context.valid_froms = self.valid_froms(context.num_ents)
         else:
-            new_res = self.profiler.generate_entity(*args, **kwargs)
+            new_res = self.profiler.generate(context.inner, *args, **kwargs)
             res = {k: new_res[k] if k in self.mutating_cols or self.mutating_cols == "all" else v
-                   for k, v in self._last_res.items()}
+                   for k, v in context.last_res.items()}
 
-        vf, vt = next(self.next_valid_from_to)
+        vf, vt = context.valid_froms[context.position]
         res['valid_from_timestamp'] = vf
         res['valid_to_timestamp'] = vt
+        context.position = (context.position + 1) % context.num_ents
         return res
+
+    def generate_entity(self, *args, **kwargs):
+        return self.generate(self.default_context, *args, **kwargs)
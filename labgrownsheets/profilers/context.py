@@ -0,0 +1,33 @@
+class ProfilerContext:
+    """ All of the state a profiler needs for one generation run
+
+    Profilers themselves only hold configuration. Anything that changes while generating (generators, counters,
+    the last SCD version) lives on a context made by profiler.new_context(), so the same profiler can be used
+    by several runs, shards or threads at once as long as each has its own context. The context also carries
+    the run's column selection as a hint.
+    """
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.num_facts = profiler.executable(profiler._num_facts_per_iter, profiler._num_facts_is_gen)
+        self.num_facts_calls = 0
+        self.columns = None  # Columns the model keeps, None for all - profilers may skip generating the rest
+
+    def project(self, columns):
+        self.columns = columns
+
+    def num_entities_per_iteration(self, row=None):
+        # row is the iteration's row so far - its ids and denormalised parent columns
+        self.num_facts_calls += 1
+        return self.num_facts()
+
+    def state(self):
+        """ What restore needs to rebuild this context - picklable, as generators are replayed by count """
+        return {'num_facts_calls': self.num_facts_calls}
+
+    def restore(self, state):
+        # Only generators need replaying, functions don't remember earlier calls
+        if self.profiler._num_facts_is_gen:
+            for i in range(state['num_facts_calls']):
+                self.num_facts()
+        self.num_facts_calls = state['num_facts_calls']
@@ -0,0 +1,169 @@
+"""
+Time series facts from an arrival process, drawn a whole iteration at a time with numpy:
+
+    ('event', {'name': 'page_view',
+               'num_iterations': 1000,
+               'relations': [{'name': 'customer'}],
+               'start': datetime(2018, 1, 1),
+               'end': datetime(2018, 2, 1),
+               'rate': 3,
+               'rate_column': 'activity',
+               'daily': [1] * 8 + [3] * 12 + [2] * 4,
+               'weekly': [1, 1, 1, 1, 2, 3, 3]})
+
+Every iteration is a Poisson process of its own over [start, end) with on average rate events a day, shaped by
+daily (per hour of day) and weekly (per day of week, Monday first) weights, each scaled to a mean of 1. With
+rate_column the rate is multiplied by that column of the iteration's row - e.g. a parent column denormalised
+through the schema - so each parent gets a rate of its own. A row without the column is an error, a null rate
+means no events.
+
+The number of events is the iteration's number of entities, so num_entities_per_iteration can't be given. As the
+intensity is constant within each clock hour, the events' times are sorted uniforms mapped through the cumulative
+intensity, giving one sorted datetime64 batch per iteration however long the window is. entity_generator optionally
+adds columns to every event - it is called like a naive profiler's, with the row so far (including the timestamp)
+as keyword arguments.
+"""
+
+import datetime
+
+import numpy
+
+from labgrownsheets.profilers.base_profiler import BaseProfiler
+from labgrownsheets.profilers.context import ProfilerContext
+from labgrownsheets.profilers.naive_profiler import bind_call
+
+DEFAULT_TIMESTAMP_COLUMN = 'event_timestamp'
+HOUR = numpy.timedelta64(1, 'h')
+MICROS_PER_DAY = 24 * 60 * 60 * 10 ** 6
+
+
+def parse_timestamp(val):
+    if isinstance(val, str):
+        return datetime.datetime.fromisoformat(val)
+    if isinstance(val, datetime.date) and not isinstance(val, datetime.datetime):
+        return datetime.datetime(val.year, val.month, val.day)
+    return val
+
+
+def seasonality(weights, size, name):
+    if weights is None:
+        return numpy.ones(size)
+    weights = numpy.asarray(weights, dtype='float64')
+    if weights.shape != (size,) or (weights < 0).any() or not weights.sum():
+        raise ValueError("{} seasonality needs {} non negative weights, not all zero".format(name, size))
+    return weights * size / weights.sum()
+
+
+class ArrivalProcess:
+    """ Piecewise constant intensity over the clock hours of [start, end), in events per day at rate 1 """
+
+    def __init__(self, start, end, daily=None, weekly=None):
+        start, end = numpy.datetime64(parse_timestamp(start), 'us'), numpy.datetime64(parse_timestamp(end), 'us')
+        if end <= start:
+            raise ValueError("Arrival window ends at {} before it starts at {}".format(end, start))
+
+        first_hour = start.astype('datetime64[h]') + (HOUR if start.astype('datetime64[h]') < start else 0)
+        edges = numpy.concatenate([[start], numpy.arange(first_hour, end, HOUR).astype('datetime64[us]'), [end]])
+        edges = numpy.unique(edges)  # start may already be on the hour
+        self.starts = edges[:-1].astype('int64')
+        self.widths = numpy.diff(edges.astype('int64'))
+
+        hours = edges[:-1].astype('datetime64[h]').astype('int64')
+        days = edges[:-1].astype('datetime64[D]').astype('int64')
+        intensity = seasonality(daily, 24, 'Daily')[hours % 24] * seasonality(weekly, 7, 'Weekly')[(days + 3) % 7]
+        weights = intensity * self.widths / MICROS_PER_DAY  # Expected events per hour at rate 1
+        self.cumulative = numpy.cumsum(weights)
+        self.weights = weights
+        self.total = float(self.cumulative[-1])  # Expected events over the window at rate 1
+
+    def draw(self, rate):
+        """ A sorted datetime64[us] array of the arrivals of one process with the given rate """
+        n = numpy.random.poisson(rate * self.total) if rate > 0 else 0
+        positions = numpy.random.random(n) * self.total
+        positions.sort()  # Time is monotonic in position, so sorted positions are sorted times
+        hours = numpy.minimum(numpy.searchsorted(self.cumulative, positions, side='right'), len(self.weights) - 1)
+        into_hour = (positions - (self.cumulative[hours] - self.weights[hours])) / self.weights[hours]
+        offsets = into_hour * self.widths[hours]
+        times = self.starts[hours] + numpy.minimum(offsets.astype('int64'), self.widths[hours] - 1)
+        return times.astype('datetime64[us]')
+
+
+class EventContext(ProfilerContext):
+
+    def __init__(self, profiler):
+        super().__init__(profiler)
+        self.times = []
+        self.position = 0
+
+    def num_entities_per_iteration(self, row=None):
+        self.num_facts_calls += 1
+        self.times = self.profiler.arrivals(self.profiler.rate_for(row)).tolist()  # datetimes, in one go
+        self.position = 0
+        return len(self.times)
+
+    def next_timestamp(self):
+        self.position += 1
+        return self.times[self.position - 1]
+
+    def state(self):
+        return dict(super().state(), times=self.times[self.position:])
+
+    def restore(self, state):
+        super().restore(state)
+        self.times, self.position = state['times'], 0
+
+
+class EventProfiler(BaseProfiler):
+
+    def __init__(self, start, end, rate=1.0, rate_column=None, daily=None, weekly=None,
+                 timestamp_column=DEFAULT_TIMESTAMP_COLUMN, entity_generator=None, *args, **kwargs):
+        if kwargs.get('num_entities_per_iteration') is not None:
+            raise ValueError("Event profiler {} draws its number of entities per iteration from its rate - drop "
+                             "num_entities_per_iteration".format(kwargs.get('name', args[0] if args else '')))
+        self.process = ArrivalProcess(start, end, daily, weekly)
+        self.rate = float(rate)
+        self.rate_column = rate_column
+        self.timestamp_column = timestamp_column
+        self.entity_generator = entity_generator
+        self._call = None if entity_generator is None else bind_call(entity_generator)
+        super().__init__(*args, **kwargs)
+
+    @classmethod
+    def from_dict(cls, d):
+        return EventProfiler(d['start'], d['end'], d.get('rate', 1.0), d.get('rate_column'), d.get('daily'),
+                             d.get('weekly'), d.get('timestamp_column', DEFAULT_TIMESTAMP_COLUMN),
+                             d.get('entity_generator'), **cls.process_base_dict_args(d))
+
+    def required_columns(self):
+        return set() if self.rate_column is None else {self.rate_column}
+
+    def rate_for(self, row):
+        # Without the iteration's row (e.g. when planning) a rate column counts as 1
+        if self.rate_column is None or row is None:
+            return self.rate
+        if self.rate_column not in row:
+            raise KeyError("Rate column '{}' of {} isn't in its rows - denormalise it from a parent through the "
+                           "schema".format(self.rate_column, self.name))
+        value = row[self.rate_column]
+        return 0.0 if value is None else self.rate * float(value)
+
+    def arrivals(self, rate):
+        return self.process.draw(rate)
+
+    def expected_entities_per_iteration(self, sample_size=100):
+        return self.rate * self.process.total
+
+    def new_context(self):
+        return EventContext(self)
+
+    def generate(self, context, *args, **kwargs):
+        row = {self.timestamp_column: context.next_timestamp()}
+        if self._call is not None:
+            row.update(self._call(*args, **dict(kwargs, **row)))
+        return row
+
+    def generate_entity(self, *args, **kwargs):
+        context = self.default_context
+        if context.position >= len(context.times):
+            context.num_entities_per_iteration()
+        return self.generate(context, *args, **kwargs)
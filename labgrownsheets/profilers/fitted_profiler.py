@@ -0,0 +1,343 @@
+"""
+Profiles that synthesise rows from distributions fitted to a source file, rather than replaying its rows.
+
+Every column is fitted once:
+
+    int, float      a histogram of bins equal width buckets, drawn by inverting its cdf (ints are rounded)
+    date, datetime  the same, over seconds since the epoch
+    category        value frequencies, keeping the max_categories most common values (and any int column with
+                    no more distinct values than bins, so codes and flags keep their exact values)
+
+plus the rate of empty values. Only plain decimals are numbers: zero padded ints ("007") are codes and stay
+categories, as does a column with "inf" in it, and "nan" in an otherwise numeric column counts as empty. With
+correlated=True the pairwise rank correlations are kept too, and rows are drawn through a Gaussian copula so e.g.
+price and quantity move together as they did in the source.
+
+Only the fitted model is kept, so memory is O(model) rather than O(source), and any number of rows can be drawn,
+including values that never appeared in the source. Rows are drawn in vectorised batches into a per context
+buffer. The model is plain JSON - cache_path saves it and reuses it until the source file changes.
+"""
+
+import os
+import re
+import json
+import math
+import uuid
+import datetime
+from collections import Counter
+
+import numpy
+
+from labgrownsheets.profilers.base_profiler import BaseProfiler
+from labgrownsheets.profilers.context import ProfilerContext
+from labgrownsheets.profilers.sampling_profiler import ReadableType, filetype_to_rows
+
+DEFAULT_BINS = 32
+DEFAULT_MAX_CATEGORIES = 10000
+DEFAULT_BATCH_SIZE = 1024
+FIRST_BATCH_SIZE = 16  # Batches double up to batch_size, so short lived contexts don't draw rows they never use
+INT = re.compile(r'[+-]?(0|[1-9][0-9]*)')  # No zero padding - "007" is a code, not 7
+FLOAT = re.compile(r'[+-]?((0|[1-9][0-9]*)(\.[0-9]*)?|\.[0-9]+)([eE][+-]?[0-9]+)?')  # Finite only, no "inf"
+NAN = {'nan', '+nan', '-nan'}
+
+
+def normal_cdf(z):
+    """ Standard normal cdf via the Abramowitz & Stegun 7.1.26 erf approximation (error < 1.5e-7) """
+    x = numpy.abs(z) / math.sqrt(2)
+    t = 1 / (1 + 0.3275911 * x)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return 0.5 * (1 + numpy.sign(z) * (1 - poly * numpy.exp(-x * x)))
+
+
+def parse_column(values):
+    """ The kind of a column of non empty strings, plus the values as numbers for numeric kinds - None for nan """
+    missing = [v.strip().lower() in NAN for v in values]
+    if not all(missing):
+        for kind, pattern, parse in (('int', INT, int), ('float', FLOAT, float)):
+            if all(m or pattern.fullmatch(v.strip()) for v, m in zip(values, missing)):
+                return kind, [None if m else parse(v) for v, m in zip(values, missing)]
+    try:
+        parsed = [datetime.datetime.fromisoformat(v) for v in values]
+    except ValueError:
+        return 'category', values
+    kind = 'date' if all(len(v) == 10 for v in values) else 'datetime'
+    epoch = datetime.datetime(1970, 1, 1)
+    return kind, [p.timestamp() if p.tzinfo else (p - epoch).total_seconds() for p in parsed]
+
+
+class ColumnModel:
+
+    def __init__(self, name, kind, null_rate, probs, values=None, edges=None):
+        self.name = name
+        self.kind = kind
+        self.null_rate = null_rate
+        self.probs = numpy.asarray(probs, dtype='float64')
+        self.values = values  # Categories
+        self.edges = None if edges is None else numpy.asarray(edges, dtype='float64')  # Histogram buckets
+        self.cdf = numpy.concatenate([[0.0], numpy.cumsum(self.probs)])
+        self.cdf /= self.cdf[-1] or 1
+
+    @classmethod
+    def fit(cls, name, raw, bins=DEFAULT_BINS, max_categories=DEFAULT_MAX_CATEGORIES):
+        present = [v for v in raw if v != '' and v is not None]
+        null_rate = 1 - len(present) / len(raw) if raw else 0.0
+        if not present:
+            return cls(name, 'category', 1.0, [1.0], [None])
+
+        kind, values = parse_column(present)
+        if kind in ('int', 'float') and None in values:  # nan is a missing value
+            values = [v for v in values if v is not None]
+            null_rate = 1 - len(values) / len(raw)
+        ordinal = kind == 'int' and len(set(values)) <= bins
+        if ordinal:
+            kind, present = 'category', values
+        if kind == 'category':
+            common = Counter(present).most_common(max_categories)
+            if ordinal:  # Ints keep their order, so they still correlate through the copula
+                common.sort()
+            return cls(name, kind, null_rate, [c for v, c in common], [v for v, c in common])
+
+        counts, edges = numpy.histogram(numpy.asarray(values, dtype='float64'), bins=bins)
+        return cls(name, kind, null_rate, counts / counts.sum(), edges=edges)
+
+    def ranks(self, raw):
+        """ Where each source value sits in [0, 1] in this model's cdf - 0.5 for empty values """
+        u = numpy.full(len(raw), 0.5)
+        present = numpy.array([v != '' and v is not None for v in raw], dtype=bool)
+        if not present.any():
+            return u
+        values = [v for v, p in zip(raw, present) if p]
+        if self.kind == 'category':
+            index = {str(v): i for i, v in enumerate(self.values)}
+            codes = numpy.array([index.get(v, -1) for v in values])
+            mids = (self.cdf[:-1] + self.cdf[1:]) / 2
+            u[present] = numpy.where(codes >= 0, mids[codes], 1.0)  # Values cut by max_categories go last
+        else:
+            numbers = numpy.array([numpy.nan if n is None else n for n in parse_column(values)[1]], dtype='float64')
+            finite = ~numpy.isnan(numbers)
+            ranks = numpy.full(len(numbers), 0.5)
+            ranks[finite] = (numpy.argsort(numpy.argsort(numbers[finite], kind='stable')) + 0.5) / finite.sum()
+            u[present] = ranks
+        return u
+
+    def quantile(self, u):
+        """ Vectorised inverse cdf - category values are returned as an object array """
+        bucket = numpy.clip(numpy.searchsorted(self.cdf, u, side='right') - 1, 0, len(self.probs) - 1)
+        if self.kind == 'category':
+            values = numpy.empty(len(self.values), dtype=object)
+            values[:] = self.values
+            return values[bucket]
+
+        width = self.cdf[bucket + 1] - self.cdf[bucket]
+        frac = numpy.divide(u - self.cdf[bucket], width, out=numpy.full(len(u), 0.5), where=width > 0)
+        x = self.edges[bucket] + numpy.clip(frac, 0, 1) * (self.edges[bucket + 1] - self.edges[bucket])
+        if self.kind == 'int':
+            return numpy.clip(numpy.rint(x), self.edges[0], self.edges[-1]).astype('int64')
+        elif self.kind == 'date':
+            return numpy.floor(x / 86400).astype('int64').astype('datetime64[D]')
+        elif self.kind == 'datetime':
+            return numpy.rint(x).astype('int64').astype('datetime64[s]')
+        return x
+
+    def to_dict(self):
+        d = {'name': self.name, 'kind': self.kind, 'null_rate': self.null_rate, 'probs': self.probs.tolist()}
+        if self.kind == 'category':
+            d['values'] = self.values
+        else:
+            d['edges'] = self.edges.tolist()
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['name'], d['kind'], d['null_rate'], d['probs'], d.get('values'), d.get('edges'))
+
+
+class FittedModel:
+
+    def __init__(self, columns, correlation=None, source=None):
+        self.columns = columns
+        self.correlation = None if correlation is None else numpy.asarray(correlation, dtype='float64')
+        self.source = source or {}
+        self.cholesky = None if self.correlation is None else numpy.linalg.cholesky(self.correlation)
+
+    @property
+    def column_names(self):
+        return [c.name for c in self.columns]
+
+    @classmethod
+    def fit(cls, rows, bins=DEFAULT_BINS, max_categories=DEFAULT_MAX_CATEGORIES, correlated=False, source=None):
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            raise ValueError("Cannot fit a profile to an empty source")
+        names = list(first.keys())
+        raw = {name: [first.get(name)] for name in names}
+        for row in rows:
+            for name in names:
+                raw[name].append(row.get(name))
+
+        columns = [ColumnModel.fit(name, raw[name], bins, max_categories) for name in names]
+        correlation = None
+        if correlated and len(columns) > 1:
+            with numpy.errstate(invalid='ignore', divide='ignore'):  # Constant columns correlate with nothing
+                spearman = numpy.corrcoef(numpy.stack([c.ranks(raw[c.name]) for c in columns]))
+            spearman = numpy.nan_to_num(spearman, nan=0.0)
+            correlation = 2 * numpy.sin(numpy.pi * spearman / 6)  # Rank correlation -> normal correlation
+            numpy.fill_diagonal(correlation, 1.0)
+            correlation = cls.nearest_correlation(correlation)
+        return cls(columns, correlation, source)
+
+    @staticmethod
+    def nearest_correlation(corr, floor=1e-6):
+        # Clip negative eigenvalues (from rounding or mixed kinds) so the matrix has a cholesky factor
+        vals, vecs = numpy.linalg.eigh(corr)
+        corr = vecs @ numpy.diag(numpy.maximum(vals, floor)) @ vecs.T
+        d = numpy.sqrt(numpy.diag(corr))
+        return corr / numpy.outer(d, d)
+
+    def draw(self, rng, n, columns=None):
+        """ n rows as a dict of column arrays plus a dict of null masks - only for columns if given
+
+        Every column is still drawn from the random stream, so the values don't depend on the columns asked for.
+        """
+        if self.cholesky is not None:
+            u = normal_cdf(rng.standard_normal((n, len(self.columns))) @ self.cholesky.T)
+        else:
+            u = rng.random((n, len(self.columns)))
+        data, nulls = {}, {}
+        for i, col in enumerate(self.columns):
+            null = rng.random(n) < col.null_rate if col.null_rate else None
+            if columns is None or col.name in columns:
+                data[col.name] = col.quantile(u[:, i])
+                if null is not None:
+                    nulls[col.name] = null
+        return data, nulls
+
+    def to_dict(self):
+        return {'columns': [c.to_dict() for c in self.columns],
+                'correlation': None if self.correlation is None else self.correlation.tolist(),
+                'source': self.source}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls([ColumnModel.from_dict(c) for c in d['columns']], d.get('correlation'), d.get('source'))
+
+    def save(self, path):
+        tmp = "{}.{}.tmp".format(path, uuid.uuid4().hex)
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+class FittedContext(ProfilerContext):
+
+    def __init__(self, profiler):
+        super().__init__(profiler)
+        self.rng = None  # Seeded from the global state on first use, so seeded runs are reproducible
+        self.batch_size = FIRST_BATCH_SIZE
+        self.rows = iter(())
+
+    def refill(self):
+        if self.rng is None:
+            self.rng = numpy.random.default_rng(numpy.random.randint(0, 2 ** 31))
+        profiler = self.profiler
+        cols = profiler.cols if self.columns is None else profiler.cols & set(self.columns)
+        data, nulls = profiler.model.draw(self.rng, self.batch_size, cols)
+        self.batch_size = min(self.batch_size * 2, profiler.batch_size)
+
+        names = [name for name in profiler.model.column_names if name in cols]
+        columns = []
+        for name in names:
+            values = data[name].tolist()
+            if name in nulls:
+                values = [None if null else v for v, null in zip(values, nulls[name].tolist())]
+            columns.append(values)
+        self.rows = (dict(zip(names, values)) for values in zip(*columns))
+
+    def state(self):
+        rows = list(self.rows)  # Buffered rows are handed out after a restore too
+        self.rows = iter(rows)
+        return dict(super().state(), rng=self.rng, batch_size=self.batch_size, rows=rows)
+
+    def restore(self, state):
+        super().restore(state)
+        self.rng, self.batch_size = state['rng'], state['batch_size']
+        self.rows = iter(state['rows'])
+
+    def next_row(self):
+        row = next(self.rows, None)
+        if row is None:
+            self.refill()
+            row = next(self.rows)
+        return row
+
+
+class FittedProfiler(BaseProfiler):
+
+    def __init__(self, file_path=None, file_type=None, sample_cols=None, bins=DEFAULT_BINS,
+                 max_categories=DEFAULT_MAX_CATEGORIES, correlated=False, cache_path=None,
+                 batch_size=DEFAULT_BATCH_SIZE, model=None, *args, **kwargs):
+        self.file_path = file_path
+        self.file_type = ReadableType((file_type or 'CSV').upper())
+        self.batch_size = max(int(batch_size), 1)
+        super().__init__(*args, **kwargs)
+
+        if model is None:
+            model = self.fit_model(bins, max_categories, correlated, cache_path)
+        self.model = FittedModel.from_dict(model) if isinstance(model, dict) else model
+        self.cols = sample_cols or 'all'
+
+    @classmethod
+    def from_dict(cls, d):
+        return FittedProfiler(d.get('file_path'), d.get('file_type'), d.get('sample_cols'),
+                              d.get('bins', DEFAULT_BINS), d.get('max_categories', DEFAULT_MAX_CATEGORIES),
+                              d.get('correlated', False), d.get('cache_path'),
+                              d.get('batch_size', DEFAULT_BATCH_SIZE), d.get('model'),
+                              **cls.process_base_dict_args(d))
+
+    def source_signature(self):
+        stat = os.stat(self.file_path)
+        return {'path': os.path.abspath(self.file_path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def fit_model(self, bins, max_categories, correlated, cache_path=None):
+        if not self.file_path:
+            raise ValueError("Fitted profiler {} needs either a file_path or a model".format(self.name))
+        source = dict(self.source_signature(), bins=bins, max_categories=max_categories,
+                      correlated=bool(correlated))
+        if cache_path and os.path.exists(cache_path):
+            cached = FittedModel.load(cache_path)
+            if cached.source == source:
+                return cached
+        model = FittedModel.fit(filetype_to_rows[self.file_type](self.file_path), bins, max_categories,
+                                correlated, source)
+        if cache_path:
+            model.save(cache_path)
+        return model
+
+    @property
+    def cols(self):
+        return self._cols
+
+    @cols.setter
+    def cols(self, val):
+        all_cols = self.model.column_names
+        if hasattr(val, 'lower') and val.lower() == 'all':
+            self._cols = set(all_cols)
+        elif set(val).issubset(all_cols):
+            self._cols = set(val)
+        else:
+            raise ValueError("Column set {} is not a subset of column set {}".format(val, all_cols))
+
+    def new_context(self):
+        return FittedContext(self)
+
+    def generate(self, context, *args, **kwargs):
+        return context.next_row()
+
+    def generate_entity(self, *args, **kwargs):
+        return self.generate(self.default_context)
@@ -1,31 +1,119 @@
+import inspect
+from collections import deque
+from itertools import islice, chain
+
 from labgrownsheets.profilers.base_profiler import BaseProfiler
+from labgrownsheets.profilers.context import ProfilerContext
+
+DEFAULT_PREFETCH = 256
+POSITIONAL = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+NAMED = (inspect.Parameter.POSITIONAL_OR_KEYWORD, inspect.Parameter.KEYWORD_ONLY)
+
+
+def bind_call(func):
+    """ Compile the call path for func from its signature once, passing only the arguments it accepts
+
+    Positional args beyond what func takes are dropped, as are keyword args it doesn't name (unless it takes
+    **kwargs), and positional args stop at the first parameter also given by name. Errors raised inside func are
+    never swallowed.
+    """
+    try:
+        params = list(inspect.signature(func).parameters.values())
+    except (TypeError, ValueError):  # No signature available (some builtins) - pass everything through
+        return func
+
+    kinds = {p.kind for p in params}
+    if inspect.Parameter.VAR_POSITIONAL in kinds and inspect.Parameter.VAR_KEYWORD in kinds:
+        return func
+    if not params:
+        return lambda *args, **kwargs: func()
+
+    positional = [p.name for p in params if p.kind in POSITIONAL]
+    num_positional = None if inspect.Parameter.VAR_POSITIONAL in kinds else len(positional)
+    names = None if inspect.Parameter.VAR_KEYWORD in kinds else frozenset(p.name for p in params if p.kind in NAMED)
+
+    def call(*args, **kwargs):
+        args = args[:num_positional]
+        if names is not None:
+            kwargs = {k: v for k, v in kwargs.items() if k in names}
+        for i, name in enumerate(positional[:len(args)]):  # Named arguments win over positional ones
+            if name in kwargs:
+                args = args[:i]
+                break
+        return func(*args, **kwargs)
+    return call
+
+
+def takes_argument(func, name):
+    try:
+        params = inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
+    return name in params and params[name].kind in NAMED
+
+
+class NaiveContext(ProfilerContext):
+
+    def __init__(self, profiler):
+        super().__init__(profiler)
+        if profiler._gen_is_gen:
+            gen, size = profiler._gen(), profiler.prefetch
+            # Pull rows from the generator size at a time rather than resuming it for every row
+            self.rows = chain.from_iterable(iter(lambda: list(islice(gen, size)), []))
+        self.rows_taken = 0
+
+    def state(self):
+        return dict(super().state(), rows_taken=self.rows_taken)
+
+    def restore(self, state):
+        super().restore(state)
+        if self.profiler._gen_is_gen:
+            deque(islice(self.rows, state['rows_taken']), maxlen=0)
+        self.rows_taken = state['rows_taken']
 
 
 class NaiveProfiler(BaseProfiler):
 
-    def __init__(self, generator_funtion, *args, **kwargs):
+    def __init__(self, generator_funtion, *args, prefetch=DEFAULT_PREFETCH, **kwargs):
+        self.prefetch = max(int(prefetch), 1)
         self.gen = generator_funtion
-        self.use_args = True
 
         super().__init__(*args, **kwargs)
 
     @classmethod
     def from_dict(cls, d):
         gen = d['entity_generator']
-        return NaiveProfiler(gen, **cls.process_base_dict_args(d))
+        return NaiveProfiler(gen, prefetch=d.get('prefetch', DEFAULT_PREFETCH), **cls.process_base_dict_args(d))
 
     @property
     def gen(self):
-        return self._return_executable(self._gen)
+        if self._gen_is_gen:
+            return self.default_context.rows.__next__
+        return self._call
 
     @gen.setter
     def gen(self, val):
-        self._gen = self._check_if_gen(val)
+        self._gen_source = val
+        self._gen = val
+        self._gen_is_gen = self._is_gen(val)
+        self._call = None if self._gen_is_gen else bind_call(val)
+        self._wants_columns = not self._gen_is_gen and takes_argument(val, 'columns')
+        self.reset()
+
+    @property
+    def supports_random_access(self):
+        return super().supports_random_access and not self._gen_is_gen
+
+    def new_context(self):
+        return NaiveContext(self)
+
+    def generate(self, context, *args, **kwargs):
+        if self._gen_is_gen:  # Generators never take arguments
+            context.rows_taken += 1
+            return next(context.rows)
+        if self._wants_columns:  # Functions naming a columns argument get the column selection
+            kwargs['columns'] = context.columns
+        return self._call(*args, **kwargs)
 
     def generate_entity(self, *args, **kwargs):
-        if self.use_args:
-            try:
-                return self.gen(*args, **kwargs)
-            except TypeError:
-                self.use_args = False
-        return self.gen()
+        return self.generate(self.default_context, *args, **kwargs)
@@ -13,8 +13,7 @@ class ReadableType(Enum):
 class CSVReader:
     # FIXME(): Replace Sniffer with optional extract from Profiler init kwargs - maybe use mixins instead? Kinda ugly
     @staticmethod
-    def csv_to_data(file_path):
-        data = []
+    def iter_rows(file_path):
         with open(file_path, 'r') as csvfile:
             sample = csvfile.read(1024)
             has_header = csv.Sniffer().has_header(sample)
@@ -28,15 +27,21 @@ class CSVReader:
                     else:
                         headers = ['col' + str(i) for i in range(len(row))]
                 if num or (not num and not has_header):
-                    data.append(dict(zip(headers, row)))
+                    yield dict(zip(headers, row))
 
-        return data
+    @staticmethod
+    def csv_to_data(file_path):
+        return list(CSVReader.iter_rows(file_path))
 
 
 filetype_to_data = {
     ReadableType.CSV: CSVReader.csv_to_data
 }
 
+filetype_to_rows = {
+    ReadableType.CSV: CSVReader.iter_rows
+}
+
 
 class SamplingProfiler(BaseProfiler):
 
@@ -74,6 +79,10 @@ class SamplingProfiler(BaseProfiler):
         # Map between file path and source data type - should return list of dict, each dict being a row
         return filetype_to_data[self.file_type](self.file_path)
 
-    def generate_entity(self, *args, **kwargs):
+    def generate(self, context, *args, **kwargs):
         data = random.sample(self.data, 1)[0]
-        return {col: val for col, val in data.items() if col in self.cols}
+        cols = self.cols if context.columns is None else set(self.cols) & context.columns
+        return {col: val for col, val in data.items() if col in cols}
+
+    def generate_entity(self, *args, **kwargs):
+        return self.generate(self.default_context)
@@ -0,0 +1,3 @@
+__all__ = ['Provider']
+
+from labgrownsheets.providers.provider import Provider
@@ -0,0 +1,164 @@
+import inspect
+import datetime
+from functools import lru_cache
+
+import numpy
+
+from labgrownsheets.providers import vocabulary
+
+DEFAULT_BATCH_SIZE = 10000
+MAX_DIGIT_TABLE = 1000000
+GENDERS = numpy.array(['male', 'female'], dtype=object)
+
+
+@lru_cache(maxsize=32)
+def _digit_table(low, high):
+    return numpy.arange(low, high).astype(str).astype(object)
+
+
+def _vocab(words):
+    return numpy.array(words, dtype=object)
+
+
+def _to_datetime64(val, unit):
+    if isinstance(val, (datetime.datetime, datetime.date, str)):
+        return numpy.datetime64(val, unit)
+    return numpy.datetime64(val).astype('datetime64[{}]'.format(unit))
+
+
+class Provider:
+    """ Vectorised fake data - every method returns a whole column as a numpy array
+
+    Values are drawn from the vocabularies bundled in labgrownsheets.providers.vocabulary. Without a seed the
+    global numpy random state is used at draw time, so seeding the model (or numpy) seeds the provider too.
+    """
+
+    def __init__(self, seed=None):
+        self.seed = seed
+        self._rng = numpy.random.RandomState(seed) if seed is not None else None
+
+        self.male_first_names = _vocab(vocabulary.MALE_FIRST_NAMES)
+        self.female_first_names = _vocab(vocabulary.FEMALE_FIRST_NAMES)
+        self.last_names_vocab = _vocab(vocabulary.LAST_NAMES)
+        self.street_names = _vocab(vocabulary.STREET_NAMES)
+        self.street_suffixes = _vocab(vocabulary.STREET_SUFFIXES)
+        self.cities = _vocab(vocabulary.CITIES)
+        self.states = _vocab(vocabulary.STATES)
+        self.email_domains = _vocab(vocabulary.EMAIL_DOMAINS)
+        self.currency_codes = _vocab(vocabulary.CURRENCY_CODES)
+        self.words_vocab = _vocab(vocabulary.WORDS)
+
+    @property
+    def rng(self):
+        return self._rng if self._rng is not None else numpy.random
+
+    def choice(self, vocab, n):
+        return vocab[self.rng.randint(0, len(vocab), n)]
+
+    def integers(self, n, low, high):
+        return self.rng.randint(low, high, n)
+
+    def digits(self, n, low, high):
+        if high - low <= MAX_DIGIT_TABLE:  # Index into cached strings rather than formatting every number
+            return _digit_table(low, high)[self.rng.randint(0, high - low, n)]
+        return self.integers(n, low, high).astype(str).astype(object)
+
+    ##################################################################
+    # People
+    ##################################################################
+
+    def genders(self, n):
+        return self.choice(GENDERS, n)
+
+    def first_names(self, n, genders=None):
+        if genders is None:
+            genders = self.genders(n)
+        genders = numpy.asarray(genders, dtype=object)
+        return numpy.where(genders == 'male',
+                           self.choice(self.male_first_names, n),
+                           self.choice(self.female_first_names, n))
+
+    def last_names(self, n):
+        return self.choice(self.last_names_vocab, n)
+
+    def names(self, n, genders=None):
+        return self.first_names(n, genders) + ' ' + self.last_names(n)
+
+    def emails(self, n, first_names=None, last_names=None):
+        first_names = self.first_names(n) if first_names is None else numpy.asarray(first_names, dtype=object)
+        last_names = self.last_names(n) if last_names is None else numpy.asarray(last_names, dtype=object)
+        local = first_names + '.' + last_names + self.digits(n, 1, 1000)
+        return numpy.char.lower(local.astype(str)).astype(object) + '@' + self.choice(self.email_domains, n)
+
+    def addresses(self, n):
+        return (self.digits(n, 1, 10000) + ' ' + self.choice(self.street_names, n) + ' ' +
+                self.choice(self.street_suffixes, n) + ', ' + self.choice(self.cities, n) + ', ' +
+                self.choice(self.states, n) + ' ' + self.digits(n, 10000, 100000))
+
+    ##################################################################
+    # Money and time
+    ##################################################################
+
+    def currencies(self, n):
+        return self.choice(self.currency_codes, n)
+
+    def amounts(self, n, low=0.0, high=1000.0, decimals=2):
+        return numpy.round(self.rng.uniform(low, high, n), decimals)
+
+    def datetimes(self, n, start, end, unit='us'):
+        start, end = _to_datetime64(start, unit), _to_datetime64(end, unit)
+        offsets = (self.rng.random_sample(n) * (end - start).astype(numpy.int64)).astype(numpy.int64)
+        return start + offsets.astype('timedelta64[{}]'.format(unit))
+
+    def dates(self, n, start, end):
+        return self.datetimes(n, start, end, unit='D')
+
+    ##################################################################
+    # Text
+    ##################################################################
+
+    def words(self, n):
+        return self.choice(self.words_vocab, n)
+
+    def sentences(self, n, min_words=4, max_words=12):
+        lengths = self.rng.randint(min_words, max_words + 1, n)
+        out = numpy.char.capitalize(self.words(n).astype(str)).astype(object)
+        for j in range(1, max_words):
+            out = numpy.where(j < lengths, out + ' ' + self.words(n), out)
+        return out + '.'
+
+    def paragraphs(self, n, min_sentences=3, max_sentences=6):
+        lengths = self.rng.randint(min_sentences, max_sentences + 1, n)
+        out = self.sentences(n)
+        for j in range(1, max_sentences):
+            out = numpy.where(j < lengths, out + ' ' + self.sentences(n), out)
+        return out
+
+    ##################################################################
+    # Profiler integration
+    ##################################################################
+
+    def table(self, n, columns):
+        """ Build n rows as a dict of column arrays
+
+        columns maps a column name to a callable taking n, or (n, batch) where batch holds the columns built so
+        far - e.g. {'gender': p.genders, 'first_name': lambda n, b: p.first_names(n, b['gender'])}
+        """
+        batch = {}
+        for name, func in columns.items():
+            if len(inspect.signature(func).parameters) > 1:
+                batch[name] = func(n, batch)
+            else:
+                batch[name] = func(n)
+        return batch
+
+    def entity_generator(self, columns, batch_size=DEFAULT_BATCH_SIZE):
+        """ A generator function for NaiveProfiler which builds columns in batches and yields one row at a time """
+        def gen():
+            while True:
+                batch = self.table(batch_size, columns)
+                names = list(batch)
+                # tolist gives python objects (datetime, int, ...) rather than numpy scalars
+                for values in zip(*(batch[name].tolist() for name in names)):
+                    yield dict(zip(names, values))
+        return gen
@@ -0,0 +1,128 @@
+import random
+from enum import Enum
+
+import numpy
+
+
+class DistributionType(Enum):
+    UNIFORM = "uniform"
+    ZIPF = "zipf"
+    PARETO = "pareto"
+    COLUMN = "column"
+    CUSTOM = "custom"
+
+
+class AliasTable:
+    """ Vose's alias method - O(n) to build, then O(1) per draw regardless of the skew of the weights """
+
+    def __init__(self, weights):
+        weights = numpy.asarray(weights, dtype=float)
+        if weights.ndim != 1 or not len(weights):
+            raise ValueError("Alias table weights must be a non-empty 1d sequence")
+        if not numpy.isfinite(weights).all() or (weights < 0).any():
+            raise ValueError("Alias table weights must be finite and non-negative")
+        total = weights.sum()
+        if total <= 0:
+            raise ValueError("Alias table weights must not all be zero")
+
+        n = len(weights)
+        scaled = (weights * n / total).tolist()
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, w in enumerate(scaled) if w < 1]
+        large = [i for i, w in enumerate(scaled) if w >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1
+            if scaled[l] < 1:
+                small.append(l)
+            else:
+                large.append(l)
+        # Anything left over is 1 up to floating point error
+
+        self.n = n
+        # Lists rather than arrays - scalar indexing into numpy is far slower per draw
+        self.prob = prob
+        self.alias = alias
+
+    def draw(self, rng=random):
+        i = int(rng.random() * self.n)
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+    def draw_many(self, size, rng=numpy.random):
+        i = rng.randint(0, self.n, size)
+        keep = rng.random_sample(size) < numpy.asarray(self.prob)[i]
+        return numpy.where(keep, i, numpy.asarray(self.alias)[i])
+
+
+class WeightedSampler:
+    def __init__(self, ids, weights):
+        self.ids = ids
+        self.table = AliasTable(weights)
+
+    def __call__(self, rng=random):
+        return self.ids[self.table.draw(rng)]
+
+
+class UniformSampler:
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __call__(self, rng=random):
+        return rng.choice(self.ids)
+
+
+class Distribution:
+    """ How a child picks parent keys for a non-unique relation.
+
+    Parents are ranked in the order they were generated, so for zipf the first parents are the hottest.
+    A column distribution weights each parent by the (latest) value of that column, and a custom distribution
+    is a callable which takes the number of parents and returns one weight per parent.
+    """
+
+    def __init__(self, type=None, s=1.0, alpha=1.16, column=None, func=None):
+        self.type = DistributionType(type or "uniform")
+        self.s = float(s)
+        self.alpha = float(alpha)
+        self.column = column
+        self.func = func
+
+        if self.type == DistributionType.COLUMN and not column:
+            raise ValueError("A column distribution needs a column to take weights from")
+        if self.type == DistributionType.CUSTOM and not callable(func):
+            raise ValueError("A custom distribution needs a callable returning weights")
+
+    @staticmethod
+    def from_spec(spec):
+        if spec is None or isinstance(spec, Distribution):
+            return spec
+        if isinstance(spec, str):
+            return Distribution(spec)
+        if isinstance(spec, dict):
+            return Distribution(**spec)
+        if callable(spec):
+            return Distribution("custom", func=spec)
+        raise ValueError("Unable to build a distribution from {}".format(spec))
+
+    def weights(self, ids, dataset):
+        n = len(ids)
+        if self.type == DistributionType.ZIPF:
+            return 1 / numpy.arange(1, n + 1) ** self.s
+        elif self.type == DistributionType.PARETO:
+            return numpy.random.pareto(self.alpha, n) + 1
+        elif self.type == DistributionType.COLUMN:
+            return [float(dataset[uid][-1][self.column] or 0) for uid in ids]
+        elif self.type == DistributionType.CUSTOM:
+            weights = self.func(n)
+            if len(weights) != n:
+                raise ValueError("Custom distribution returned {} weights for {} parents".format(len(weights), n))
+            return weights
+        return numpy.ones(n)
+
+    def compile(self, ids, dataset):
+        """ Build a sampler for one parent dataset - done once, so every draw after is O(1) """
+        if self.type == DistributionType.UNIFORM:
+            return UniformSampler(ids)
+        return WeightedSampler(ids, self.weights(ids, dataset))
@@ -1,5 +1,7 @@
 from enum import Enum
 
+from labgrownsheets.relations.distribution import Distribution, UniformSampler
+
 
 class RelationType(Enum):
     ONE_TO_MANY = "one_to_many"
@@ -7,13 +9,24 @@ class RelationType(Enum):
 
 
 class Relation:
-    def __init__(self, name, type=None, unique=False):
+    def __init__(self, name, type=None, unique=False, distribution=None):
         self.name = name
         self.type = RelationType(type or "one_to_many")
         self.unique = bool(unique)
+        self.distribution = Distribution.from_spec(distribution)
+
+        if self.unique and self.distribution:
+            raise ValueError("Relation '{}' is unique so cannot be sampled with a distribution".format(name))
 
     @staticmethod
     def from_dict(d):
         return Relation(d['name'],
                         d.get('type'),
-                        d.get("unique"))
+                        d.get("unique"),
+                        d.get("distribution"))
+
+    def compile_sampler(self, ids, dataset):
+        """ Returns a callable which picks a parent id - uniform unless a distribution was given """
+        if not self.distribution:
+            return UniformSampler(ids)
+        return self.distribution.compile(ids, dataset)
@@ -1,9 +1,89 @@
+import datetime
+from enum import Enum
 from typing import List
 
 
+class DType(Enum):
+    """ Logical column types - declaring one lets the engine allocate typed column buffers up front """
+    INT64 = "int64"
+    FLOAT64 = "float64"
+    STRING = "string"
+    TIMESTAMP = "timestamp"
+    BOOL = "bool"
+    CATEGORICAL = "categorical"
+    OBJECT = "object"  # Anything else, e.g. lists, dicts or mixed types - kept as python objects
+
+    @staticmethod
+    def parse(val):
+        """ The DType named by val, or None if val isn't a dtype name (e.g. a converter callable) """
+        if isinstance(val, DType):
+            return val
+        if isinstance(val, str):
+            return DTYPE_ALIASES.get(val.strip().lower())
+        return None
+
+    @staticmethod
+    def from_python_type(python_type):
+        if issubclass(python_type, bool):
+            return DType.BOOL
+        elif issubclass(python_type, int):
+            return DType.INT64
+        elif issubclass(python_type, float):
+            return DType.FLOAT64
+        elif issubclass(python_type, datetime.date):
+            return DType.TIMESTAMP
+        return DType.STRING
+
+    @property
+    def numpy_dtype(self):
+        return NUMPY_DTYPES[self]
+
+    @property
+    def python_type(self):
+        return PYTHON_TYPES[self]
+
+
+DTYPE_ALIASES = {
+    'int64': DType.INT64, 'int': DType.INT64, 'integer': DType.INT64,
+    'float64': DType.FLOAT64, 'float': DType.FLOAT64, 'double': DType.FLOAT64,
+    'string': DType.STRING, 'str': DType.STRING, 'text': DType.STRING,
+    'timestamp': DType.TIMESTAMP, 'datetime': DType.TIMESTAMP,
+    'bool': DType.BOOL, 'boolean': DType.BOOL,
+    'categorical': DType.CATEGORICAL, 'category': DType.CATEGORICAL,
+    'object': DType.OBJECT
+}
+
+NUMPY_DTYPES = {
+    DType.INT64: 'int64',
+    DType.FLOAT64: 'float64',
+    DType.STRING: object,
+    DType.TIMESTAMP: 'datetime64[us]',
+    DType.BOOL: 'bool',
+    DType.CATEGORICAL: object,  # Values before dictionary encoding
+    DType.OBJECT: object
+}
+
+PYTHON_TYPES = {
+    DType.INT64: int,
+    DType.FLOAT64: float,
+    DType.STRING: str,
+    DType.TIMESTAMP: datetime.datetime,
+    DType.BOOL: bool,
+    DType.CATEGORICAL: str,
+    DType.OBJECT: object
+}
+
+
 class SchemaField:
-    def __init__(self, name, type=None, primary_key=False, parent_entity=None, mutating=False):
+    def __init__(self, name, type=None, primary_key=False, parent_entity=None, mutating=False, dtype=None):
         self.name = name
+        if dtype is None and DType.parse(type):  # A dtype name in place of a converter
+            dtype, type = type, None
+        self.dtype = DType.parse(dtype)
+        if dtype is not None and not self.dtype:
+            raise ValueError("Unknown dtype {} for field {}".format(dtype, name))
+
+        self.converter = type  # Only callables given by the user are applied per row
         if not type:
             self.type = lambda x: x
         else:
@@ -21,7 +101,8 @@ class SchemaField:
                            d.get('type'),
                            d.get('primary_key'),
                            d.get('parent_entity'),
-                           d.get('mutating'))
+                           d.get('mutating'),
+                           d.get('dtype'))
 
 
 class Schema:
@@ -35,6 +116,14 @@ class Schema:
     def from_list(l):
         return Schema([SchemaField.from_dict(field) for field in l])
 
+    @property
+    def converted_fields(self):
+        return [f for f in self.fields if f.converter]
+
+    @property
+    def dtypes(self):
+        return {f.name: f.dtype for f in self.fields if f.dtype}
+
     @property
     def primary_keys(self):
         return [f for f in self.fields if f.primary_key]
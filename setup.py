@@ -7,4 +7,5 @@ setup(name='lab-grown-sheets',
       install_requires=['networkx>=1.11', 'numpy>=1.15', 'pyyaml>=3.13'],
       setup_requires=["pytest-runner"],
       tests_require=["pytest"],
+      entry_points={'console_scripts': ['lab-grown-sheets=labgrownsheets.cli:main']},
       zip_safe=False)
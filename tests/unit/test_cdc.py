@@ -0,0 +1,56 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel
+from labgrownsheets.model.server import has_pyarrow
+
+from test_model import scale_model
+
+
+class TestCdc(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = StarSchemaModel.from_list(scale_model(), seed=1)
+        cls.model.generate_all_datasets()
+
+    def test_events(self):
+        events = list(self.model.cdc_events())
+        customers = self.model.datasets['customer']
+        assert len(events) == sum(len(rows) for rows in customers.values())
+        assert {e['entity'] for e in events} == {'customer'}
+        assert all(a['ts'] <= b['ts'] for a, b in zip(events, events[1:]))
+
+        seen = {}
+        for event in events:
+            assert event['ts'] == event['after']['valid_from_timestamp']
+            assert event['op'] == ('update' if event['id'] in seen else 'insert')
+            assert event['before'] is seen.get(event['id'])
+            seen[event['id']] = event['after']
+        assert seen == {uid: rows[-1] for uid, rows in customers.items()}
+
+        # Merging sorted run files gives the same stream
+        assert list(self.model.cdc_events(max_ids=7)) == events
+
+        with self.assertRaises(ValueError):
+            self.model.cdc_events(['order'])
+
+    def test_files(self):
+        path = tempfile.mkdtemp()
+        try:
+            count = self.model.to_cdc(path)
+            with open(os.path.join(path, 'changes.jsonl')) as f:
+                lines = [json.loads(line) for line in f]
+            assert len(lines) == count and lines[0]['op'] == 'insert' and lines[0]['before'] is None
+
+            if has_pyarrow():
+                import pyarrow.parquet
+                assert self.model.to_cdc(path, file_type='parquet') == count
+                table = pyarrow.parquet.read_table(os.path.join(path, 'changes.parquet'))
+                assert table.column('id').to_pylist() == [line['id'] for line in lines]
+                assert [json.loads(a) for a in table.column('after').to_pylist()] == [line['after'] for line in lines]
+        finally:
+            shutil.rmtree(path)
@@ -0,0 +1,95 @@
+import os
+import pickle
+import random
+import shutil
+import tempfile
+from array import array
+from unittest import TestCase
+
+import numpy
+
+from labgrownsheets.model import StarSchemaModel
+
+from test_model import scale_model
+
+
+class Crash(Exception):
+    pass
+
+
+def checkpoint_model():
+    def counter():
+        i = 0
+        while True:
+            i += 1
+            yield {'n': i, 'r': random.random()}
+
+    return scale_model() + [('naive', {'name': 'event',
+                                       'num_iterations': 200,
+                                       'entity_generator': counter,
+                                       'relations': [{'name': 'order'}]})]
+
+
+class TestCheckpoint(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def crash_and_resume(self, crash_at, **kwargs):
+        random.seed(5)
+        numpy.random.seed(5)
+        model = StarSchemaModel.from_list(checkpoint_model(), checkpoint_path=self.path, checkpoint_every=13,
+                                          **kwargs)
+        rows = []
+
+        def on_row(name, row):
+            rows.append(row)
+            if len(rows) == crash_at:
+                raise Crash()
+
+        with self.assertRaises(Crash):
+            model.generate_all_datasets(on_row=on_row)
+
+        random.seed(99)  # A new process
+        numpy.random.seed(99)
+        resumed = StarSchemaModel.from_list(checkpoint_model(), checkpoint_path=self.path, checkpoint_every=13,
+                                            **kwargs)
+        resumed.resume()
+        return resumed
+
+    def test_resume_matches_uninterrupted(self):
+        for kwargs in [{'seed': 1, 'scale_factor': 2.5}, {}]:
+            random.seed(5)
+            numpy.random.seed(5)
+            full = StarSchemaModel.from_list(checkpoint_model(), **kwargs)
+            full.generate_all_datasets()
+
+            total = sum(stats.rows for stats in full.statistics.values())
+            for crash_at in [7, 130, 300, total - 50]:  # From customer to event
+                resumed = self.crash_and_resume(crash_at, **kwargs)
+                for name, dataset in full.datasets.items():
+                    assert list(dataset.items()) == list(resumed.datasets[name].items())
+                assert resumed.statistics['order_item'].rows == full.statistics['order_item'].rows
+
+    def test_checkpoint_files(self):
+        resumed = self.crash_and_resume(130, seed=1)
+        assert os.path.exists(os.path.join(self.path, 'state.pkl'))
+        assert len(os.listdir(os.path.join(self.path, 'order'))) > 1  # Periodic chunks, not just the final one
+
+        # Each chunk holds only what was added since the one before, the state just where each entity got to
+        offsets, chunks = array('q'), sorted(os.listdir(os.path.join(self.path, 'order_item')))
+        for name in chunks:
+            with open(os.path.join(self.path, 'order_item', name), 'rb') as f:
+                chunk = pickle.load(f)
+            offsets.extend(chunk['iteration_offsets'])
+        assert len(chunks) > 1 and offsets == resumed.iteration_offsets['order_item']
+        assert chunk['statistics'].rows == resumed.statistics['order_item'].rows
+        with open(os.path.join(self.path, 'state.pkl'), 'rb') as f:
+            progress = pickle.load(f)['entities']['order_item']
+        assert progress.offsets == len(offsets) and not hasattr(progress, 'statistics')
+
+        with self.assertRaises(ValueError):  # Different settings
+            StarSchemaModel.from_list(checkpoint_model(), seed=2, checkpoint_path=self.path).resume()
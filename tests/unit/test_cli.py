@@ -0,0 +1,85 @@
+import contextlib
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from labgrownsheets import cli
+
+CONFIG = """
+seed: 1
+entities:
+  - type: naive
+    name: customer
+    num_iterations: 20
+    entity_generator: test_model.customer_gen
+  - [naive, {name: order, num_iterations: 50, entity_generator: test_model.order_gen,
+             relations: [{name: customer}]}]
+"""
+
+
+class TestCli(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.config = os.path.join(self.path, 'model.yml')
+        with open(self.config, 'w') as f:
+            f.write(CONFIG)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def run_cli(self, *args, output=None):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            assert cli.main([self.config, '--output', output or os.path.join(self.path, 'out')] + list(args)) == 0
+        return out.getvalue()
+
+    def read_csv(self, name):
+        with open(os.path.join(self.path, 'out', name)) as f:
+            return list(csv.DictReader(f))
+
+    def test_generate(self):
+        out = self.run_cli('--scale-factor', '2')
+        assert 'generate' in out and 'total' in out
+
+        orders = self.read_csv('order.csv')
+        assert len(orders) == 100 and len(self.read_csv('customer.csv')) == 40
+        assert orders[0]['order_amount'] == '0'
+
+        # Sharded over worker processes
+        self.run_cli('--workers', '2', '--shard-size', '10', '--quiet')
+        customers = {row['customer_id'] for row in self.read_csv('customer.csv')}
+        orders = self.read_csv('order.csv')
+        assert len(customers) == 20 and all(row['customer_id'] in customers for row in orders)
+
+        # Collected shards spill rather than ignoring the memory budget
+        spill_path = os.path.join(self.path, 'spill')
+        self.run_cli('--workers', '2', '--shard-size', '10', '--memory-budget', '1', '--spill-path', spill_path,
+                     '--quiet')
+        assert len(self.read_csv('order.csv')) == 50 and os.listdir(spill_path)
+
+    def test_compression_and_errors(self):
+        self.run_cli('--format', 'json', '--compression', 'gzip', '--quiet')
+        with gzip.open(os.path.join(self.path, 'out', 'order.json.gz'), 'rt') as f:
+            assert sum(len(rows) for rows in json.load(f)) == 50
+
+        # Only files the run wrote are compressed, never others next to them
+        with open(os.path.join(self.path, 'notes.csv'), 'w') as f:
+            f.write('keep,me\n')
+        self.run_cli('--compression', 'gzip', '--quiet', output=self.path)
+        assert sorted(os.listdir(self.path)) == ['customer.csv.gz', 'model.yml', 'notes.csv', 'order.csv.gz', 'out']
+
+        # Bad options fail before anything is generated
+        with self.assertRaises(ValueError):
+            self.run_cli('--compression', 'zstd', output=os.path.join(self.path, 'none'))
+        assert not os.path.exists(os.path.join(self.path, 'none'))
+
+        with open(self.config, 'w') as f:
+            f.write(CONFIG.replace('test_model.customer_gen', 'test_model.nope'))
+        with self.assertRaises(ValueError):
+            self.run_cli()
@@ -0,0 +1,181 @@
+import os
+import shutil
+import datetime
+import tempfile
+from unittest import TestCase, skipIf
+
+import numpy
+
+from labgrownsheets.model import StarSchemaModel, PostgresSchemaAdapter
+from labgrownsheets.model.columnar import ColumnarDataset
+from labgrownsheets.relations.schema import DType
+
+from test_model import scale_model
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+try:
+    import pandas
+except ImportError:
+    pandas = None
+
+try:
+    import polars
+except ImportError:
+    polars = None
+
+
+class TestColumnar(TestCase):
+
+    def test_declared_dtypes(self):
+        rows = [{'amount': '3', 'label': 'a', 'when': datetime.datetime(2018, 11, 1), 'flag': True},
+                {'amount': '4', 'label': None, 'when': None, 'flag': False},
+                {'amount': '5', 'label': 'a', 'when': datetime.datetime(2018, 11, 2), 'flag': None}]
+        model = StarSchemaModel.from_list([
+            ('naive', {'name': 'fact',
+                       'entity_generator': lambda: (row for row in rows),
+                       'num_iterations': 3,
+                       'schema': [{'name': 'amount', 'type': 'int64'},
+                                  {'name': 'label', 'dtype': 'categorical'},
+                                  {'name': 'flag', 'type': bool, 'dtype': 'bool'}]})])
+        model.generate_all_datasets()
+
+        row = next(iter(model.datasets['fact'].values()))[0]
+        assert row['amount'] == '3'  # Declared dtypes aren't cast per row, converters still are
+        assert model.entity_dict['fact'].schema.dtypes['amount'] is DType.INT64
+
+        table = model.to_columnar('fact')
+        assert len(table) == 3
+        assert table.columns['amount'].dtype == numpy.int64 and table['amount'].tolist() == [3, 4, 5]
+        assert table.columns['label'].tolist() == [0, -1, 0] and table.categories['label'].tolist() == ['a']
+        assert table['label'].tolist() == ['a', None, 'a']
+        assert table.columns['when'].dtype == numpy.dtype('datetime64[us]')
+        assert table.masks['when'].tolist() == [False, True, False]
+        assert table.columns['flag'].tolist() == [True, False, False]
+        assert list(table.to_rows())[1] == {'fact_id': list(model.datasets['fact'])[1], 'amount': 4, 'label': None,
+                                            'when': None, 'flag': False}
+
+        assert PostgresSchemaAdapter(model).convert_dtype(DType.CATEGORICAL) == 'text'
+
+        with self.assertRaises(ValueError):
+            StarSchemaModel.from_list([('naive', {'name': 'x', 'entity_generator': dict, 'num_iterations': 1,
+                                                  'schema': [{'name': 'a', 'dtype': 'decimal'}]})])
+
+    def test_casts_to_declared_dtypes(self):
+        tz = datetime.timezone(datetime.timedelta(hours=2))
+        rows = ([{'code': 7, 'big': 2 ** 70, 'at': datetime.datetime(2018, 11, 1, 2, tzinfo=tz)},
+                     {'code': '8', 'big': 1, 'at': None}])
+        model = StarSchemaModel.from_list([
+            ('naive', {'name': 'fact', 'entity_generator': lambda: (row for row in rows), 'num_iterations': 2,
+                       'schema': [{'name': 'code', 'dtype': 'string'}]})])
+        model.generate_all_datasets()
+
+        table = model.to_columnar('fact')
+        assert table['code'].tolist() == ['7', '8']
+        assert table.dtypes['big'] is DType.OBJECT and table['big'].tolist() == [2 ** 70, 1]
+        assert table.timezones == {'at': 'UTC'}
+        assert table['at'][0] == numpy.datetime64('2018-11-01T00:00')
+        assert list(table.to_rows())[0]['at'] == datetime.datetime(2018, 11, 1, tzinfo=datetime.timezone.utc)
+        if pyarrow is not None:
+            arrow = model.to_arrow('fact')
+            assert arrow.schema.field('code').type == pyarrow.string()
+            assert arrow.schema.field('at').type == pyarrow.timestamp('us', tz='UTC')
+            assert arrow.column('big').to_pylist() == [str(2 ** 70), '1']
+        if pandas is not None:
+            assert str(model.to_pandas('fact')['at'].dt.tz) == 'UTC'
+
+        bad = [{'n': 2 ** 70, 'x': 'x', 'at': datetime.datetime(2018, 11, 1)},
+               {'n': 1, 'x': 'y', 'at': datetime.datetime(2018, 11, 1, tzinfo=tz)}]
+        for schema, column in [([{'name': 'n', 'dtype': 'int64'}], 'n'), ([{'name': 'x', 'dtype': 'float'}], 'x'),
+                               ([], 'at')]:
+            model = StarSchemaModel.from_list([('naive', {'name': 'fact', 'entity_generator': lambda: (r for r in bad),
+                                                          'num_iterations': 2, 'schema': schema})])
+            model.generate_all_datasets()
+            with self.assertRaisesRegex(ValueError, 'Column {} '.format(column)):
+                model.to_columnar('fact')
+
+    def test_dictionary_encoding(self):
+        model = StarSchemaModel.from_list(scale_model(), seed=1)
+        model.generate_all_datasets()
+        expected = {name: list(dataset.items()) for name, dataset in model.datasets.items()}
+
+        table = model.to_columnar('order')
+        assert 'currency_id' in table.categories  # Low cardinality foreign key
+        assert 'order_id' not in table.categories
+        assert table.categories['currency_id'].tolist() == list(dict.fromkeys(
+            row['currency_id'] for rows in model.datasets['order'].values() for row in rows))
+
+        model.compact()
+        assert all(isinstance(ds, ColumnarDataset) for ds in model.datasets.values())
+        for name, items in expected.items():
+            assert list(model.datasets[name].items()) == items
+            uid, rows = items[-1]
+            assert model.datasets[name][uid] == rows
+
+        compact = StarSchemaModel.from_list(scale_model(), seed=1, dictionary_encode=True)
+        compact.generate_all_datasets()
+        for name, items in expected.items():
+            assert list(compact.datasets[name].items()) == items
+
+    @skipIf(pyarrow is None, "pyarrow not installed")
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        model = StarSchemaModel.from_list(scale_model(), seed=1, dictionary_encode=True)
+        model.generate_all_datasets()
+        path = tempfile.mkdtemp()
+        try:
+            model.to_parquet(path)
+            table = pyarrow.parquet.read_table(os.path.join(path, 'order.parquet'))
+            assert pyarrow.types.is_dictionary(table.schema.field('currency_id').type)
+            assert table.num_rows == model.statistics_for('order').rows
+            assert table.column('order_id').to_pylist() == list(model.datasets['order'])
+        finally:
+            shutil.rmtree(path)
+
+    @skipIf(pandas is None or pyarrow is None or polars is None, "dataframe libraries not installed")
+    def test_dataframes(self):
+        model = StarSchemaModel.from_list(scale_model(), seed=1)
+        model.generate_all_datasets()
+        model.compact()
+        table = model.to_columnar('order')
+
+        frames = model.to_pandas()
+        assert set(frames) == set(model.datasets)
+        df = frames['order']
+        assert len(df) == len(table)
+        assert isinstance(df['currency_id'].dtype, pandas.CategoricalDtype)
+        assert numpy.shares_memory(df['amount'].to_numpy(), table.columns['amount'])  # No copy
+        assert df['order_id'].tolist() == list(model.datasets['order'])
+
+        customers = model.to_pandas('customer')
+        assert customers['valid_from_timestamp'].dtype == numpy.dtype('datetime64[us]')
+
+        arrow = model.to_arrow('order_item')
+        assert arrow.schema.field('qty').type == pyarrow.int64()
+
+        pl = model.to_polars('order')
+        assert pl.height == len(table)
+        assert pl['amount'].to_list() == table.columns['amount'].tolist()
+
+    @skipIf(pyarrow is None, "pyarrow not installed")
+    def test_object_columns(self):
+        model = StarSchemaModel.from_list([
+            ('naive', {'name': 'basket', 'num_iterations': 20,
+                       'entity_generator': lambda: {'items': [1, 2], 'meta': {'k': 'v'},
+                                                    'mixed': numpy.random.choice([1, 'x', None])}})], seed=1)
+        model.generate_all_datasets()
+        table = model.to_columnar('basket')
+        assert table.dtypes['items'] is DType.OBJECT and table.dtypes['mixed'] is DType.OBJECT
+
+        arrow = model.to_arrow('basket')
+        assert arrow.column('items').to_pylist()[0] == [1, 2]
+        assert arrow.schema.field('mixed').type == pyarrow.string()  # No one type, so strings
+
+        rows = [row for rows in model.datasets['basket'].values() for row in rows]
+        model.compact()
+        assert [row for rows in model.datasets['basket'].values() for row in rows] == rows
+        assert model.validate().ok
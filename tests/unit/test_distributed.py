@@ -0,0 +1,112 @@
+import os
+import json
+import pickle
+import time
+import tempfile
+import multiprocessing
+from copy import deepcopy
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel
+from labgrownsheets.model.distributed import Coordinator, Worker, ShardManifest, MANIFEST_NAME
+
+from test_model import basic_model, TEST_SIZE
+
+NUM_WORKERS = 3
+SHARD_SIZE = 250
+
+sharded_model = deepcopy(basic_model)
+sharded_model[1][1]['relations'] = [{'name': 'customer', 'unique': True}]
+
+
+def run_worker(shared_dir):
+    Worker(StarSchemaModel.from_list(sharded_model), shared_dir, timeout=30).run()
+
+
+class TestDistributed(TestCase):
+
+    def test_manifest(self):
+        with tempfile.TemporaryDirectory() as shared_dir:
+            coordinator = Coordinator(StarSchemaModel.from_list(sharded_model), shared_dir, SHARD_SIZE, seed=1)
+            manifest = coordinator.create_manifest()
+
+            assert os.path.exists(os.path.join(shared_dir, MANIFEST_NAME))
+            assert len(manifest.shards_for('customer')) == TEST_SIZE / SHARD_SIZE
+            assert len(manifest.shards_for('order_item')) == 1
+            assert manifest.shards_for('order')[0].depends_on == ['customer']
+            assert len({s.seed for s in manifest.shards}) == len(manifest.shards)
+
+            with open(os.path.join(shared_dir, MANIFEST_NAME)) as f:
+                assert ShardManifest.from_dict(json.load(f)).to_dict() == manifest.to_dict()
+
+    def test_multi_process_generation(self):
+        with tempfile.TemporaryDirectory() as shared_dir:
+            coordinator = Coordinator(StarSchemaModel.from_list(sharded_model), shared_dir, SHARD_SIZE, seed=1)
+            coordinator.create_manifest()
+
+            ctx = multiprocessing.get_context('fork')
+            procs = [ctx.Process(target=run_worker, args=(shared_dir,)) for i in range(NUM_WORKERS)]
+            for p in procs:
+                p.start()
+            for p in procs:
+                p.join()
+            coordinator.wait(timeout=30)
+            datasets = coordinator.collect()
+
+            custs = datasets['customer']
+            assert len(custs) == TEST_SIZE
+            orders = datasets['order']
+            assert len(orders) == TEST_SIZE
+            customer_ids = [row['customer_id'] for rows in orders.values() for row in rows]
+            assert set(customer_ids) <= set(custs)
+            assert len(set(customer_ids)) == TEST_SIZE  # Unique across shards
+            assert len(datasets['order_item']) == 10
+
+    def test_stale_claims_are_taken_over(self):
+        with tempfile.TemporaryDirectory() as shared_dir:
+            coordinator = Coordinator(StarSchemaModel.from_list(sharded_model), shared_dir, SHARD_SIZE, seed=1,
+                                      lease=1)
+            first = coordinator.create_manifest().shards[0]
+
+            # A worker claimed the first shard and died without renewing its claim
+            assert coordinator.shared.claim(first, 'dead-worker')
+            assert coordinator.shared.is_claimed(first)
+            expired = time.time() - 2
+            os.utime(coordinator.shared.claim_path(first), (expired, expired))
+            assert not coordinator.shared.is_claimed(first)
+
+            Worker(StarSchemaModel.from_list(sharded_model), shared_dir, timeout=30, lease=1).run()
+            coordinator.wait(timeout=30)
+            assert coordinator.shared.claims()[first.name] == 1
+            assert len(coordinator.collect()['customer']) == TEST_SIZE
+
+    def test_collect_within_memory_budget(self):
+        with tempfile.TemporaryDirectory() as shared_dir, tempfile.TemporaryDirectory() as spill_path:
+            Coordinator(StarSchemaModel.from_list(sharded_model), shared_dir, SHARD_SIZE, seed=1).create_manifest()
+            Worker(StarSchemaModel.from_list(sharded_model), shared_dir, timeout=30).run()
+            expected = Coordinator(StarSchemaModel.from_list(sharded_model), shared_dir).collect()
+
+            model = StarSchemaModel.from_list(sharded_model, memory_budget=1, spill_path=spill_path)
+            datasets = Coordinator(model, shared_dir).collect()
+            assert model.datasets is datasets
+            assert datasets.is_spilled('customer') and datasets.is_spilled('order')  # Children all collected
+            for name, dataset in expected.items():
+                assert list(datasets[name].items()) == list(dataset.items())
+
+    def test_collect_rejects_repeated_ids(self):
+        with tempfile.TemporaryDirectory() as shared_dir:
+            coordinator = Coordinator(StarSchemaModel.from_list(sharded_model), shared_dir, SHARD_SIZE, seed=1)
+            manifest = coordinator.create_manifest()
+            Worker(StarSchemaModel.from_list(sharded_model), shared_dir, timeout=30).run()
+
+            first, second = manifest.shards_for('customer')[:2]
+            with open(coordinator.shared.part_path(first), 'rb') as f:
+                uid = next(iter(pickle.load(f)))
+            with open(coordinator.shared.part_path(second), 'rb') as f:
+                part = pickle.load(f)
+            part[uid] = []  # Two shards drew the same id
+            with open(coordinator.shared.part_path(second), 'wb') as f:
+                pickle.dump(part, f)
+
+            with self.assertRaises(ValueError):
+                coordinator.collect()
@@ -0,0 +1,78 @@
+import random
+from collections import Counter
+from copy import deepcopy
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel
+from labgrownsheets.relations.distribution import AliasTable, Distribution, DistributionType
+from labgrownsheets.relations.relation import Relation
+
+from test_model import basic_model
+
+NUM_DRAWS = 100000
+
+
+class TestAliasTable(TestCase):
+
+    def test_draws_follow_weights(self):
+        weights = [1, 2, 3, 4]
+        table = AliasTable(weights)
+        counts = Counter(table.draw() for i in range(NUM_DRAWS))
+
+        for i, w in enumerate(weights):
+            expected = w / sum(weights)
+            assert abs(counts[i] / NUM_DRAWS - expected) < 0.01
+
+        many = Counter(table.draw_many(NUM_DRAWS).tolist())
+        assert abs(many[3] / NUM_DRAWS - 0.4) < 0.01
+
+    def test_zero_weight_never_drawn(self):
+        table = AliasTable([0, 1, 0])
+        assert {table.draw() for i in range(1000)} == {1}
+
+    def test_invalid_weights(self):
+        with self.assertRaises(ValueError):
+            AliasTable([])
+        with self.assertRaises(ValueError):
+            AliasTable([0, 0])
+        with self.assertRaises(ValueError):
+            AliasTable([1, -1])
+
+
+class TestDistribution(TestCase):
+
+    def test_from_spec(self):
+        assert Distribution.from_spec(None) is None
+        assert Distribution.from_spec('zipf').type == DistributionType.ZIPF
+        assert Distribution.from_spec({'type': 'pareto', 'alpha': 2}).alpha == 2
+        assert Distribution.from_spec(lambda n: [1] * n).type == DistributionType.CUSTOM
+
+        with self.assertRaises(ValueError):
+            Distribution.from_spec({'type': 'column'})
+
+    def test_unique_relation_cannot_be_skewed(self):
+        with self.assertRaises(ValueError):
+            Relation('customer', unique=True, distribution='zipf')
+
+    def test_zipf_skews_model(self):
+        skewed = deepcopy(basic_model)
+        skewed[1][1]['relations'] = [{'name': 'customer', 'distribution': {'type': 'zipf', 's': 1.5}}]
+        model = StarSchemaModel.from_list(skewed)
+        model.generate_all_datasets()
+
+        counts = Counter(row['customer_id'] for rows in model.datasets['order'].values() for row in rows)
+        hottest = next(iter(model.datasets['customer']))
+        assert counts.most_common(1)[0][0] == hottest
+        assert len(counts) < len(model.datasets['customer']) / 2
+
+    def test_column_weights(self):
+        weighted = deepcopy(basic_model)
+        weighted[0][1]['entity_generator'] = lambda: {'weight': random.choice([0, 1])}
+        weighted[1][1]['relations'] = [{'name': 'customer', 'distribution': {'type': 'column', 'column': 'weight'}}]
+        model = StarSchemaModel.from_list(weighted)
+        model.generate_all_datasets()
+
+        customers = model.datasets['customer']
+        for rows in model.datasets['order'].values():
+            for row in rows:
+                assert customers[row['customer_id']][-1]['weight'] == 1
@@ -1,9 +1,14 @@
 import yaml
 import os
+import random
+import datetime
 from copy import deepcopy
 from unittest import TestCase
 
+import numpy
+
 from labgrownsheets.model import *
+from labgrownsheets.relations.schema import SchemaField
 
 TEST_SIZE = 1000
 
@@ -229,3 +234,194 @@ class TestAdapters(TestCase):
         }
 
         os.remove(bqa.name + ".yml")
+
+
+class TestPlanner(TestCase):
+
+    def test_plan_estimates_rows(self):
+        model = StarSchemaModel.from_list(basic_model)
+        plan = model.plan()
+
+        assert plan['customer'].rows == TEST_SIZE
+        assert plan['order'].rows == TEST_SIZE
+        assert plan['order_item'].rows == 10
+        assert plan.bytes > 0
+        assert not plan.exceeds_budget
+
+        # Planning must not consume the generators used for the real run
+        model.generate_all_datasets()
+        assert {n['order_amount'] for v in model.datasets['order'].values() for n in v} == set(range(TEST_SIZE))
+
+    def test_plan_scd_fan_out(self):
+        scd = deepcopy(basic_model)
+        scd[0] = ('naive_type2_scd', {'name': 'customer',
+                                      'num_iterations': TEST_SIZE,
+                                      'entity_generator': customer_gen,
+                                      'mutation_rate': 0.5})
+        plan = StarSchemaModel.from_list(scd).plan()
+
+        assert plan['customer'].rows == 2 * TEST_SIZE
+        assert plan['customer'].ids == TEST_SIZE
+
+    def test_plan_unique_many_to_many_fan_out(self):
+        # Each iteration draws 50 distinct orders, more than a calibration sample of orders holds
+        fan_out = deepcopy(basic_model)
+        fan_out[2][1].update(relations=[{'name': 'order', 'type': 'many_to_many', 'unique': True}],
+                             num_entities_per_iteration=50)
+        model = StarSchemaModel.from_list(fan_out)
+        plan = model.plan()
+        assert plan['order_item'].rows == 50
+
+        model.generate_all_datasets()
+        assert sum(len(rows) for rows in model.datasets['order_item'].values()) == plan['order_item'].rows
+
+    def test_plan_memory_budget(self):
+        model = StarSchemaModel.from_list(basic_model)
+        with self.assertWarns(ResourceWarning):
+            plan = model.plan(memory_budget='1KB')
+        assert plan.exceeds_budget
+        assert "EXCEEDED" in str(plan)
+
+
+class TestMemoryBudget(TestCase):
+
+    def test_spilled_tables_reload(self):
+        dd = deepcopy(basic_model)
+        dd[1][1]['schema'] = [{'name': 'name', 'parent_entity': 'customer'}]
+        model = StarSchemaModel.from_list(dd, memory_budget=1)
+        model.generate_all_datasets()
+        datasets = model.datasets
+
+        # Everything is over a one byte budget, so every table ends up on disk
+        assert all(datasets.is_spilled(name) for name in datasets)
+        assert not any(datasets.in_memory(name) for name in datasets)
+
+        custs = datasets['customer']
+        assert len(custs) == TEST_SIZE
+        assert {n['name'] for v in custs.values() for n in v} == set(range(TEST_SIZE))
+        for rows in datasets['order'].values():
+            for row in rows:
+                assert row['customer_id'] in custs
+                assert row['name'] == custs[row['customer_id']][0]['name']
+
+        new_items = model.yield_entities(order_item=5)['order_item']
+        assert len(new_items) == 50
+
+    def test_projection_keeps_needed_columns(self):
+        dd = deepcopy(basic_model)
+        dd[0][1]['entity_generator'] = lambda: {'name': 'n', 'unused': 'u'}
+        model = StarSchemaModel.from_list(dd)
+        model.dag = model.generate_dag()
+        customer = model.entity_dict['customer']
+        order = model.entity_dict['order']
+        order.schema.fields.append(SchemaField('name', parent_entity='customer'))
+
+        assert model.columns_needed_by_children(customer, [order]) == {'customer_id', 'name'}
+
+
+def scale_model():
+    low_date, high_date = datetime.datetime(2018, 1, 1), datetime.datetime(2019, 1, 1)
+    return [
+        ('naive_type2_scd', {'name': 'customer',
+                             'num_iterations': 50,
+                             'entity_generator': lambda: {'score': random.random()},
+                             'mutation_rate': 0.5,
+                             'min_valid_from': low_date,
+                             'max_valid_from': high_date,
+                             'schema': [{'name': 'score', 'mutating': True}]}),
+        ('naive', {'name': 'currency',
+                   'num_iterations': 3,
+                   'fixed_size': True,
+                   'entity_generator': lambda: {'rate': random.random()}}),
+        ('naive', {'name': 'order',
+                   'num_iterations': 100,
+                   'entity_generator': lambda: {'amount': numpy.random.random()},
+                   'relations': [{'name': 'customer', 'distribution': 'zipf'}, {'name': 'currency'}],
+                   'schema': [{'name': 'score', 'parent_entity': 'customer'}]}),
+        ('naive', {'name': 'order_item',
+                   'num_iterations': 100,
+                   'num_entities_per_iteration': lambda: random.randint(1, 3),
+                   'entity_generator': lambda: {'qty': random.randint(1, 10)},
+                   'relations': [{'name': 'order', 'unique': True}]})
+    ]
+
+
+class TestScaleFactor(TestCase):
+
+    def test_scale_factor_sizes(self):
+        model = StarSchemaModel.from_list(scale_model(), seed=1, scale_factor=3)
+        model.generate_all_datasets()
+
+        assert len(model.datasets['customer']) == 150
+        assert len(model.datasets['currency']) == 3
+        assert len(model.datasets['order']) == 300
+
+    def test_prefix_stable(self):
+        small = StarSchemaModel.from_list(scale_model(), seed=1, scale_factor=1)
+        small.generate_all_datasets()
+        big = StarSchemaModel.from_list(scale_model(), seed=1, scale_factor=4)
+        big.generate_all_datasets()
+
+        for name, dataset in small.datasets.items():
+            prefix = list(big.datasets[name].items())[:len(dataset)]
+            assert list(dataset.items()) == prefix
+
+        other_seed = StarSchemaModel.from_list(scale_model(), seed=2, scale_factor=1)
+        other_seed.generate_all_datasets()
+        assert list(other_seed.datasets['order']) != list(small.datasets['order'])
+
+    def test_grow(self):
+        full = StarSchemaModel.from_list(scale_model(), seed=1, scale_factor=3)
+        full.generate_all_datasets()
+
+        grown = StarSchemaModel.from_list(scale_model(), seed=1, scale_factor=1.5)
+        grown.generate_all_datasets()
+        grown.grow(3)
+
+        assert grown.scale_factor == 3
+        for name, dataset in full.datasets.items():
+            assert list(grown.datasets[name].items()) == list(dataset.items())
+
+
+class TestCounterBased(TestCase):
+
+    def test_random_access_matches_full_run(self):
+        model = StarSchemaModel.from_list(scale_model(), seed=1, scale_factor=2, counter_based=True)
+        model.generate_all_datasets()
+
+        for name, (start, stop) in [('customer', (30, 70)), ('order', (120, 160))]:
+            rows = model.generate_range(name, start, stop)
+            assert list(rows.items()) == list(model.datasets[name].items())[start:stop]
+
+        items = model.generate_range('order_item', 0, 200)
+        assert list(items.items()) == list(model.datasets['order_item'].items())
+
+    def test_stateful_profilers_rejected(self):
+        with self.assertRaises(ValueError):
+            StarSchemaModel.from_list(basic_model, counter_based=True)
+
+        model = StarSchemaModel.from_list(basic_model, seed=1, counter_based=True)
+        with self.assertRaises(ValueError):
+            model.generate_all_datasets()
+
+
+class TestProfilerContexts(TestCase):
+
+    def test_rerun_without_rebuilding(self):
+        model = StarSchemaModel.from_list(basic_model)
+        model.generate_all_datasets()
+        first = [row['order_amount'] for rows in model.datasets['order'].values() for row in rows]
+        model.generate_all_datasets()  # order_gen is finite, so this needs a fresh generator
+        second = [row['order_amount'] for rows in model.datasets['order'].values() for row in rows]
+        assert first == second == list(range(TEST_SIZE))
+
+    def test_threads_share_profilers(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        model = StarSchemaModel.from_list(basic_model)
+        model.generate_all_datasets()
+        with ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda i: model.yield_entities(order=TEST_SIZE)['order'], range(4)))
+
+        for res in results:
+            assert sorted(row['order_amount'] for rows in res.values() for row in rows) == list(range(TEST_SIZE))
@@ -0,0 +1,80 @@
+import os
+import csv
+import json
+import shutil
+import datetime
+import tempfile
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel, DatePartition, HashPartition
+
+from test_model import scale_model
+
+
+class TestPartitionedOutput(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.model = StarSchemaModel.from_list(scale_model(), seed=1)
+        self.model.generate_all_datasets()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def read_csv_parts(self, table):
+        rows = {}
+        for root, dirs, files in os.walk(os.path.join(self.path, table)):
+            for name in files:
+                with open(os.path.join(root, name)) as f:
+                    rows.setdefault(os.path.relpath(root, os.path.join(self.path, table)), []).extend(
+                        csv.DictReader(f))
+        return rows
+
+    def test_date_partitions(self):
+        self.model.to_csv(self.path, partition_by=DatePartition('valid_from_timestamp'), max_open_files=2)
+
+        partitions = self.read_csv_parts('customer')
+        assert sum(len(rows) for rows in partitions.values()) == sum(
+            len(rows) for rows in self.model.datasets['customer'].values())
+        for directory, rows in partitions.items():
+            assert directory.startswith('dt=')
+            assert all(row['valid_from_timestamp'].startswith(directory[3:]) for row in rows)
+
+        # Tables without the column are written as usual
+        assert os.path.exists(os.path.join(self.path, 'order.csv'))
+
+    def test_hash_partitions_json_lines(self):
+        self.model.to_json(self.path, partition_by={'order': [{'type': 'hash', 'column': 'customer_id',
+                                                                'buckets': 4}]})
+
+        seen = {}
+        root = os.path.join(self.path, 'order')
+        for bucket in sorted(os.listdir(root)):
+            assert bucket in ['bucket={}'.format(i) for i in range(4)]
+            for name in os.listdir(os.path.join(root, bucket)):
+                with open(os.path.join(root, bucket, name)) as f:
+                    for line in f:
+                        row = json.loads(line)
+                        assert seen.setdefault(row['customer_id'], bucket) == bucket  # Same key, same bucket
+        assert os.path.exists(os.path.join(self.path, 'customer.json'))
+
+        with self.assertRaises(ValueError):
+            self.model.to_json(self.path, partition_by={'order': DatePartition('missing')})
+
+    def test_partition_values(self):
+        row = {'ts': datetime.datetime(2018, 11, 3, 14, 5), 'day': '2018-11-03', 'none': None}
+        assert DatePartition('ts').value(row) == '2018-11-03'
+        assert DatePartition('ts', 'hour').value(row) == '2018-11-03-14'
+        assert DatePartition('day', 'month').value(row) == '2018-11'
+        assert DatePartition('none').value(row) == '__HIVE_DEFAULT_PARTITION__'
+        assert HashPartition('day', 16).value(row) == HashPartition('day', 16).value(dict(row))
+
+    def test_exports_skip_statistics(self):
+        def scan(name):
+            raise AssertionError("Statistics pass for " + name)
+
+        self.model.statistics_for = scan  # Neither plain nor partitioned exports need one
+        self.model.to_csv(self.path)
+        self.model.to_json(self.path, partition_by={'order': HashPartition('customer_id', 2)})
+        assert os.path.exists(os.path.join(self.path, 'order.csv'))
+        assert sorted(os.listdir(os.path.join(self.path, 'order'))) == ['bucket=0', 'bucket=1']
@@ -0,0 +1,84 @@
+import os
+import csv
+import json
+import shutil
+import asyncio
+import tempfile
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel, Pipeline, CsvSink, JsonLinesSink, SocketSink
+from labgrownsheets.model.pipeline import AsyncSink
+
+from test_model import basic_model, TEST_SIZE
+
+
+class SlowSink(AsyncSink):
+
+    def __init__(self):
+        self.blocks = []
+
+    async def write(self, entity_name, rows):
+        await asyncio.sleep(0.001)
+        self.blocks.append((entity_name, len(rows)))
+
+
+class FailingSink(AsyncSink):
+
+    async def write(self, entity_name, rows):
+        raise IOError("disk full")
+
+
+class TestPipeline(TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_file_sinks(self):
+        model = StarSchemaModel.from_list(basic_model)
+        slow = SlowSink()
+        asyncio.run(Pipeline(model, [CsvSink(self.path), JsonLinesSink(self.path), slow],
+                             block_rows=100, max_blocks=1, retain=True).run())
+
+        with open(os.path.join(self.path, 'order.csv')) as f:
+            rows = list(csv.DictReader(f))
+        assert len(rows) == TEST_SIZE
+        assert [int(r['order_amount']) for r in rows] == list(range(TEST_SIZE))
+
+        with open(os.path.join(self.path, 'order_item.jsonl')) as f:
+            items = [json.loads(line) for line in f]
+        assert len(items) == 10
+        assert all(item['order_id'] in model.datasets['order'] for item in items)
+
+        assert [name for name, _ in slow.blocks][:1] == ['customer']  # Parents first
+        assert max(n for _, n in slow.blocks) == 100
+        assert sum(n for name, n in slow.blocks if name == 'order') == TEST_SIZE
+
+    def test_socket_sink(self):
+        received = []
+
+        async def main(model):
+            done = asyncio.Event()
+
+            async def handle(reader, writer):
+                async for line in reader:
+                    received.append(json.loads(line))
+                done.set()
+
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            async with server:
+                await Pipeline(model, [SocketSink(port=port)], block_rows=50).run()
+                await asyncio.wait_for(done.wait(), 5)
+
+        model = StarSchemaModel.from_list(basic_model)
+        asyncio.run(main(model))
+        assert len([msg for msg in received if msg['entity'] == 'customer']) == TEST_SIZE
+        assert len(model.datasets) == 0  # Streamed rows aren't kept
+        assert len(received) == 2 * TEST_SIZE + 10
+
+    def test_sink_errors_stop_generation(self):
+        with self.assertRaises(IOError):
+            asyncio.run(Pipeline(StarSchemaModel.from_list(basic_model), [FailingSink()], block_rows=10).run())
@@ -1,6 +1,13 @@
 import random
+import functools
+import datetime
 from unittest import TestCase
 
+import numpy
+
+from labgrownsheets.model import StarSchemaModel
+from labgrownsheets.profilers.event_profiler import EventContext
+
 from labgrownsheets.profilers import ScdProfiler, NaiveProfiler, str_to_class
 from labgrownsheets.profilers.base_scd_profiler import DEFAULT_HIGH_DATE
 from labgrownsheets.relations.schema import Schema
@@ -94,6 +101,68 @@ class TestNaiveProfiler(TestCase):
         assert gen_ent.generate_entity() == 0
         assert gen_ent.generate_entity() == 1
 
+    def test_entity_generator__returns_generator(self):
+        def gen(start):
+            for i in range(start, 10):
+                yield (i)
+
+        for entity_generator in (lambda: gen(3), functools.partial(gen, 3)):
+            d = base_dict()
+            d['entity_generator'] = entity_generator
+            gen_ent: NaiveProfiler = str_to_class("NaiveProfiler").init_handler(d)
+            assert [gen_ent.generate_entity(), gen_ent.generate_entity()] == [3, 4]
+
+    def test_contexts_are_independent(self):
+        def gen():
+            for i in range(10):
+                yield (i)
+
+        d = base_dict()
+        d['entity_generator'] = gen
+        gen_ent: NaiveProfiler = str_to_class("NaiveProfiler").init_handler(d)
+
+        ctx1, ctx2 = gen_ent.new_context(), gen_ent.new_context()
+        assert [gen_ent.generate(ctx1) for i in range(3)] == [0, 1, 2]
+        assert [gen_ent.generate(ctx2) for i in range(2)] == [0, 1]
+        assert gen_ent.generate(ctx1) == 3
+        assert gen_ent.generate_entity() == 0  # The default context is separate too
+
+    def test_argument_binding(self):
+        d = base_dict()
+        d['entity_generator'] = lambda datasets, customer_id: {'customer': customer_id, 'n': len(datasets)}
+        ent: NaiveProfiler = str_to_class("NaiveProfiler").init_handler(d)
+        assert ent.generate_entity({'a': 1}, customer_id=3, order_id=4) == {'customer': 3, 'n': 1}
+
+        d['entity_generator'] = lambda **kwargs: kwargs
+        ent: NaiveProfiler = str_to_class("NaiveProfiler").init_handler(d)
+        assert ent.generate_entity({}, customer_id=3) == {'customer_id': 3}
+
+        def broken():
+            return None + 1
+
+        d['entity_generator'] = lambda *args: broken()
+        ent: NaiveProfiler = str_to_class("NaiveProfiler").init_handler(d)
+        with self.assertRaises(TypeError):  # Errors in user code are no longer taken as a signature mismatch
+            ent.generate_entity({}, customer_id=3)
+
+    def test_prefetch(self):
+        pulled = []
+
+        def gen():
+            for i in range(10):
+                pulled.append(i)
+                yield i
+
+        d = base_dict()
+        d['entity_generator'] = gen
+        d['prefetch'] = 4
+        ent: NaiveProfiler = str_to_class("NaiveProfiler").init_handler(d)
+        assert ent.generate_entity() == 0
+        assert len(pulled) == 4
+        assert [ent.generate_entity() for i in range(9)] == list(range(1, 10))
+        with self.assertRaises(StopIteration):
+            ent.generate_entity()
+
 
 scd_num_ents = 10000
 scd_mutate_rate = 0.9  # Mutate 90% of the time
@@ -128,12 +197,13 @@ class TestSCDType2Profiler(TestCase):
 
         from_dict: NaiveProfiler = str_to_class("NaiveProfiler").init_handler(d)
         scd_type2 = ScdProfiler(from_dict)
-        scd_type2._num_ents = 3
+        ctx = scd_type2.new_context()
+        ctx.num_ents = 3
 
         # Test default "all" behaviour mutates all columns
-        res1 = scd_type2.generate_entity()
-        res2 = scd_type2.generate_entity()
-        res3 = scd_type2.generate_entity()
+        res1 = scd_type2.generate(ctx)
+        res2 = scd_type2.generate(ctx)
+        res3 = scd_type2.generate(ctx)
 
         for k in res1:
             if k not in ['valid_from_timestamp', 'valid_to_timestamp']:
@@ -151,12 +221,84 @@ class TestSCDType2Profiler(TestCase):
 
         from_dict: NaiveProfiler = str_to_class("NaiveProfiler").init_handler(d)
         scd_type2 = ScdProfiler(from_dict)
-        scd_type2._num_ents = 3
+        ctx = scd_type2.new_context()
+        ctx.num_ents = 3
 
-        res1 = scd_type2.generate_entity()
-        res2 = scd_type2.generate_entity()
-        res3 = scd_type2.generate_entity()
+        res1 = scd_type2.generate(ctx)
+        res2 = scd_type2.generate(ctx)
+        res3 = scd_type2.generate(ctx)
 
         assert res1['col1'] == res2['col1'] and res1['col1'] == res3['col1']
         assert res1['col2'] != res2['col2'] and res1['col2'] != res3['col2'] and res2['col2'] != res3['col2']
         assert res1['col3'] != res2['col3'] and res1['col3'] != res3['col3'] and res2['col3'] != res3['col3']
+
+
+class TestEventProfiler(TestCase):
+
+    def test_model_events(self):
+        low_date, high_date = datetime.datetime(2018, 1, 1), datetime.datetime(2018, 1, 15)
+        definition = [
+            ('naive', {'name': 'customer', 'num_iterations': 20,
+                       'entity_generator': lambda: {'activity': random.choice([0, 1, 10])}}),
+            ('event', {'name': 'visit', 'num_iterations': 40, 'start': low_date, 'end': high_date,
+                       'rate': 2, 'rate_column': 'activity', 'weekly': [1, 1, 1, 1, 1, 0, 0],
+                       'entity_generator': lambda activity, event_timestamp: {'pages': activity,
+                                                                              'hour': event_timestamp.hour},
+                       'relations': [{'name': 'customer'}],
+                       'schema': [{'name': 'activity', 'parent_entity': 'customer'}]})
+        ]
+        model = StarSchemaModel.from_list(definition, seed=1)
+        sizes = []  # Events per iteration
+
+        class RecordingContext(EventContext):
+            def num_entities_per_iteration(self, row=None):
+                sizes.append(super().num_entities_per_iteration(row))
+                return sizes[-1]
+
+        visit = model.entity_dict['visit']
+        visit.new_context = lambda: RecordingContext(visit)
+        model.generate_all_datasets()
+
+        visits = [row for rows in model.datasets['visit'].values() for row in rows]
+        assert visits and all(low_date <= row['event_timestamp'] < high_date for row in visits)
+        assert all(row['event_timestamp'].weekday() < 5 and row['activity'] for row in visits)
+        assert all(row['pages'] == row['activity'] and row['hour'] == row['event_timestamp'].hour for row in visits)
+
+        # Each iteration's events come out in time order
+        assert len(sizes) == 40 and sum(sizes) == len(visits)
+        start = 0
+        for size in sizes:
+            times = [row['event_timestamp'] for row in visits[start:start + size]]
+            assert times == sorted(times)
+            start += size
+
+        # A column selection keeps the rate column, so the events are those of a full run
+        selected = StarSchemaModel.from_list(definition, seed=1, columns={'visit': ['event_timestamp']})
+        selected.generate_all_datasets()
+        assert [row['event_timestamp'] for rows in selected.datasets['visit'].values() for row in rows] == \
+            [row['event_timestamp'] for row in visits]
+
+        # A rate column missing from the rows is an error rather than no events
+        definition[1][1]['rate_column'] = 'activty'
+        with self.assertRaises(KeyError):
+            StarSchemaModel.from_list(definition, seed=1).generate_all_datasets()
+
+    def test_arrival_rate(self):
+        profiler = str_to_class('event').init_handler({
+            'name': 'tick', 'num_iterations': 1, 'start': '2018-01-01', 'end': '2018-01-11', 'rate': 500,
+            'daily': [0] * 12 + [1] * 12})
+        assert round(profiler.expected_entities_per_iteration()) == 5000
+
+        numpy.random.seed(3)
+        ctx = profiler.new_context()
+        n = ctx.num_entities_per_iteration()
+        times = [profiler.generate(ctx)['event_timestamp'] for i in range(n)]
+        assert abs(n - 5000) < 300 and times == sorted(times)
+        assert all(t.hour >= 12 for t in times)
+
+        with self.assertRaises(ValueError):
+            str_to_class('event').init_handler({'name': 'tick', 'num_iterations': 1, 'start': '2018-01-01',
+                                                'end': '2018-01-11', 'daily': [1] * 7})
+        with self.assertRaises(ValueError):  # The rate decides how many events there are
+            str_to_class('event').init_handler({'name': 'tick', 'num_iterations': 1, 'start': '2018-01-01',
+                                                'end': '2018-01-11', 'num_entities_per_iteration': 5})
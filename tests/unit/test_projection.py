@@ -0,0 +1,73 @@
+import csv
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel
+
+from test_model import scale_model
+
+
+def rows_of(model, name):
+    return [row for rows in model.datasets[name].values() for row in rows]
+
+
+class TestProjection(TestCase):
+
+    def setUp(self):
+        self.full = StarSchemaModel.from_list(scale_model(), seed=1)
+        self.full.generate_all_datasets()
+
+    def test_generated_columns(self):
+        model = StarSchemaModel.from_list(scale_model(), seed=1, columns={'order': ['amount'],
+                                                                          'customer': ['customer_id']})
+        model.generate_all_datasets()
+
+        customer = rows_of(model, 'customer')
+        assert set(customer[0]) == {'customer_id', 'valid_from_timestamp', 'valid_to_timestamp'}
+        assert set(rows_of(model, 'order')[0]) == {'order_id', 'customer_id', 'currency_id', 'amount'}
+
+        # Kept values match a full run, and unselected entities are untouched
+        for name in model.datasets:
+            for row, full_row in zip(rows_of(model, name), rows_of(self.full, name)):
+                assert row == {k: v for k, v in full_row.items() if k in row}
+        assert rows_of(model, 'order_item') == rows_of(self.full, 'order_item')
+
+        # Parents keep what selected children copy from them
+        model.generate_all_datasets(columns={'order': ['amount', 'score'], 'customer': ['customer_id']})
+        assert 'score' in rows_of(model, 'customer')[0]
+        assert [row['score'] for row in rows_of(model, 'order')] == \
+            [row['score'] for row in rows_of(self.full, 'order')]
+
+        # The argument is for that run only
+        assert model.columns == {'order': ['amount'], 'customer': ['customer_id']}
+        model.generate_all_datasets()
+        assert 'score' not in rows_of(model, 'order')[0]
+
+    def test_profiler_hint_and_export(self):
+        seen = []
+
+        def order_gen(columns=None):
+            seen.append(columns)
+            return {'amount': 1} if columns is None or 'amount' in columns else {}
+
+        definition = [(kind, dict(d, entity_generator=order_gen) if d['name'] == 'order' else d)
+                      for kind, d in scale_model()]
+        model = StarSchemaModel.from_list(definition, seed=1, columns={'order': ['order_id', 'amount']})
+        model.generate_all_datasets()
+        assert seen[0] == {'order_id', 'customer_id', 'currency_id', 'amount'}
+
+        path = tempfile.mkdtemp()
+        try:
+            model.to_csv(path)
+            with open(os.path.join(path, 'order.csv')) as f:
+                assert next(csv.reader(f)) == ['order_id', 'amount']
+            with open(os.path.join(path, 'customer.csv')) as f:
+                assert 'score' in next(csv.reader(f))
+
+            model.to_csv(path, columns={'customer': ['customer_id']})
+            with open(os.path.join(path, 'customer.csv')) as f:
+                assert next(csv.reader(f)) == ['customer_id']
+        finally:
+            shutil.rmtree(path)
@@ -0,0 +1,60 @@
+import datetime
+from unittest import TestCase
+
+import numpy
+
+from labgrownsheets.model import StarSchemaModel
+from labgrownsheets.profilers import NaiveProfiler
+from labgrownsheets.providers import Provider
+from labgrownsheets.providers import vocabulary
+
+NUM_ROWS = 10000
+low_date = datetime.datetime(2018, 11, 1)
+high_date = datetime.datetime(2018, 12, 1)
+
+
+class TestProvider(TestCase):
+
+    def test_seeded_columns_repeat(self):
+        assert (Provider(seed=1).names(NUM_ROWS) == Provider(seed=1).names(NUM_ROWS)).all()
+        assert not (Provider(seed=1).names(NUM_ROWS) == Provider(seed=2).names(NUM_ROWS)).all()
+
+        numpy.random.seed(3)
+        first = Provider().addresses(NUM_ROWS)
+        numpy.random.seed(3)
+        assert (first == Provider().addresses(NUM_ROWS)).all()
+
+    def test_columns(self):
+        p = Provider(seed=1)
+        genders = p.genders(NUM_ROWS)
+        first = p.first_names(NUM_ROWS, genders)
+        for gender, name in zip(genders, first):
+            names = vocabulary.MALE_FIRST_NAMES if gender == 'male' else vocabulary.FEMALE_FIRST_NAMES
+            assert name in names
+
+        assert set(p.currencies(NUM_ROWS)) <= set(vocabulary.CURRENCY_CODES)
+        assert all('@' in e and e == e.lower() for e in p.emails(100))
+
+        times = p.datetimes(NUM_ROWS, low_date, high_date)
+        assert times.dtype == numpy.dtype('datetime64[us]')
+        assert times.min() >= numpy.datetime64(low_date) and times.max() < numpy.datetime64(high_date)
+
+        paragraphs = p.paragraphs(100)
+        assert all(para.endswith('.') and para[0].isupper() for para in paragraphs)
+
+    def test_naive_profiler_integration(self):
+        p = Provider(seed=1)
+        gen = p.entity_generator({
+            'gender': p.genders,
+            'first_name': lambda n, batch: p.first_names(n, batch['gender']),
+            'last_name': p.last_names,
+            'signup_time': lambda n: p.datetimes(n, low_date, high_date)
+        }, batch_size=100)
+
+        model = StarSchemaModel([NaiveProfiler(gen, name='customer', num_iterations=250)])
+        model.generate_all_datasets()
+
+        rows = [row for rows in model.datasets['customer'].values() for row in rows]
+        assert len(rows) == 250
+        assert isinstance(rows[0]['first_name'], str)
+        assert isinstance(rows[0]['signup_time'], datetime.datetime)
@@ -1,10 +1,14 @@
+import csv
 import random
 import os
+import shutil
+import tempfile
 from contextlib import contextmanager
 from unittest import TestCase
 
 from labgrownsheets.model import StarSchemaModel
-from labgrownsheets.profilers import NaiveProfiler, SamplingProfiler
+from labgrownsheets.profilers import NaiveProfiler, SamplingProfiler, FittedProfiler, resolve_profiler
+from labgrownsheets.profilers.fitted_profiler import ColumnModel, parse_column
 
 
 @contextmanager
@@ -60,3 +64,76 @@ class TestSamplingProfiler(TestCase):
 
             with self.assertRaises(ValueError):
                 SamplingProfiler(name='sampler_test', num_iterations=1000, file_path=x, sample_cols=['col1', 'col3'])
+
+
+@contextmanager
+def correlated_file(num_rows=2000):
+    path = tempfile.mkdtemp()
+    rng = random.Random(1)
+    try:
+        with open(os.path.join(path, 'source.csv'), 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['price', 'quantity', 'status', 'created', 'note'])
+            for i in range(num_rows):
+                price = rng.uniform(1, 100)
+                writer.writerow(['{:.2f}'.format(price), int(price // 10) + rng.randint(0, 2),
+                                 rng.choice(['new', 'new', 'shipped']), '2020-01-{:02d}'.format(rng.randint(1, 28)),
+                                 '' if i % 4 else 'late'])
+        yield path
+    finally:
+        shutil.rmtree(path)
+
+
+class TestFittedProfiler(TestCase):
+
+    def test_fitted_columns(self):
+        with correlated_file() as path:
+            fp = resolve_profiler('fitted', {'name': 'fitted_test', 'num_iterations': 5000,
+                                             'file_path': os.path.join(path, 'source.csv')})
+            model = StarSchemaModel([fp], seed=3)
+            model.generate_all_datasets()
+            rows = [row for rows in model.datasets['fitted_test'].values() for row in rows]
+
+            assert len(rows) == 5000
+            prices = [row['price'] for row in rows]
+            assert 1 <= min(prices) and max(prices) <= 100
+            assert abs(sum(prices) / len(prices) - 50.5) < 2
+            assert len(set(prices)) > 4000  # Not limited to the source values
+            assert abs(sum(row['status'] == 'new' for row in rows) / len(rows) - 2 / 3) < 0.05
+            assert abs(sum(row['note'] is None for row in rows) / len(rows) - 0.75) < 0.05
+            assert all(1 <= row['created'].day <= 28 for row in rows)
+
+            again = StarSchemaModel([fp], seed=3)
+            again.generate_all_datasets()
+            assert [r['price'] for rs in again.datasets['fitted_test'].values() for r in rs] == prices
+
+    def test_parse_column(self):
+        assert parse_column(['007', '12']) == ('category', ['007', '12'])  # Zero padded codes keep their padding
+        assert parse_column(['0', '-4', '10']) == ('int', [0, -4, 10])
+        assert parse_column(['1.5', 'nan', '2']) == ('float', [1.5, None, 2.0])
+        assert parse_column(['1.5', 'inf']) == ('category', ['1.5', 'inf'])
+        assert parse_column(['nan', 'nan']) == ('category', ['nan', 'nan'])
+
+        column = ColumnModel.fit('x', ['1.5', 'nan', '', '2.5'])
+        assert column.kind == 'float' and column.null_rate == 0.5
+        assert ColumnModel.fit('zip', ['007', '010', '007']).values == ['007', '010']
+
+    def test_correlation_and_cache(self):
+        with correlated_file() as path:
+            cache = os.path.join(path, 'source.profile.json')
+            d = {'name': 'fitted_test', 'num_iterations': 1, 'file_path': os.path.join(path, 'source.csv'),
+                 'correlated': True, 'cache_path': cache, 'sample_cols': ['price', 'quantity']}
+            fp = FittedProfiler.from_dict(d)
+            assert os.path.exists(cache)
+            assert fp.model.correlation[0, 1] > 0.8
+
+            ctx = fp.new_context()
+            rows = [fp.generate(ctx) for i in range(2000)]
+            assert set(rows[0]) == {'price', 'quantity'}
+            low = [r['quantity'] for r in rows if r['price'] < 30]
+            high = [r['quantity'] for r in rows if r['price'] > 70]
+            assert sum(low) / len(low) + 4 < sum(high) / len(high)
+
+            os.remove(d['file_path'])  # Only the cached model is needed now
+            assert FittedProfiler.from_dict(dict(d, file_path=None, model=fp.model.to_dict())).model.correlation[0, 1] \
+                == fp.model.correlation[0, 1]
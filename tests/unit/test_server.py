@@ -0,0 +1,88 @@
+import os
+import shutil
+import socket
+import tempfile
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel, ModelServer, ModelClient
+from labgrownsheets.model.server import ServerError, has_pyarrow
+
+from test_model import scale_model
+
+
+class TestServer(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = StarSchemaModel.from_list(scale_model(), seed=1)
+        cls.server = ModelServer({'shop': cls.model}).start()
+        cls.client = ModelClient(port=cls.server.port, format='json')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.close()
+        cls.server.shutdown()
+
+    def test_tables(self):
+        assert self.client.models()['shop']['order'] == 100
+
+        rows = self.client.table('shop', 'order', start=10, stop=20, columns=['order_id', 'customer_id'])
+        expected = list(self.model.to_columnar('order').to_rows(10, 20))
+        assert rows == [{'order_id': r['order_id'], 'customer_id': r['customer_id']} for r in expected]
+
+        with self.assertRaises(ServerError) as e:
+            self.client.table('shop', 'nope')
+        assert e.exception.status == 404
+
+        self.server.describe = lambda: 1 / 0
+        try:
+            with self.assertRaises(ServerError) as e:
+                self.client.models()
+            assert e.exception.status == 500 and 'ZeroDivisionError' in str(e.exception)
+        finally:
+            del self.server.describe
+        assert self.client.models()['shop']['order'] == 100
+
+    def test_subsets_and_batches(self):
+        customers = self.client.subset('shop', 'customer', 'customer', fraction=0.1, seed=2)
+        orders = self.client.subset('shop', 'customer', 'order', fraction=0.1, seed=2)
+        ids = {row['customer_id'] for row in customers}
+        assert len(ids) == 5 and all(row['customer_id'] in ids for row in orders)
+
+        batch = self.client.batch('shop', 'order', iterations=7)
+        assert len(batch) == 7
+        assert all(row['customer_id'] in self.model.datasets['customer'] for row in batch)
+        assert len(self.model.datasets['order']) == 100  # Served data is left alone
+
+    def test_arrow_over_unix_socket(self):
+        if not has_pyarrow():
+            self.skipTest("pyarrow not installed")
+        path = tempfile.mkdtemp()
+        try:
+            unix_path = os.path.join(path, 'shop.sock')
+            with ModelServer({'shop': self.model}, unix_path=unix_path):
+                client = ModelClient(unix_path=unix_path)
+                table = client.table('shop', 'order_item', stop=50)
+                assert table.num_rows == 50
+                assert table.to_pylist() == list(self.model.to_columnar('order_item').to_rows(0, 50))
+
+                with self.assertRaises(OSError):  # A live server's socket is never taken over
+                    ModelServer({'shop': self.model}, unix_path=unix_path).bind()
+                assert client.table('shop', 'order_item', stop=1).num_rows == 1
+                client.close()
+            assert not os.path.exists(unix_path)
+
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)  # Bound by a server that has gone away
+            stale.bind(unix_path)
+            stale.close()
+            with ModelServer({'shop': self.model}, unix_path=unix_path):
+                assert ModelClient(unix_path=unix_path).models()['shop']
+
+            # Only a stale socket is replaced, never a file someone left at the path
+            with open(unix_path, 'w') as f:
+                f.write('keep')
+            with self.assertRaises(FileExistsError):
+                ModelServer({'shop': self.model}, unix_path=unix_path).bind()
+            assert os.path.isfile(unix_path)
+        finally:
+            shutil.rmtree(path)
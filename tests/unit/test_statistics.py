@@ -0,0 +1,88 @@
+import os
+import pickle
+import shutil
+import tempfile
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel, PostgresSchemaAdapter
+from labgrownsheets.model.statistics import HyperLogLog, TableStatistics
+
+from test_model import basic_model, TEST_SIZE
+
+
+class TestStatistics(TestCase):
+
+    def test_hyperloglog(self):
+        for n in [10, 1000, 100000]:
+            hll = HyperLogLog()
+            for i in range(n):
+                hll.add("value-{}".format(i))
+                hll.add(i)
+            assert abs(hll.count() - 2 * n) / (2 * n) < 0.05
+
+        a, b = HyperLogLog(), HyperLogLog()
+        for i in range(5000):
+            a.add(i)
+            b.add(i + 2500)
+        a.merge(b)
+        assert abs(a.count() - 7500) / 7500 < 0.05
+
+    def test_column_types(self):
+        stats = TableStatistics()
+        stats.update({'amount': None, 'name': 'a', 'flag': True})
+        stats.update({'amount': 1, 'name': 'abc', 'flag': False})
+        stats.update({'amount': 2.5, 'name': None})
+
+        assert stats.types == {'amount': float, 'name': str, 'flag': bool}
+        assert stats['amount'].nulls == 1 and stats['flag'].nulls == 1
+        assert (stats['amount'].min, stats['amount'].max) == (1, 2.5)
+        assert stats['name'].max_length == 3
+
+        other = TableStatistics()
+        other.update({'amount': 7, 'extra': 'x'})
+        stats.merge(other)
+        assert stats.rows == 4
+        assert stats['amount'].max == 7
+        assert stats['extra'].nulls == 3 and stats['flag'].nulls == 2
+
+    def test_distinct_counts(self):
+        few, many, halves = TableStatistics(), TableStatistics(), [TableStatistics(), TableStatistics()]
+        for i in range(20000):
+            few.update({'code': 'c{}'.format(i % 100), 'tags': [i % 3]})
+            many.update({'id': 'id-{}'.format(i), 'n': i})
+            halves[i % 2].update({'id': 'id-{}'.format(i // 2)})
+        assert few['code'].approx_distinct == 100 and few['tags'].approx_distinct == 3  # Still exact
+        assert abs(many['id'].approx_distinct - 20000) / 20000 < 0.15  # Sampled once past EXACT_DISTINCT
+        assert abs(many['n'].approx_distinct - 20000) / 20000 < 0.15
+
+        halves[0].merge(halves[1])  # Same values on both sides count once
+        assert abs(halves[0]['id'].approx_distinct - 10000) / 10000 < 0.15
+        small = TableStatistics()
+        small.update({'id': 'id-1'})
+        small.merge(few)
+        assert small['id'].approx_distinct == 1 and small['code'].approx_distinct == 100
+
+    def test_model_statistics(self):
+        model = StarSchemaModel.from_list(basic_model)
+        model.generate_all_datasets()
+
+        order = model.statistics['order']
+        assert order.rows == TEST_SIZE
+        assert (order['order_amount'].min, order['order_amount'].max) == (0, TEST_SIZE - 1)
+        assert abs(order['order_id'].approx_distinct - TEST_SIZE) / TEST_SIZE < 0.05
+        assert PostgresSchemaAdapter(model).convert_pytype(order['order_amount'].python_type) == 'int'
+
+        path = tempfile.mkdtemp()
+        try:
+            model.to_pickled_pyschema(path)
+            with open(os.path.join(path, 'order.schema'), 'rb') as f:
+                assert pickle.load(f) == {'order_id': str, 'customer_id': str, 'order_amount': int}
+        finally:
+            shutil.rmtree(path)
+
+        # Turned off, they're built by one scan when first asked for, to the same result
+        lazy = StarSchemaModel.from_list(basic_model, collect_statistics=False)
+        lazy.generate_all_datasets()
+        assert lazy.statistics == {}
+        assert lazy.statistics_for('order').rows == TEST_SIZE
+        assert lazy.statistics_for('order')['order_amount'].max == order['order_amount'].max
@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel
+
+from test_model import scale_model
+
+
+def subset_model():
+    return scale_model() + [
+        ('naive', {'name': 'conversion',
+                   'num_iterations': 3,
+                   'fixed_size': True,
+                   'num_entities_per_iteration': 5,
+                   'entity_generator': lambda: {'rate': 1.0},
+                   'relations': [{'name': 'currency', 'unique': True}]}),
+        ('naive', {'name': 'unrelated',
+                   'num_iterations': 20,
+                   'entity_generator': lambda: {'val': 1}})
+    ]
+
+
+class TestSubset(TestCase):
+
+    def setUp(self):
+        self.model = StarSchemaModel.from_list(subset_model(), seed=1)
+        self.model.generate_all_datasets()
+
+    def assert_closed(self, model):
+        for entity in model.entity_dict.values():
+            for rel in entity.relations:
+                parent_id = model.entity_dict[rel.name].id
+                for rows in model.datasets[entity.name].values():
+                    for row in rows:
+                        assert row[parent_id] in model.datasets[rel.name]
+
+    def test_fraction(self):
+        small = self.model.subset('customer', fraction=0.1)
+        customers = small.datasets['customer']
+        assert len(customers) == 5
+        self.assert_closed(small)
+
+        # Every order of a kept customer is kept, with all of its items
+        orders = {uid for uid, rows in self.model.datasets['order'].items() if rows[0]['customer_id'] in customers}
+        assert set(small.datasets['order']) == orders
+        items = {uid for uid, rows in self.model.datasets['order_item'].items() if rows[0]['order_id'] in orders}
+        assert set(small.datasets['order_item']) == items
+
+        # Currencies only as far as they are used, their conversions follow them
+        used = {rows[0]['currency_id'] for rows in small.datasets['order'].values()}
+        assert set(small.datasets['currency']) == used
+        assert {rows[0]['currency_id'] for rows in small.datasets['conversion'].values()} == used
+        assert small.datasets['unrelated'] == self.model.datasets['unrelated']
+
+        assert set(small.datasets['customer']) == set(self.model.subset('customer', fraction=0.1).datasets['customer'])
+
+    def test_keys(self):
+        order_id = next(iter(self.model.datasets['order']))
+        small = self.model.subset('order', keys=[order_id])
+        assert list(small.datasets['order']) == [order_id]
+        assert len(small.datasets['customer']) == 1
+        assert all(rows[0]['order_id'] == order_id for rows in small.datasets['order_item'].values())
+        self.assert_closed(small)
+
+        with self.assertRaises(ValueError):
+            self.model.subset('order')
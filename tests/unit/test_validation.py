@@ -0,0 +1,53 @@
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel
+
+from test_model import scale_model
+
+
+class TestValidation(TestCase):
+
+    def test_generated_data_is_valid(self):
+        model = StarSchemaModel.from_list(scale_model(), seed=1)
+        model.generate_all_datasets()
+        report = model.validate()
+        assert report.ok and report.checks > 0
+
+        model.compact()
+        assert model.validate().ok
+
+    def test_violations(self):
+        model = StarSchemaModel.from_list(scale_model(), seed=1)
+        model.generate_all_datasets()
+        ds = model.datasets
+
+        next(iter(ds['order'].values()))[0]['customer_id'] = 'missing'
+        items = list(ds['order_item'].values())
+        items[-1][0]['order_id'] = items[0][0]['order_id']
+        for rows in ds['customer'].values():
+            if len(rows) > 1:
+                rows[1]['valid_from_timestamp'] = rows[0]['valid_from_timestamp']
+                break
+        model.statistics = {}
+
+        report = model.validate()
+        assert not report
+        assert report.counts == {
+            ('foreign_key', 'order', 'customer_id'): 1,
+            ('unique_relation', 'order_item', 'order_id'): 1,
+            ('primary_key', 'customer', 'customer_id'): 1,
+            ('scd_range', 'customer', 'valid_to_timestamp'): 1
+        }
+        assert 'foreign_key' in str(report)
+
+    def test_unique_parent_of_adjacent_iterations(self):
+        model = StarSchemaModel.from_list(scale_model(), seed=1)
+        model.generate_all_datasets()
+        items = model.datasets['order_item']
+        ids, offsets = list(items), model.iteration_offsets['order_item']
+        second = items[ids[offsets[1]]][0]['order_id']
+        for uid in ids[offsets[0]:offsets[1]]:  # The first iteration takes the order of the second
+            items[uid][0]['order_id'] = second
+
+        report = model.validate()
+        assert report.counts == {('unique_relation', 'order_item', 'order_id'): 1}
@@ -0,0 +1,71 @@
+from unittest import TestCase
+
+from labgrownsheets.model import StarSchemaModel
+from labgrownsheets.profilers import NaiveProfiler
+
+from test_model import scale_model
+
+
+def overridden(name, changes):
+    return [(kind, dict(d, **changes)) if d['name'] == name else (kind, d) for kind, d in scale_model()]
+
+
+class TestVariants(TestCase):
+
+    def test_variants_match_standalone_models(self):
+        base = StarSchemaModel.from_list(scale_model(), seed=1)
+        variants = base.variants({'churny': {'customer': {'mutation_rate': 0.9}},
+                                  'big': {'order_item': {'num_iterations': 60}},
+                                  'same': {}})
+
+        for name, (entity, changes) in [('churny', ('customer', {'mutation_rate': 0.9})),
+                                        ('big', ('order_item', {'num_iterations': 60})),
+                                        ('same', ('customer', {}))]:
+            alone = StarSchemaModel.from_list(overridden(entity, changes), seed=1)
+            alone.generate_all_datasets()
+            model = variants[name]
+            assert list(model.datasets) == list(alone.datasets)
+            for entity_name, dataset in alone.datasets.items():
+                assert list(model.datasets[entity_name].items()) == list(dataset.items())
+            assert model.statistics['order_item'].rows == alone.statistics['order_item'].rows
+
+        # Unchanged tables are shared, and writes to them stay in the variant
+        assert variants['churny'].datasets['currency'] is variants['big'].datasets['currency']
+        assert variants['big'].datasets['customer'] is variants['same'].datasets['customer']
+        shared = variants['same'].datasets['customer']
+        variants['big'].compact(['customer'])
+        assert variants['big'].datasets['customer'] is not shared
+        assert variants['same'].datasets['customer'] is shared
+        with self.assertRaises(TypeError):
+            shared['new'] = []
+
+        # Profiler contexts aren't shared - each variant carries on from a copy of the base's
+        contexts = [model.contexts['customer'] for model in variants.values()] + [base.contexts['customer']]
+        assert len(set(map(id, contexts))) == len(contexts)
+        assert variants['big'].contexts['customer'].state() == variants['same'].contexts['customer'].state()
+
+    def test_profiler_override(self):
+        base = StarSchemaModel.from_list(scale_model(), seed=1)
+        currency = NaiveProfiler(lambda: {'rate': 1.0}, name='currency', num_iterations=2, fixed_size=True)
+        variants = base.variants({'fixed': {'currency': currency}}, workers=1)
+        model = variants['fixed']
+        assert len(model.datasets['currency']) == 2
+        assert all(row['currency_id'] in model.datasets['currency']
+                   for rows in model.datasets['order'].values() for row in rows)
+
+        with self.assertRaises(ValueError):
+            base.variants({'bad': {'customer': currency}})
+
+    def test_variant_settings(self):
+        base = StarSchemaModel.from_list(scale_model(), memory_budget='64MB', spill_path='/tmp/spill',
+                                         checkpoint_path='/tmp/checkpoint', checkpoint_every=7)
+        variants = base.variants({name: {'order': {'num_iterations': 200}} for name in 'abcd'}, workers=4)
+        for name, variant in variants.items():
+            assert variant.memory_budget == base.memory_budget and variant.checkpoint_every == 7
+            assert variant.spill_path == '/tmp/spill-' + name and variant.checkpoint_path == '/tmp/checkpoint-' + name
+
+        # Unseeded variants generated in forked workers don't repeat each other's numpy draws
+        amounts = [tuple(rows[0]['amount'] for rows in variant.datasets['order'].values())
+                   for variant in variants.values()]
+        assert len(set(amounts)) == len(amounts)
+        assert variants['a'].datasets['customer'] is variants['b'].datasets['customer']